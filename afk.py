@@ -0,0 +1,71 @@
+"""
+In-memory AFK registry.
+Very few users are ever AFK, so messages are checked against memory instead of the database.
+"""
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from storage import StorageBackend
+
+# Seconds between AFK notices for the same user in the same channel
+NOTICE_COOLDOWN = 30
+
+
+class AFKRegistry:
+    """AFK users per guild, kept in sync by /afk and remove_afk."""
+
+    def __init__(self, db: StorageBackend, notice_cooldown: float = NOTICE_COOLDOWN):
+        self.db = db
+        self.notice_cooldown = notice_cooldown
+        self.users: Dict[int, Dict[int, Dict]] = {}  # {guild_id: {user_id: row}}
+        self.last_notice: Dict[Tuple[int, int], float] = {}  # {(channel_id, user_id): monotonic time}
+
+    async def load(self):
+        """Load every AFK user from the database."""
+        rows = await self.db.get_all_afk_rows()
+        self.users = {}
+        for row in rows:
+            self.users.setdefault(row['guild_id'], {})[row['user_id']] = row
+        print(f"Loaded {len(rows)} AFK user(s)")
+
+    def get(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        """Get a user's AFK row, or None if they are not AFK."""
+        guild_users = self.users.get(guild_id)
+        if not guild_users:
+            return None
+        return guild_users.get(user_id)
+
+    async def set(self, guild_id: int, user_id: int, message: str):
+        """Mark a user as AFK."""
+        await self.db.set_afk(guild_id, user_id, message)
+        self.users.setdefault(guild_id, {})[user_id] = {
+            'guild_id': guild_id, 'user_id': user_id,
+            'afk_message': message, 'afk_since': datetime.utcnow().isoformat(),
+        }
+
+    async def remove(self, guild_id: int, user_id: int):
+        """Clear a user's AFK status."""
+        guild_users = self.users.get(guild_id)
+        if guild_users:
+            guild_users.pop(user_id, None)
+            if not guild_users:
+                del self.users[guild_id]
+        await self.db.remove_afk(guild_id, user_id)
+
+    def should_notify(self, channel_id: int, user_id: int) -> bool:
+        """Rate-limit AFK notices per (channel, AFK user)."""
+        now = time.monotonic()
+        key = (channel_id, user_id)
+        last = self.last_notice.get(key)
+        if last is not None and now - last < self.notice_cooldown:
+            return False
+        self.last_notice[key] = now
+        if len(self.last_notice) > 10000:
+            self._prune(now)
+        return True
+
+    def _prune(self, now: float):
+        expired = [key for key, last in self.last_notice.items() if now - last >= self.notice_cooldown]
+        for key in expired:
+            del self.last_notice[key]
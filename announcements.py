@@ -0,0 +1,202 @@
+"""
+Scheduled announcement runner.
+Sleeps until the earliest next_run, sends due announcements concurrently per channel and
+advances every schedule in one transaction. Supports fixed intervals and cron expressions.
+With a LeaseManager, each announcement is sent only by the process holding its lease.
+"""
+import asyncio
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cluster import LeaseManager
+from storage import StorageBackend
+
+# Longest the scheduler sleeps before re-checking the database
+MAX_SLEEP_SECONDS = 300
+
+# How soon to re-check when due announcements belong to another process
+SKIPPED_RETRY_SECONDS = 10
+
+# Cron fields: (name, minimum, maximum)
+CRON_FIELDS = [
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7),  # 0 and 7 are both Sunday
+]
+
+
+class CronSchedule:
+    """A standard 5-field cron expression: minute hour day month weekday."""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError("Cron expression needs 5 fields: minute hour day month weekday")
+        fields = []
+        for part, (name, low, high) in zip(parts, CRON_FIELDS):
+            fields.append(self._parse_field(part, name, low, high))
+        self.minutes, self.hours, self.days, self.months, self.weekdays = fields
+        # Like cron, when both day and weekday are restricted either one may match
+        self.day_any = parts[2] == '*'
+        self.weekday_any = parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(part: str, name: str, low: int, high: int) -> frozenset:
+        values = set()
+        for item in part.split(','):
+            value_range, _, step = item.partition('/')
+            step = int(step) if step else 1
+            if value_range == '*':
+                start, end = low, high
+            elif '-' in value_range:
+                start, end = (int(v) for v in value_range.split('-', 1))
+            else:
+                start = end = int(value_range)
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"Invalid cron {name} field: {item}")
+            values.update(range(start, end + 1, step))
+        if name == 'weekday':
+            values = {value % 7 for value in values}
+        return frozenset(values)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.day_any or self.weekday_any:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, after: datetime) -> datetime:
+        """Get the first matching minute strictly after `after`."""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = after + timedelta(days=366 * 5)
+        while moment <= limit:
+            if moment.month not in self.months:
+                year, month = (moment.year + 1, 1) if moment.month == 12 else (moment.year, moment.month + 1)
+                moment = moment.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+
+def compute_next_run(announcement: Dict, now: datetime) -> datetime:
+    """Get the next run after `now`, anchored to the previous scheduled run so it never drifts."""
+    if announcement.get('cron'):
+        return CronSchedule(announcement['cron']).next_after(now)
+    previous = datetime.fromisoformat(announcement['next_run'])
+    interval = timedelta(minutes=announcement['interval_minutes'])
+    next_run = previous + interval
+    if next_run <= now:
+        # Skip the slots missed while offline instead of sending a burst
+        missed = math.floor((now - previous) / interval)
+        next_run = previous + interval * (missed + 1)
+    return next_run
+
+
+def announcement_resource(announcement: Dict) -> str:
+    """Lease name for an announcement."""
+    return f"announcement:{announcement['id']}"
+
+
+class AnnouncementScheduler:
+    """Runs due announcements from the database without polling every minute."""
+
+    def __init__(self, db: StorageBackend, send: Callable[[Dict], Awaitable[None]],
+                 leases: Optional[LeaseManager] = None, handles: Optional[Callable[[Dict], bool]] = None):
+        self.db = db
+        self.send = send
+        self.leases = leases  # Claim each announcement before sending it
+        self.handles = handles  # Filter for announcements this process can send (e.g. its shards)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the scheduler loop (does nothing if it is already running)."""
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop the scheduler loop."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def wake(self):
+        """Re-check the schedule now (call after adding or changing an announcement)."""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def run_due(self) -> int:
+        """Send everything that is due and advance all their schedules in one transaction."""
+        now = datetime.utcnow()
+        due = await self.db.get_due_announcements(now.isoformat())
+        if self.handles:
+            due = [a for a in due if self.handles(a)]
+        if self.leases and due:
+            claimed = set(await self.leases.claim(announcement_resource(a) for a in due))
+            due = [a for a in due if announcement_resource(a) in claimed]
+            if due:
+                # Another node may have sent some of these and released them since we read the schedule
+                still_due = {a['id'] for a in await self.db.get_due_announcements(now.isoformat())}
+                await self.leases.release(announcement_resource(a) for a in due if a['id'] not in still_due)
+                due = [a for a in due if a['id'] in still_due]
+        if not due:
+            return 0
+
+        by_channel: Dict[int, List[Dict]] = defaultdict(list)
+        for announcement in due:
+            by_channel[announcement['channel_id']].append(announcement)
+        await asyncio.gather(*(self._send_channel(items) for items in by_channel.values()))
+
+        # Advance every due schedule, even failed sends, so a deleted channel can't spin the loop
+        updates = [(compute_next_run(a, now).isoformat(), a['id']) for a in due]
+        async with self.db.transaction():
+            await self.db.update_announcement_next_runs(updates)
+            if self.leases:
+                # Released in the same commit, so a node that claims one next sees it no longer due
+                await self.leases.release(announcement_resource(a) for a in due)
+        return len(due)
+
+    async def _send_channel(self, announcements: List[Dict]):
+        # Sequential within a channel to keep order, concurrent across channels
+        for announcement in announcements:
+            try:
+                await self.send(announcement)
+            except Exception as e:
+                print(f"Error sending announcement: {e}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.run_due()
+                next_run = await self.db.get_next_announcement_run()
+                if next_run is None:
+                    delay = MAX_SLEEP_SECONDS
+                else:
+                    delay = (datetime.fromisoformat(next_run) - datetime.utcnow()).total_seconds()
+                    delay = min(max(delay, 0), MAX_SLEEP_SECONDS)
+                    if delay == 0:
+                        # Still due after run_due, so it belongs to another process
+                        delay = SKIPPED_RETRY_SECONDS
+            except Exception as e:
+                print(f"Error running announcements: {e}")
+                delay = 60
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
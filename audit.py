@@ -0,0 +1,111 @@
+"""
+Kick attribution from the audit log event stream.
+Recent kick/ban entries are kept per guild for a short time so member leaves can be matched
+without a REST call. Polling the audit log is only used when the event stream is unavailable.
+"""
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+import discord
+
+# How long an audit entry can be matched against a member leave
+ENTRY_TTL = 60.0
+
+# How long a leave waits for its audit entry, which can arrive just after the leave event
+MATCH_GRACE = 2.0
+
+# Minimum seconds between fallback audit log polls for one guild
+POLL_INTERVAL = 5.0
+
+
+class AuditAction:
+    """A kick or ban seen in the audit log."""
+
+    __slots__ = ('action', 'target_id', 'moderator_id', 'reason', 'seen')
+
+    def __init__(self, action: discord.AuditLogAction, target_id: int, moderator_id: Optional[int], reason: Optional[str]):
+        self.action = action
+        self.target_id = target_id
+        self.moderator_id = moderator_id
+        self.reason = reason
+        self.seen = time.monotonic()
+
+
+class KickAttribution:
+    """Short-lived map of recent kick/ban targets per guild."""
+
+    def __init__(self, bot: discord.Client):
+        self.bot = bot
+        self.recent: Dict[int, Dict[int, AuditAction]] = {}
+        self.waiters: Dict[Tuple[int, int], asyncio.Future] = {}
+        self.last_poll: Dict[int, float] = {}
+
+    @property
+    def live(self) -> bool:
+        """Whether audit log events are delivered (needs the moderation intent)."""
+        return self.bot.intents.moderation
+
+    def record(self, entry: discord.AuditLogEntry):
+        """Remember a kick or ban entry (call from on_audit_log_entry_create)."""
+        if entry.action not in (discord.AuditLogAction.kick, discord.AuditLogAction.ban):
+            return
+        target_id = entry.target.id if entry.target else None
+        if target_id is None:
+            return
+        action = AuditAction(entry.action, target_id, entry.user_id, entry.reason)
+        self.recent.setdefault(entry.guild.id, {})[target_id] = action
+        self._expire(entry.guild.id)
+
+        waiter = self.waiters.pop((entry.guild.id, target_id), None)
+        if waiter and not waiter.done():
+            waiter.set_result(action)
+
+    def _expire(self, guild_id: int):
+        guild_actions = self.recent.get(guild_id)
+        if not guild_actions:
+            return
+        cutoff = time.monotonic() - ENTRY_TTL
+        for target_id in [t for t, a in guild_actions.items() if a.seen < cutoff]:
+            del guild_actions[target_id]
+        if not guild_actions:
+            del self.recent[guild_id]
+
+    async def match(self, guild: discord.Guild, user_id: int) -> Optional[AuditAction]:
+        """Find the kick/ban that removed a member, if any."""
+        self._expire(guild.id)
+        action = self.recent.get(guild.id, {}).pop(user_id, None)
+        if action:
+            return action
+
+        if not self.live:
+            return await self._poll(guild, user_id)
+
+        key = (guild.id, user_id)
+        waiter = self.waiters.get(key)
+        if waiter is None:
+            waiter = self.waiters[key] = asyncio.get_running_loop().create_future()
+        try:
+            action = await asyncio.wait_for(asyncio.shield(waiter), timeout=MATCH_GRACE)
+        except asyncio.TimeoutError:
+            return None  # A normal leave
+        finally:
+            self.waiters.pop(key, None)
+        self.recent.get(guild.id, {}).pop(user_id, None)
+        return action
+
+    async def _poll(self, guild: discord.Guild, user_id: int) -> Optional[AuditAction]:
+        """Fallback: read the latest kick from the audit log, rate-limited per guild."""
+        now = time.monotonic()
+        if now - self.last_poll.get(guild.id, 0.0) < POLL_INTERVAL:
+            return None
+        self.last_poll[guild.id] = now
+        try:
+            async for entry in guild.audit_logs(action=discord.AuditLogAction.kick, limit=1):
+                if entry.target and entry.target.id == user_id:
+                    return AuditAction(entry.action, user_id, entry.user_id, entry.reason)
+        except discord.Forbidden:
+            pass  # Missing View Audit Log permission
+        except discord.HTTPException as e:
+            print(f"Error reading audit log for {guild.name}: {e}")
+        return None
@@ -0,0 +1,167 @@
+"""
+Compiled auto-moderation rules.
+Whitelists and the profanity matcher are built once per config change instead of on every message.
+"""
+import re
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+# Precompiled link matcher shared by every guild
+LINK_PATTERN = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+
+# Common leetspeak substitutions, applied to both the word list and the message
+LEET_TABLE = str.maketrans({
+    '4': 'a', '@': 'a', '3': 'e', '1': 'i', '!': 'i',
+    '0': 'o', '5': 's', '$': 's', '7': 't', '+': 't',
+})
+
+# Notice sent to the author for each verdict
+VERDICT_MESSAGES = {
+    'spam': "please slow down! (Spam detected)",
+    'profanity': "your message contained inappropriate content.",
+    'links': "links are not allowed here.",
+    'mass_ping': "please don't mass ping!",
+}
+
+
+def parse_id_list(value: Optional[str]) -> frozenset:
+    """Parse a comma-separated ID list from the database."""
+    if not value:
+        return frozenset()
+    return frozenset(int(item) for item in value.split(',') if item.strip())
+
+
+def build_word_pattern(words: Iterable[str]) -> str:
+    """Build a regex that matches any of the words, factored into a trie so it runs in one pass."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}  # End-of-word marker
+
+    def build(node: Dict) -> str:
+        is_end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        group = '(?:' + '|'.join(branches) + ')'
+        return group + '?' if is_end else group
+
+    return build(trie)
+
+
+class AutomodRules:
+    """Auto-mod config for one guild, parsed and compiled once."""
+
+    def __init__(self, config: Dict, default_words: List[str]):
+        self.config = config
+        self.whitelisted_roles = parse_id_list(config.get('whitelisted_roles'))
+        self.whitelisted_channels = parse_id_list(config.get('whitelisted_channels'))
+
+        self.spam_enabled = bool(config.get('spam_enabled', 1))
+        self.spam_threshold = config.get('spam_threshold', 5)
+        self.profanity_enabled = bool(config.get('profanity_enabled', 1))
+        self.links_enabled = bool(config.get('links_enabled', 0))
+        self.mass_ping_enabled = bool(config.get('mass_ping_enabled', 1))
+        self.ping_threshold = config.get('ping_threshold', 5)
+
+        self.word_boundary = bool(config.get('profanity_word_boundary', 0))
+        self.normalize_leet = bool(config.get('profanity_leetspeak', 0))
+        self.profanity_pattern = self._compile_profanity(config.get('profanity_list'), default_words)
+
+    def _compile_profanity(self, profanity_list: Optional[str], default_words: List[str]) -> Optional["re.Pattern"]:
+        """Compile the banned word list into a single regex."""
+        words = profanity_list.split(',') if profanity_list else default_words
+        words = {word.strip().lower() for word in words}
+        if self.normalize_leet:
+            words = {word.translate(LEET_TABLE) for word in words}
+        words.discard('')
+        if not words:
+            return None
+        pattern = build_word_pattern(words)
+        if self.word_boundary:
+            pattern = r'\b' + pattern + r'\b'
+        return re.compile(pattern)
+
+    def is_whitelisted(self, role_ids: Iterable[int], channel_id: int) -> bool:
+        """Check if the channel or any of the author's roles is exempt."""
+        if channel_id in self.whitelisted_channels:
+            return True
+        return not self.whitelisted_roles.isdisjoint(role_ids)
+
+    def check(self, content: str, ping_count: int) -> Optional[str]:
+        """Run the stateless checks and return the first verdict, or None if the message is clean."""
+        if self.profanity_enabled and self.profanity_pattern is not None:
+            text = content.lower()
+            if self.normalize_leet:
+                text = text.translate(LEET_TABLE)
+            if self.profanity_pattern.search(text):
+                return 'profanity'
+
+        if self.links_enabled and LINK_PATTERN.search(content):
+            return 'links'
+
+        if self.mass_ping_enabled and ping_count >= self.ping_threshold:
+            return 'mass_ping'
+
+        return None
+
+
+class RuleCache:
+    """Keeps one AutomodRules per guild and rebuilds it when the config row changes."""
+
+    def __init__(self, default_words: List[str]):
+        self.default_words = default_words
+        self.rules: Dict[int, AutomodRules] = {}
+
+    def get(self, guild_id: int, config: Dict) -> AutomodRules:
+        """Get compiled rules for a guild's current config."""
+        rules = self.rules.get(guild_id)
+        # The settings cache hands out a new dict after every invalidation
+        if rules is None or rules.config is not config:
+            rules = AutomodRules(config, self.default_words)
+            self.rules[guild_id] = rules
+        return rules
+
+
+class SpamTracker:
+    """Sliding-window message counter per (guild_id, user_id) with bounded memory."""
+
+    def __init__(self, window: float = 10.0):
+        self.window = window  # Seconds
+        self.history: Dict[Tuple[int, int], Deque[float]] = {}
+
+    def hit(self, guild_id: int, user_id: int, threshold: int) -> bool:
+        """Record a message and return True if the user sent threshold messages within the window."""
+        now = time.monotonic()
+        key = (guild_id, user_id)
+        timestamps = self.history.get(key)
+        if timestamps is None or timestamps.maxlen != threshold:
+            timestamps = deque(maxlen=max(threshold, 1))
+            self.history[key] = timestamps
+        timestamps.append(now)
+        # Only the oldest of the last `threshold` messages matters
+        if len(timestamps) >= threshold and now - timestamps[0] < self.window:
+            timestamps.clear()
+            return True
+        return False
+
+    def sweep(self) -> int:
+        """Drop users with no messages inside the window. Returns the number removed."""
+        cutoff = time.monotonic() - self.window
+        idle = [key for key, timestamps in self.history.items() if not timestamps or timestamps[-1] < cutoff]
+        for key in idle:
+            del self.history[key]
+        return len(idle)
+
+    def stats(self) -> Dict:
+        """Get the number of tracked users and an estimate of memory used."""
+        memory = sys.getsizeof(self.history)
+        for key, timestamps in self.history.items():
+            memory += sys.getsizeof(key) + sys.getsizeof(timestamps) + 24 * len(timestamps)
+        return {'tracked_keys': len(self.history), 'memory_bytes': memory}
@@ -9,6 +9,7 @@ load_dotenv()
 
 # Import configuration
 from config import APPLICATION_ID, PUBLIC_KEY
+from command_sync import CommandSyncManager
 
 # Bot setup
 intents = discord.Intents.default()
@@ -19,6 +20,9 @@ intents.members = True  # Required for member join events and member information
 bot = commands.Bot(command_prefix='!', intents=intents, application_id=APPLICATION_ID)
 tree = bot.tree  # Slash command tree
 
+# Skips slash command syncs on reconnect when nothing changed (hashes kept in memory)
+command_sync = CommandSyncManager(tree)
+
 
 @bot.event
 async def on_ready():
@@ -33,28 +37,9 @@ async def on_ready():
         for guild in bot.guilds:
             print(f"  - {guild.name} (ID: {guild.id})")
     
-    # Sync slash commands
+    # Sync slash commands globally, then copy to each guild for instant availability
     print("\nSyncing slash commands...")
-    try:
-        # First sync globally
-        synced = await tree.sync()
-        print(f'✓ Synced {len(synced)} global slash command(s)')
-        if synced:
-            print("Global Commands:")
-            for cmd in synced:
-                print(f"  - /{cmd.name}")
-        
-        # Copy global commands to each guild for instant availability
-        for guild in bot.guilds:
-            try:
-                tree.copy_global_to(guild=guild)
-                guild_synced = await tree.sync(guild=guild)
-                print(f'✓ Synced {len(guild_synced)} command(s) to {guild.name} (instant)')
-            except Exception as e:
-                print(f'✗ Failed to sync to {guild.name}: {e}')
-    except Exception as e:
-        print(f'✗ Failed to sync slash commands: {e}')
-        print("Note: It may take a few minutes for slash commands to appear in Discord")
+    await command_sync.sync_all(bot.guilds)
     
     # Set bot status
     await bot.change_presence(
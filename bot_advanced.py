@@ -9,9 +9,25 @@ import os
 import re
 import asyncio
 from datetime import datetime, timedelta
-from collections import defaultdict
 from dotenv import load_dotenv
-from database import Database
+from database import Database, hour_bucket
+from storage import open_storage
+from leveling import XPLedger, XPPolicyEngine, LevelingPolicy, parse_multipliers, format_multipliers
+from settings_cache import SettingsCache
+from automod import RuleCache, SpamTracker, VERDICT_MESSAGES, parse_id_list
+from custom_commands import CustomCommandCache
+from reaction_roles import ReactionRoleIndex
+from announcements import AnnouncementScheduler, CronSchedule
+from afk import AFKRegistry
+from pipeline import MessageContext, MessagePipeline
+from modlog import ModLogDispatcher
+from message_store import MessageStore
+from audit import KickAttribution
+from infractions import (EscalationRule, ESCALATION_ACTIONS, HISTORY_PAGE_SIZE, MAX_WINDOW_HOURS, WarningCompactor,
+                         escalation_windows, format_escalations, parse_escalations, pick_escalation)
+from command_sync import CommandSyncManager
+from sharding import create_bot, describe_shards, format_shard_stats, owns_guild, shard_stats
+from cluster import LeaseManager, MuteTimers
 from config import APPLICATION_ID, PUBLIC_KEY
 
 # Load environment variables
@@ -23,21 +39,71 @@ intents.message_content = True  # Required for message content, auto-mod, loggin
 intents.members = True  # Required for member events, auto-roles
 intents.guild_messages = True
 intents.guild_reactions = True
+intents.moderation = True  # Required for audit log events (kick attribution)
 
-bot = commands.Bot(command_prefix='!', intents=intents, application_id=APPLICATION_ID)
+# AutoShardedBot when SHARD_COUNT is set (SHARD_IDS picks this process's shards), plain Bot otherwise
+bot = create_bot(command_prefix='!', intents=intents, application_id=APPLICATION_ID)
 tree = bot.tree  # Slash command tree
 
-# Initialize database
-db = Database()
+# Storage backend from DATABASE_URL (SQLite bot_data.db by default, or PostgreSQL)
+db = open_storage()
 
-# Cooldown tracking for spam detection
-message_history = defaultdict(list)  # {guild_id: {user_id: [timestamps]}}
+
+async def setup_hook():
+    """Open database connections before the bot connects to Discord."""
+    await db.connect()
+
+bot.setup_hook = setup_hook
+
+# Leases on announcements and mute timers, so each is handled by exactly one bot process
+leases = LeaseManager(db)
+
+# Cached server settings and auto-mod config (replaced with the stored row on every settings write)
+settings_cache = SettingsCache(db)
+
+# Custom commands for every guild, loaded in on_ready
+custom_commands = CustomCommandCache(db)
+
+# Reaction roles indexed by message ID, loaded in on_ready
+reaction_role_index = ReactionRoleIndex(db)
+
+# Batches log channel embeds to stay under Discord rate limits
+modlog = ModLogDispatcher()
+
+# Recent message content for delete/edit logs, kept for MESSAGE_LOG_RETENTION_DAYS
+message_store = MessageStore(db, retention_days=int(os.getenv('MESSAGE_LOG_RETENTION_DAYS', '7')))
+
+# Skips slash command syncs when nothing changed, hashes stored in the database
+command_sync = CommandSyncManager(tree, db)
+
+# Set once on_ready has loaded data and started background tasks. The lock keeps a
+# reconnect from running startup again while the first on_ready is still loading.
+startup_complete = False
+startup_lock = asyncio.Lock()
+
+# Recent kicks/bans from audit log events, matched against member leaves
+kick_attribution = KickAttribution(bot)
+
+# In-memory XP ledger, flushed to the database every XP_FLUSH_SECONDS (max XP lost on a crash)
+xp_ledger = XPLedger(db, flush_interval=int(os.getenv('XP_FLUSH_SECONDS', '30')))
+
+# XP cooldowns, ranges and multipliers per guild, checked before the ledger is touched
+xp_policy = XPPolicyEngine()
+
+# Sliding-window tracking for spam detection (10 second window)
+spam_tracker = SpamTracker(window=10)
 
 # Basic profanity filter words (extend as needed)
 PROFANITY_WORDS = ['badword1', 'badword2']  # Add your list here
 
-# AFK mention tracking
-afk_mentions_cache = {}
+# Compiled auto-mod rules per guild, rebuilt when the config changes
+automod_rules = RuleCache(PROFANITY_WORDS)
+
+# AFK users per guild, loaded in on_ready
+afk_registry = AFKRegistry(db)
+
+# Moves expired warnings to the archive for guilds with a warning expiry (guilds this process serves)
+warning_compactor = WarningCompactor(db, owns_guild=lambda guild_id: owns_guild(bot, guild_id))
 
 
 @bot.event
@@ -46,6 +112,9 @@ async def on_ready():
     print(f'{bot.user} has connected to Discord!')
     print(f'Bot ID: {bot.user.id}')
     print(f'Bot is in {len(bot.guilds)} guild(s)')
+    if bot.shard_count is not None:
+        print(f'Running {describe_shards(bot)} (cluster {os.getenv("CLUSTER_ID", "0")})')
+        print(format_shard_stats(shard_stats(bot)))
     
     # List all servers
     if bot.guilds:
@@ -53,40 +122,66 @@ async def on_ready():
         for guild in bot.guilds:
             print(f"  - {guild.name} (ID: {guild.id})")
     
-    # Sync slash commands
+    # Sync slash commands (skipped for scopes whose commands haven't changed)
     print("\nSyncing slash commands...")
-    try:
-        synced = await tree.sync()
-        print(f'✓ Synced {len(synced)} global slash command(s)')
-        
-        # Copy to guilds for instant availability
-        for guild in bot.guilds:
-            try:
-                tree.copy_global_to(guild=guild)
-                guild_synced = await tree.sync(guild=guild)
-                print(f'✓ Synced {len(guild_synced)} command(s) to {guild.name}')
-            except Exception as e:
-                print(f'✗ Failed to sync to {guild.name}: {e}')
-    except Exception as e:
-        print(f'✗ Failed to sync slash commands: {e}')
+    await command_sync.sync_all(bot.guilds)
     
-    # Start background tasks
-    check_mutes.start()
-    check_announcements.start()
+    # Load settings for every guild so events never wait on the database
+    await settings_cache.warm(guild.id for guild in bot.guilds)
     
     # Set bot status
     await bot.change_presence(
         activity=discord.Game(name="Use /help for commands")
     )
     
+    # on_ready fires again after reconnects, only load data and start tasks once
+    global startup_complete
+    async with startup_lock:
+        if startup_complete:
+            print("\n✅ Bot reconnected!")
+            return
+        
+        await custom_commands.load()
+        await reaction_role_index.load()
+        await afk_registry.load()
+        await xp_ledger.load_ranks()
+        leases.start()
+        await mute_timers.claim()
+        # Only now: if a load above raised, the next on_ready retries it
+        startup_complete = True
+    
+    # Start background tasks
+    mute_timers.start()
+    adopt_mute_timers.start()
+    announcement_scheduler.start()
+    flush_xp.start()
+    flush_message_logs.start()
+    prune_message_logs.start()
+    prune_warning_buckets.start()
+    compact_warnings.start()
+    sweep_spam_tracker.start()
+    sweep_xp_cooldowns.start()
+    
     print("\n✅ Bot is ready!")
 
 
+@bot.event
+async def on_shard_ready(shard_id: int):
+    """Called when one shard has connected (sharded mode only)."""
+    print(f'✓ Shard {shard_id} ready')
+
+
+@bot.event
+async def on_shard_disconnect(shard_id: int):
+    """Called when a shard loses its gateway connection (sharded mode only)."""
+    print(f'⚠️ Shard {shard_id} disconnected')
+
+
 @bot.event
 async def on_member_join(member: discord.Member):
     """Handle member join - welcome message and auto-role."""
     guild = member.guild
-    settings = db.get_server_settings(guild.id)
+    settings = await settings_cache.get_server_settings(guild.id)
     
     # Auto-role assignment
     if settings.get('autorole_id'):
@@ -140,7 +235,7 @@ async def on_member_join(member: discord.Member):
 async def on_member_remove(member: discord.Member):
     """Handle member leave - goodbye message."""
     guild = member.guild
-    settings = db.get_server_settings(guild.id)
+    settings = await settings_cache.get_server_settings(guild.id)
     
     channel_id = settings.get('goodbye_channel_id')
     if channel_id:
@@ -164,154 +259,145 @@ async def on_member_remove(member: discord.Member):
             print(f"Error sending goodbye: {e}")
 
 
+# Stages run in the order they are defined below
+message_pipeline = MessagePipeline()
+
+
 @bot.event
 async def on_message(message: discord.Message):
     """Handle all messages - auto-moderation, AFK, custom commands, leveling."""
     if message.author.bot:
         return
     
-    # Process custom commands (before auto-mod)
-    if message.content.startswith('!'):
-        parts = message.content[1:].split(' ', 1)
-        if len(parts) > 0:
-            cmd_name = parts[0].lower()
-            custom_cmd = db.get_custom_command(message.guild.id, cmd_name)
-            if custom_cmd:
-                await message.channel.send(custom_cmd['command_response'])
-                return  # Don't process further if custom command matched
-    
-    # Auto-moderation
-    await check_automod(message)
-    
-    # AFK system - check if someone mentioned an AFK user
-    if message.mentions:
-        for mention in message.mentions:
-            afk_data = db.is_afk(message.guild.id, mention.id)
-            if afk_data:
-                embed = discord.Embed(
-                    description=f"{mention.mention} is AFK: {afk_data['afk_message']}",
-                    color=discord.Color.orange()
-                )
-                await message.channel.send(embed=embed, delete_after=10)
+    if not message.guild:
+        await bot.process_commands(message)
+        return
+    
+    settings = await settings_cache.get_server_settings(message.guild.id)
+    await message_pipeline.run(message, settings)
+
+
+@message_pipeline.stage("message_log")
+async def message_log_stage(ctx: MessageContext):
+    """Remember message content so deletes and edits can be logged after a restart."""
+    if ctx.settings.get('log_channel_id'):
+        message_store.record(ctx.message)
+
+
+@message_pipeline.stage("custom_commands")
+async def custom_command_stage(ctx: MessageContext):
+    """Process custom commands (before auto-mod)."""
+    message = ctx.message
+    if not message.content.startswith('!'):
+        return
+    
+    parts = message.content[1:].split(' ', 1)
+    cmd_name = parts[0].lower()
+    custom_cmd = custom_commands.get(ctx.guild_id, cmd_name)
+    if custom_cmd:
+        await message.channel.send(custom_cmd.render(
+            user=message.author.mention,
+            channel=message.channel.mention,
+            args=parts[1] if len(parts) > 1 else ''
+        ))
+        ctx.stop()  # Don't process further if custom command matched
+
+
+@message_pipeline.stage("automod")
+async def automod_stage(ctx: MessageContext):
+    """Auto-moderation. Nothing else runs for a removed message."""
+    ctx.verdict = await check_automod(ctx.message)
+    if ctx.verdict:
+        ctx.stop(deleted=True)
+
+
+@message_pipeline.stage("afk")
+async def afk_stage(ctx: MessageContext):
+    """AFK notices for mentioned users and welcome back for the author."""
+    message = ctx.message
+    if ctx.guild_id not in afk_registry.users:
+        return
+    
+    # Check if someone mentioned an AFK user
+    for mention in message.mentions:
+        afk_data = afk_registry.get(ctx.guild_id, mention.id)
+        if afk_data and afk_registry.should_notify(message.channel.id, mention.id):
+            embed = discord.Embed(
+                description=f"{mention.mention} is AFK: {afk_data['afk_message']}",
+                color=discord.Color.orange()
+            )
+            await message.channel.send(embed=embed, delete_after=10)
     
     # Remove AFK if user sends a message
-    afk_data = db.is_afk(message.guild.id, message.author.id)
+    afk_data = afk_registry.get(ctx.guild_id, message.author.id)
     if afk_data:
-        db.remove_afk(message.guild.id, message.author.id)
+        await afk_registry.remove(ctx.guild_id, message.author.id)
         embed = discord.Embed(
             description=f"Welcome back {message.author.mention}! Removed your AFK.",
             color=discord.Color.green()
         )
         await message.channel.send(embed=embed, delete_after=5)
-    
-    # Leveling system - add XP
-    if message.channel.id not in [ch.id for ch in message.guild.text_channels]:  # Only text channels
+
+
+@message_pipeline.stage("leveling")
+async def leveling_stage(ctx: MessageContext):
+    """Add XP for messages in text channels, subject to the guild's leveling policy."""
+    message = ctx.message
+    if not isinstance(message.channel, discord.TextChannel):  # Only text channels
         return
     
-    result = db.add_xp(message.guild.id, message.author.id, 10)  # 10 XP per message
+    xp = xp_policy.award(message, ctx.settings)
+    if not xp:  # On cooldown or in a no-XP channel
+        return
+    result = await xp_ledger.add_xp(ctx.guild_id, message.author.id, xp)
     if result['leveled_up']:
         embed = discord.Embed(
             description=f"🎉 {message.author.mention} leveled up to level **{result['level']}**!",
             color=discord.Color.gold()
         )
         await message.channel.send(embed=embed)
-    
-    # Process bot commands
-    await bot.process_commands(message)
+
+
+@message_pipeline.stage("commands")
+async def command_stage(ctx: MessageContext):
+    """Process bot prefix commands."""
+    await bot.process_commands(ctx.message)
 
 
 async def check_automod(message: discord.Message):
-    """Auto-moderation checks."""
+    """Auto-moderation checks. Returns the verdict if the message was removed."""
     if not message.guild:
-        return
+        return None
     
-    config = db.get_automod_config(message.guild.id)
+    config = await settings_cache.get_automod_config(message.guild.id)
+    rules = automod_rules.get(message.guild.id, config)
     
     # Check if user/role/channel is whitelisted
-    if config.get('whitelisted_roles'):
-        roles = [int(r) for r in config['whitelisted_roles'].split(',') if r]
-        if any(role.id in roles for role in message.author.roles):
-            return
+    if rules.is_whitelisted((role.id for role in message.author.roles), message.channel.id):
+        return None
     
-    if config.get('whitelisted_channels'):
-        channels = [int(c) for c in config['whitelisted_channels'].split(',') if c]
-        if message.channel.id in channels:
-            return
+    verdict = None
     
     # Spam detection
-    if config.get('spam_enabled', 1):
-        guild_id = message.guild.id
-        user_id = message.author.id
-        
-        if guild_id not in message_history:
-            message_history[guild_id] = defaultdict(list)
-        
-        now = datetime.utcnow()
-        message_history[guild_id][user_id].append(now)
-        
-        # Clean old messages (older than 10 seconds)
-        threshold = timedelta(seconds=10)
-        message_history[guild_id][user_id] = [
-            ts for ts in message_history[guild_id][user_id] 
-            if now - ts < threshold
-        ]
-        
-        spam_threshold = config.get('spam_threshold', 5)
-        if len(message_history[guild_id][user_id]) >= spam_threshold:
-            try:
-                await message.delete()
-                await message.channel.send(
-                    f"{message.author.mention}, please slow down! (Spam detected)",
-                    delete_after=5
-                )
-                message_history[guild_id][user_id].clear()
-            except:
-                pass
+    if rules.spam_enabled and spam_tracker.hit(message.guild.id, message.author.id, rules.spam_threshold):
+        verdict = 'spam'
     
-    # Profanity filter
-    if config.get('profanity_enabled', 1):
-        content_lower = message.content.lower()
-        profanity_list = (config.get('profanity_list') or '').split(',') if config.get('profanity_list') else PROFANITY_WORDS
-        
-        for word in profanity_list:
-            if word.strip() and word.strip() in content_lower:
-                try:
-                    await message.delete()
-                    await message.channel.send(
-                        f"{message.author.mention}, your message contained inappropriate content.",
-                        delete_after=5
-                    )
-                    return
-                except:
-                    pass
-    
-    # Link filter
-    if config.get('links_enabled', 0):
-        url_pattern = re.compile(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
-        if url_pattern.search(message.content):
-            try:
-                await message.delete()
-                await message.channel.send(
-                    f"{message.author.mention}, links are not allowed here.",
-                    delete_after=5
-                )
-            except:
-                pass
+    # Profanity, link and mass ping filters
+    if verdict is None:
+        verdict = rules.check(message.content, len(message.mentions) + len(message.role_mentions))
     
-    # Mass ping detection
-    if config.get('mass_ping_enabled', 1):
-        ping_count = len(message.mentions) + len(message.role_mentions)
-        ping_threshold = config.get('ping_threshold', 5)
-        
-        if ping_count >= ping_threshold:
-            try:
-                await message.delete()
-                await message.channel.send(
-                    f"{message.author.mention}, please don't mass ping!",
-                    delete_after=5
-                )
-            except:
-                pass
+    if verdict is None:
+        return None
+    
+    try:
+        await message.delete()
+        await message.channel.send(
+            f"{message.author.mention}, {VERDICT_MESSAGES[verdict]}",
+            delete_after=5
+        )
+    except:
+        pass
+    return verdict
 
 
 @bot.event
@@ -320,7 +406,7 @@ async def on_message_delete(message: discord.Message):
     if message.author.bot:
         return
     
-    settings = db.get_server_settings(message.guild.id)
+    settings = await settings_cache.get_server_settings(message.guild.id)
     log_channel_id = settings.get('log_channel_id')
     
     if not log_channel_id:
@@ -341,10 +427,84 @@ async def on_message_delete(message: discord.Message):
     if message.content:
         embed.add_field(name="Content", value=message.content[:1024] or "*No content*", inline=False)
     
-    try:
-        await log_channel.send(embed=embed)
-    except Exception as e:
-        print(f"Error logging deleted message: {e}")
+    message_store.record_delete(message_store.from_message(message))
+    modlog.enqueue(log_channel, embed)
+
+
+@bot.event
+async def on_raw_message_delete(payload: discord.RawMessageDeleteEvent):
+    """Log deleted messages that discord.py no longer has cached."""
+    if payload.cached_message is not None or not payload.guild_id:
+        return  # Cached messages are handled by on_message_delete
+    
+    settings = await settings_cache.get_server_settings(payload.guild_id)
+    log_channel_id = settings.get('log_channel_id')
+    
+    if not log_channel_id:
+        return
+    
+    guild = bot.get_guild(payload.guild_id)
+    log_channel = guild.get_channel(log_channel_id) if guild else None
+    if not log_channel:
+        return
+    
+    stored = await message_store.lookup(payload.guild_id, payload.message_id)
+    if not stored:
+        return
+    
+    embed = discord.Embed(
+        title="🗑️ Message Deleted",
+        color=discord.Color.red(),
+        timestamp=datetime.utcnow()
+    )
+    embed.add_field(name="Author", value=f"<@{stored.user_id}> ({stored.user_id})", inline=False)
+    embed.add_field(name="Channel", value=f"<#{stored.channel_id}>", inline=True)
+    
+    if stored.content:
+        embed.add_field(name="Content", value=stored.content, inline=False)
+    
+    message_store.record_delete(stored)
+    modlog.enqueue(log_channel, embed)
+
+
+@bot.event
+async def on_raw_bulk_message_delete(payload: discord.RawBulkMessageDeleteEvent):
+    """Log a bulk delete (e.g. /purge) as a single entry."""
+    if not payload.guild_id:
+        return
+    
+    settings = await settings_cache.get_server_settings(payload.guild_id)
+    log_channel_id = settings.get('log_channel_id')
+    
+    if not log_channel_id:
+        return
+    
+    guild = bot.get_guild(payload.guild_id)
+    log_channel = guild.get_channel(log_channel_id) if guild else None
+    if not log_channel:
+        return
+    
+    embed = discord.Embed(
+        title="🗑️ Messages Bulk Deleted",
+        description=f"{len(payload.message_ids)} message(s) deleted in <#{payload.channel_id}>",
+        color=discord.Color.red(),
+        timestamp=datetime.utcnow()
+    )
+    
+    # Include what we still have cached, oldest first
+    lines = []
+    for message in sorted(payload.cached_messages, key=lambda m: m.created_at):
+        if not message.author.bot and message.content:
+            lines.append(f"**{message.author}:** {message.content[:100]}")
+    if lines:
+        content = ""
+        for line in lines:
+            if len(content) + len(line) + 1 > 1024:
+                break
+            content += line + "\n"
+        embed.add_field(name="Cached Content", value=content, inline=False)
+    
+    modlog.enqueue(log_channel, embed)
 
 
 @bot.event
@@ -353,7 +513,7 @@ async def on_message_edit(before: discord.Message, after: discord.Message):
     if before.author.bot or before.content == after.content:
         return
     
-    settings = db.get_server_settings(before.guild.id)
+    settings = await settings_cache.get_server_settings(before.guild.id)
     log_channel_id = settings.get('log_channel_id')
     
     if not log_channel_id:
@@ -378,16 +538,56 @@ async def on_message_edit(before: discord.Message, after: discord.Message):
     embed.add_field(name="Before", value=before_content, inline=False)
     embed.add_field(name="After", value=after_content, inline=False)
     
-    try:
-        await log_channel.send(embed=embed)
-    except Exception as e:
-        print(f"Error logging edited message: {e}")
+    message_store.record_edit(message_store.from_message(before), after.content)
+    modlog.enqueue(log_channel, embed)
+
+
+@bot.event
+async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
+    """Log edits to messages that discord.py no longer has cached."""
+    if payload.cached_message is not None or not payload.guild_id:
+        return  # Cached messages are handled by on_message_edit
+    
+    after_content = payload.data.get('content')
+    if after_content is None:
+        return  # Embed or pin update, not a content edit
+    
+    settings = await settings_cache.get_server_settings(payload.guild_id)
+    log_channel_id = settings.get('log_channel_id')
+    
+    if not log_channel_id:
+        return
+    
+    guild = bot.get_guild(payload.guild_id)
+    log_channel = guild.get_channel(log_channel_id) if guild else None
+    if not log_channel:
+        return
+    
+    stored = await message_store.lookup(payload.guild_id, payload.message_id)
+    if not stored or stored.content == after_content[:1024]:
+        return
+    
+    embed = discord.Embed(
+        title="✏️ Message Edited",
+        color=discord.Color.blue(),
+        timestamp=datetime.utcnow()
+    )
+    embed.add_field(name="Author", value=f"<@{stored.user_id}> ({stored.user_id})", inline=False)
+    embed.add_field(name="Channel", value=f"<#{stored.channel_id}>", inline=True)
+    jump_url = f"https://discord.com/channels/{payload.guild_id}/{payload.channel_id}/{payload.message_id}"
+    embed.add_field(name="Jump to Message", value=f"[Click here]({jump_url})", inline=True)
+    
+    embed.add_field(name="Before", value=stored.content or "*No content*", inline=False)
+    embed.add_field(name="After", value=after_content[:1024] or "*No content*", inline=False)
+    
+    message_store.record_edit(stored, after_content)
+    modlog.enqueue(log_channel, embed)
 
 
 @bot.event
 async def on_member_ban(guild: discord.Guild, user: discord.User):
     """Log member bans."""
-    settings = db.get_server_settings(guild.id)
+    settings = await settings_cache.get_server_settings(guild.id)
     log_channel_id = settings.get('log_channel_id')
     
     if not log_channel_id:
@@ -404,128 +604,205 @@ async def on_member_ban(guild: discord.Guild, user: discord.User):
         timestamp=datetime.utcnow()
     )
     
-    try:
-        await log_channel.send(embed=embed)
-    except Exception as e:
-        print(f"Error logging ban: {e}")
+    modlog.enqueue(log_channel, embed)
 
 
 @bot.event
 async def on_member_remove(member: discord.Member):
     """Log member kicks (if they were kicked)."""
     # This also handles leave messages, but we check if it was a kick
-    settings = db.get_server_settings(member.guild.id)
+    settings = await settings_cache.get_server_settings(member.guild.id)
     log_channel_id = settings.get('log_channel_id')
     
     if log_channel_id:
         log_channel = member.guild.get_channel(log_channel_id)
         if log_channel:
-            # Try to get audit log to check if it was a kick
-            try:
-                async for entry in member.guild.audit_logs(action=discord.AuditLogAction.kick, limit=1):
-                    if entry.target == member:
-                        embed = discord.Embed(
-                            title="👢 Member Kicked",
-                            description=f"{member.mention} ({member}) has been kicked.",
-                            color=discord.Color.orange(),
-                            timestamp=datetime.utcnow()
-                        )
-                        if entry.reason:
-                            embed.add_field(name="Reason", value=entry.reason, inline=False)
-                        await log_channel.send(embed=embed)
-                        return
-            except:
-                pass
+            # Match against recent audit log events to check if it was a kick (bans are logged by on_member_ban)
+            action = await kick_attribution.match(member.guild, member.id)
+            if action and action.action == discord.AuditLogAction.kick:
+                embed = discord.Embed(
+                    title="👢 Member Kicked",
+                    description=f"{member.mention} ({member}) has been kicked.",
+                    color=discord.Color.orange(),
+                    timestamp=datetime.utcnow()
+                )
+                if action.moderator_id:
+                    embed.add_field(name="Moderator", value=f"<@{action.moderator_id}>", inline=True)
+                if action.reason:
+                    embed.add_field(name="Reason", value=action.reason, inline=False)
+                modlog.enqueue(log_channel, embed)
+
+
+@bot.event
+async def on_audit_log_entry_create(entry: discord.AuditLogEntry):
+    """Track kicks and bans so member leaves can be attributed without an API call."""
+    kick_attribution.record(entry)
 
 
 @bot.event
 async def on_raw_reaction_add(payload: discord.RawReactionActionEvent):
     """Handle reaction roles."""
-    if payload.member.bot:
+    role_ids = reaction_role_index.lookup(payload.guild_id, payload.message_id, payload.emoji)
+    if not role_ids:
         return
     
-    reaction_roles = db.get_reaction_roles(payload.guild_id, payload.message_id)
+    if not payload.member or payload.member.bot:
+        return
     
-    for rr in reaction_roles:
-        emoji_str = str(payload.emoji)
-        if emoji_str == rr['emoji'] or payload.emoji.name == rr['emoji']:
-            guild = bot.get_guild(payload.guild_id)
-            role = guild.get_role(rr['role_id'])
-            member = payload.member
-            
-            if role and member:
-                try:
-                    await member.add_roles(role, reason="Reaction role")
-                    print(f"Assigned role {role.name} to {member.name} via reaction")
-                except Exception as e:
-                    print(f"Error assigning reaction role: {e}")
+    guild = bot.get_guild(payload.guild_id)
+    member = payload.member
+    for role_id in role_ids:
+        role = guild.get_role(role_id)
+        if role and member:
+            try:
+                await member.add_roles(role, reason="Reaction role")
+                print(f"Assigned role {role.name} to {member.name} via reaction")
+            except Exception as e:
+                print(f"Error assigning reaction role: {e}")
 
 
 @bot.event
 async def on_raw_reaction_remove(payload: discord.RawReactionActionEvent):
     """Handle reaction role removal."""
-    reaction_roles = db.get_reaction_roles(payload.guild_id, payload.message_id)
-    
-    for rr in reaction_roles:
-        emoji_str = str(payload.emoji)
-        if emoji_str == rr['emoji'] or payload.emoji.name == rr['emoji']:
-            guild = bot.get_guild(payload.guild_id)
-            role = guild.get_role(rr['role_id'])
-            member = guild.get_member(payload.user_id)
-            
-            if role and member:
-                try:
-                    await member.remove_roles(role, reason="Reaction role removed")
-                except Exception as e:
-                    print(f"Error removing reaction role: {e}")
+    role_ids = reaction_role_index.lookup(payload.guild_id, payload.message_id, payload.emoji)
+    if not role_ids:
+        return
+    
+    guild = bot.get_guild(payload.guild_id)
+    member = guild.get_member(payload.user_id)
+    for role_id in role_ids:
+        role = guild.get_role(role_id)
+        if role and member:
+            try:
+                await member.remove_roles(role, reason="Reaction role removed")
+            except Exception as e:
+                print(f"Error removing reaction role: {e}")
 
 
-@tasks.loop(minutes=1)
-async def check_mutes():
-    """Check for expired mutes."""
-    for guild in bot.guilds:
-        muted_users = db.get_muted_users(guild.id)
-        for mute_data in muted_users:
-            if mute_data.get('unmute_time'):
-                unmute_time = datetime.fromisoformat(mute_data['unmute_time'])
-                if datetime.utcnow() >= unmute_time:
-                    user = guild.get_member(mute_data['user_id'])
-                    if user:
-                        mute_role = guild.get_role(mute_data['mute_role_id'])
-                        if mute_role:
-                            try:
-                                await user.remove_roles(mute_role, reason="Mute expired")
-                                db.remove_mute(guild.id, mute_data['user_id'])
-                                print(f"Unmuted {user.name} (expired)")
-                            except Exception as e:
-                                print(f"Error unmuting: {e}")
+async def lift_expired_mute(guild_id: int, user_id: int, mute_role_id) -> bool:
+    """Remove an expired role mute in Discord (called by the mute timers). Returns False to retry later."""
+    guild = bot.get_guild(guild_id)
+    if not guild:
+        return False  # Guild unavailable (outage or not cached yet)
+    
+    user = guild.get_member(user_id)
+    mute_role = guild.get_role(mute_role_id) if mute_role_id else None
+    if user and mute_role:
+        try:
+            await user.remove_roles(mute_role, reason="Mute expired")
+            print(f"Unmuted {user.name} (expired)")
+        except Exception as e:
+            print(f"Error unmuting: {e}")
+            return False
+    return True
+
+
+# Unmute deadlines for role-based mutes, claimed from muted_users in on_ready
+mute_timers = MuteTimers(db, leases, lift_expired_mute, owns_guild=lambda guild_id: owns_guild(bot, guild_id))
 
 
 @tasks.loop(minutes=1)
-async def check_announcements():
-    """Check and send scheduled announcements."""
-    announcements = db.get_due_announcements()
-    
-    for ann in announcements:
-        guild = bot.get_guild(ann['guild_id'])
-        if not guild:
-            continue
-        
-        channel = guild.get_channel(ann['channel_id'])
-        if not channel:
-            continue
-        
+async def adopt_mute_timers():
+    """Take over mute timers whose owning process stopped heartbeating."""
+    try:
+        await mute_timers.claim()
+    except Exception as e:
+        print(f"Error claiming mute timers: {e}")
+
+
+async def send_announcement(ann):
+    """Send one scheduled announcement (called by the announcement scheduler)."""
+    guild = bot.get_guild(ann['guild_id'])
+    if not guild:
+        return
+    
+    channel = guild.get_channel(ann['channel_id'])
+    if not channel:
+        return
+    
+    embed = discord.Embed(
+        title="📢 Automated Announcement",
+        description=ann['message'],
+        color=discord.Color.gold(),
+        timestamp=datetime.utcnow()
+    )
+    await channel.send(embed=embed)
+
+
+# Sleeps until the next announcement is due, started in on_ready
+announcement_scheduler = AnnouncementScheduler(
+    db, send_announcement, leases=leases, handles=lambda ann: owns_guild(bot, ann['guild_id'])
+)
+
+
+@tasks.loop(seconds=5)
+async def flush_xp():
+    """Write buffered XP to the database once the flush interval or batch size is reached."""
+    if xp_ledger.needs_flush():
         try:
-            embed = discord.Embed(
-                title="📢 Automated Announcement",
-                description=ann['message'],
-                color=discord.Color.gold(),
-                timestamp=datetime.utcnow()
-            )
-            await channel.send(embed=embed)
-            db.update_announcement_next_run(ann['id'])
+            await xp_ledger.flush()
         except Exception as e:
-            print(f"Error sending announcement: {e}")
+            print(f"Error flushing XP: {e}")
+
+
+@tasks.loop(minutes=5)
+async def sweep_spam_tracker():
+    """Forget users who have gone quiet so spam tracking memory stays bounded."""
+    removed = spam_tracker.sweep()
+    if removed:
+        stats = spam_tracker.stats()
+        print(f"Spam tracker: dropped {removed} idle user(s), tracking {stats['tracked_keys']} ({stats['memory_bytes'] // 1024} KB)")
+
+
+@tasks.loop(minutes=10)
+async def sweep_xp_cooldowns():
+    """Forget users whose XP cooldown has passed so cooldown memory stays bounded."""
+    removed = xp_policy.sweep()
+    if removed:
+        stats = xp_policy.stats()
+        print(f"XP cooldowns: dropped {removed} user(s), tracking {stats['tracked_users']} ({stats['memory_bytes'] // 1024} KB)")
+
+
+@tasks.loop(seconds=10)
+async def flush_message_logs():
+    """Write queued message content to message_logs in one batch."""
+    try:
+        await message_store.flush()
+    except Exception as e:
+        print(f"Error flushing message logs: {e}")
+
+
+@tasks.loop(hours=1)
+async def prune_message_logs():
+    """Delete logged message content past the retention period."""
+    try:
+        removed = await message_store.prune()
+        if removed:
+            print(f"Pruned {removed} old message log row(s)")
+    except Exception as e:
+        print(f"Error pruning message logs: {e}")
+
+
+@tasks.loop(hours=6)
+async def prune_warning_buckets():
+    """Delete hourly warning counts older than the longest escalation window."""
+    try:
+        await db.prune_warning_buckets(hour_bucket(datetime.utcnow()) - MAX_WINDOW_HOURS)
+    except Exception as e:
+        print(f"Error pruning warning counts: {e}")
+
+
+@tasks.loop(minutes=5)
+async def compact_warnings():
+    """Archive expired warnings, a few batches per guild per run."""
+    try:
+        archived = await warning_compactor.run()
+        if archived:
+            stats = warning_compactor.stats()
+            print(f"Archived {archived} expired warning(s) in {stats['last_duration_ms']}ms, "
+                  f"{stats['backlog_guilds']} guild(s) with more to archive")
+    except Exception as e:
+        print(f"Error compacting warnings: {e}")
 
 
 # MODERATION COMMANDS
@@ -588,61 +865,69 @@ async def slash_kick(interaction: discord.Interaction, member: discord.Member, r
         await interaction.response.send_message("❌ I don't have permission to kick this member.", ephemeral=True)
 
 
-@tree.command(name="mute", description="Mute a member (timeout or role)")
-@app_commands.describe(
-    member="Member to mute",
-    duration="Duration in minutes (0 for permanent)",
-    reason="Reason for mute"
-)
-@app_commands.default_permissions(moderate_members=True)
-async def slash_mute(interaction: discord.Interaction, member: discord.Member, duration: int = 0, reason: str = None):
-    """Mute a member."""
-    if not interaction.user.guild_permissions.moderate_members:
-        await interaction.response.send_message("❌ You need Moderate Members permission.", ephemeral=True)
-        return
-    
-    await interaction.response.defer()
-    
-    # Try timeout first (Discord's built-in mute)
+async def mute_member(guild: discord.Guild, member: discord.Member, duration: int, reason: str) -> bool:
+    """
+    Mute a member for duration minutes (0 = permanent). Uses a timeout (Discord's built-in mute)
+    when there is a duration, otherwise or if that fails the Muted role. Returns True for a timeout.
+    """
     if duration > 0:
-        timeout_until = datetime.utcnow() + timedelta(minutes=duration)
         try:
-            await member.timeout(timeout_until, reason=reason)
-            embed = discord.Embed(
-                title="🔇 Member Muted",
-                description=f"{member.mention} has been muted for {duration} minutes.",
-                color=discord.Color.orange()
-            )
-            if reason:
-                embed.add_field(name="Reason", value=reason, inline=False)
-            await interaction.followup.send(embed=embed)
-            return
+            await member.timeout(datetime.utcnow() + timedelta(minutes=duration), reason=reason)
+            return True
         except:
             pass  # Fall back to role mute
     
-    # Fall back to role-based mute
-    mute_role = discord.utils.get(interaction.guild.roles, name="Muted")
+    mute_role = discord.utils.get(guild.roles, name="Muted")
     if not mute_role:
         # Create mute role
-        mute_role = await interaction.guild.create_role(
+        mute_role = await guild.create_role(
             name="Muted",
             reason="Mute role creation"
         )
         # Deny permissions for mute role
-        for channel in interaction.guild.channels:
+        for channel in guild.channels:
             try:
                 await channel.set_permissions(mute_role, send_messages=False, speak=False)
             except:
                 pass
     
+    await member.add_roles(mute_role, reason=reason)
+    unmute_time = None
+    if duration > 0:
+        unmute_time = datetime.utcnow() + timedelta(minutes=duration)
+    
+    await mute_timers.add(guild.id, member.id, mute_role.id, unmute_time)
+    return False
+
+
+@tree.command(name="mute", description="Mute a member (timeout or role)")
+@app_commands.describe(
+    member="Member to mute",
+    duration="Duration in minutes (0 for permanent)",
+    reason="Reason for mute"
+)
+@app_commands.default_permissions(moderate_members=True)
+async def slash_mute(interaction: discord.Interaction, member: discord.Member, duration: int = 0, reason: str = None):
+    """Mute a member."""
+    if not interaction.user.guild_permissions.moderate_members:
+        await interaction.response.send_message("❌ You need Moderate Members permission.", ephemeral=True)
+        return
+    
+    await interaction.response.defer()
+    
     try:
-        await member.add_roles(mute_role, reason=reason or f"Muted by {interaction.user}")
-        unmute_time = None
-        if duration > 0:
-            unmute_time = (datetime.utcnow() + timedelta(minutes=duration)).isoformat()
-        
-        db.add_mute(interaction.guild.id, member.id, mute_role.id, unmute_time)
-        
+        timed_out = await mute_member(interaction.guild, member, duration, reason or f"Muted by {interaction.user}")
+    except Exception as e:
+        await interaction.followup.send(f"❌ Error muting member: {str(e)}")
+        return
+    
+    if timed_out:
+        embed = discord.Embed(
+            title="🔇 Member Muted",
+            description=f"{member.mention} has been muted for {duration} minutes.",
+            color=discord.Color.orange()
+        )
+    else:
         embed = discord.Embed(
             title="🔇 Member Muted",
             description=f"{member.mention} has been muted.",
@@ -650,11 +935,9 @@ async def slash_mute(interaction: discord.Interaction, member: discord.Member, d
         )
         if duration > 0:
             embed.add_field(name="Duration", value=f"{duration} minutes", inline=True)
-        if reason:
-            embed.add_field(name="Reason", value=reason, inline=False)
-        await interaction.followup.send(embed=embed)
-    except Exception as e:
-        await interaction.followup.send(f"❌ Error muting member: {str(e)}")
+    if reason:
+        embed.add_field(name="Reason", value=reason, inline=False)
+    await interaction.followup.send(embed=embed)
 
 
 @tree.command(name="unmute", description="Unmute a member")
@@ -682,7 +965,7 @@ async def slash_unmute(interaction: discord.Interaction, member: discord.Member)
         except:
             pass
     
-    db.remove_mute(interaction.guild.id, member.id)
+    await mute_timers.remove(interaction.guild.id, member.id)
     
     embed = discord.Embed(
         title="🔊 Member Unmuted",
@@ -701,8 +984,13 @@ async def slash_warn(interaction: discord.Interaction, member: discord.Member, r
         await interaction.response.send_message("❌ You need Moderate Members permission.", ephemeral=True)
         return
     
-    warning_id = db.add_warning(interaction.guild.id, member.id, interaction.user.id, reason)
-    warnings = db.get_warnings(interaction.guild.id, member.id)
+    guild = interaction.guild
+    settings = await settings_cache.get_server_settings(guild.id)
+    rules = parse_escalations(settings.get('warn_escalations'))
+    async with db.transaction():  # One commit, and the counts include this warning
+        warning_id = await db.add_warning(guild.id, member.id, interaction.user.id, reason)
+        counts = await db.get_warning_counts(guild.id, member.id, escalation_windows(rules))
+    escalation = pick_escalation(rules, counts)
     
     embed = discord.Embed(
         title="⚠️ Member Warned",
@@ -710,42 +998,71 @@ async def slash_warn(interaction: discord.Interaction, member: discord.Member, r
         color=discord.Color.orange()
     )
     embed.add_field(name="Reason", value=reason, inline=False)
-    embed.add_field(name="Total Warnings", value=f"{len(warnings)}", inline=True)
+    embed.add_field(name="Total Warnings", value=f"{counts['total']}", inline=True)
+    if escalation:
+        embed.add_field(name="Escalation", value=escalation.describe(), inline=True)
     embed.set_footer(text=f"Warning ID: {warning_id}")
     
     await interaction.response.send_message(embed=embed)
     
-    # DM the member
+    # DM the member (before any kick or ban, while we still share a server)
     try:
         dm_embed = discord.Embed(
             title="⚠️ You have been warned",
-            description=f"You received a warning in {interaction.guild.name}",
+            description=f"You received a warning in {guild.name}",
             color=discord.Color.orange()
         )
         dm_embed.add_field(name="Reason", value=reason, inline=False)
+        if escalation:
+            dm_embed.add_field(name="Escalation", value=escalation.describe(), inline=False)
         await member.send(embed=dm_embed)
     except:
         pass  # User has DMs disabled
+    
+    if escalation:
+        try:
+            await apply_escalation(guild, member, escalation)
+        except Exception as e:
+            await interaction.followup.send(f"❌ Couldn't apply escalation ({escalation.action}): {str(e)}", ephemeral=True)
+
+
+async def apply_escalation(guild: discord.Guild, member: discord.Member, rule: EscalationRule):
+    """Carry out the action of an escalation rule a warning triggered."""
+    reason = f"Auto-escalation: {rule.describe()}"
+    if rule.action == 'mute':
+        await mute_member(guild, member, rule.duration, reason)
+    elif rule.action == 'kick':
+        await member.kick(reason=reason)
+    elif rule.action == 'ban':
+        await member.ban(reason=reason)
 
 
 @tree.command(name="warnings", description="View warnings for a member")
-@app_commands.describe(member="Member to check warnings for")
+@app_commands.describe(
+    member="Member to check warnings for",
+    before="Show warnings older than this warning ID (for the next page)"
+)
 @app_commands.default_permissions(moderate_members=True)
-async def slash_warnings(interaction: discord.Interaction, member: discord.Member):
+async def slash_warnings(interaction: discord.Interaction, member: discord.Member, before: int = None):
     """View member warnings."""
-    warnings = db.get_warnings(interaction.guild.id, member.id)
+    counts = await db.get_warning_counts(interaction.guild.id, member.id)
     
-    if not warnings:
+    if not counts['total']:
         await interaction.response.send_message(f"✅ {member.mention} has no warnings.", ephemeral=True)
         return
     
+    warnings = await db.get_warnings(interaction.guild.id, member.id, limit=HISTORY_PAGE_SIZE, before_id=before)
+    if not warnings:
+        await interaction.response.send_message(f"No warnings older than #{before}.", ephemeral=True)
+        return
+    
     embed = discord.Embed(
         title=f"⚠️ Warnings for {member.display_name}",
-        description=f"Total: {len(warnings)}",
+        description=f"Total: {counts['total']}",
         color=discord.Color.orange()
     )
     
-    for i, warning in enumerate(warnings[:10], 1):  # Show last 10
+    for warning in warnings:
         moderator = interaction.guild.get_member(warning['moderator_id'])
         mod_name = moderator.display_name if moderator else "Unknown"
         embed.add_field(
@@ -753,6 +1070,8 @@ async def slash_warnings(interaction: discord.Interaction, member: discord.Membe
             value=f"**Reason:** {warning['reason']}\n**Moderator:** {mod_name}\n**Date:** {warning['timestamp'][:10]}",
             inline=False
         )
+    if len(warnings) == HISTORY_PAGE_SIZE:
+        embed.set_footer(text=f"Older warnings: /warnings before:{warnings[-1]['id']}")
     
     await interaction.response.send_message(embed=embed)
 
@@ -762,7 +1081,7 @@ async def slash_warnings(interaction: discord.Interaction, member: discord.Membe
 @app_commands.default_permissions(administrator=True)
 async def slash_clear_warnings(interaction: discord.Interaction, member: discord.Member):
     """Clear all warnings."""
-    count = db.clear_warnings(interaction.guild.id, member.id)
+    count = await db.clear_warnings(interaction.guild.id, member.id)
     embed = discord.Embed(
         description=f"✅ Cleared {count} warning(s) for {member.mention}.",
         color=discord.Color.green()
@@ -770,6 +1089,79 @@ async def slash_clear_warnings(interaction: discord.Interaction, member: discord
     await interaction.response.send_message(embed=embed)
 
 
+@tree.command(name="warnescalation", description="Set what happens after repeated warnings (Admin only)")
+@app_commands.describe(
+    warnings="Number of warnings that triggers the action (leave empty to list the rules)",
+    action="Action to take, or off to remove the rule",
+    window_hours="Only count warnings from the last this many hours (0 = all warnings)",
+    mute_minutes="Mute length for the mute action (0 = permanent)"
+)
+@app_commands.choices(action=[app_commands.Choice(name=name, value=name) for name in ESCALATION_ACTIONS + ('off',)])
+@app_commands.default_permissions(administrator=True)
+async def slash_warn_escalation(interaction: discord.Interaction,
+                                warnings: app_commands.Range[int, 1, 100] = None,
+                                action: str = None,
+                                window_hours: app_commands.Range[int, 0, MAX_WINDOW_HOURS] = 0,
+                                mute_minutes: app_commands.Range[int, 0, 40320] = 60):
+    """Add, replace, remove or list warning escalation rules."""
+    guild_id = interaction.guild.id
+    settings = await settings_cache.get_server_settings(guild_id)
+    rules = parse_escalations(settings.get('warn_escalations'))
+    
+    if warnings is not None:
+        if action is None:
+            await interaction.response.send_message("❌ Choose an action for the rule.", ephemeral=True)
+            return
+        # One rule per warning count and window
+        rules = [r for r in rules if (r.count, r.window_hours) != (warnings, window_hours)]
+        if action != 'off':
+            rules.append(EscalationRule(warnings, window_hours, action, mute_minutes))
+        await settings_cache.update_server_setting(guild_id, 'warn_escalations', format_escalations(rules))
+    
+    embed = discord.Embed(
+        title="Warning Escalation",
+        description="\n".join(rule.describe() for rule in sorted(rules, key=lambda r: (r.count, r.window_hours)))
+                    or "No rules set",
+        color=discord.Color.orange()
+    )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@tree.command(name="warnexpiry", description="Set how long warnings count before they expire (Admin only)")
+@app_commands.describe(days="Days until a warning expires (0 = never, leave empty to show the current setting)")
+@app_commands.default_permissions(administrator=True)
+async def slash_warn_expiry(interaction: discord.Interaction, days: app_commands.Range[int, 0, 3650] = None):
+    """Set or show warning expiry and archive progress."""
+    guild_id = interaction.guild.id
+    if days is not None:
+        settings = await settings_cache.update_server_setting(guild_id, 'warn_expiry_days', days or None)
+    else:
+        settings = await settings_cache.get_server_settings(guild_id)
+    expiry_days = settings.get('warn_expiry_days')
+    
+    rows = await db.count_warning_rows(guild_id)
+    stats = warning_compactor.stats()
+    embed = discord.Embed(title="Warning Expiry", color=discord.Color.orange())
+    embed.add_field(name="Expiry", value=f"{expiry_days} days" if expiry_days else "Never", inline=True)
+    embed.add_field(name="Active Warnings", value=str(rows['active']), inline=True)
+    embed.add_field(name="Archived Warnings", value=str(rows['archived']), inline=True)
+    if not expiry_days:
+        progress = "Off"
+    elif guild_id in warning_compactor.backlog:
+        progress = "Archiving a backlog of expired warnings"
+    elif stats['last_run']:
+        progress = f"Up to date (last run {stats['last_run'][:16].replace('T', ' ')} UTC)"
+    else:
+        progress = "Not run yet"
+    embed.add_field(
+        name="Compaction",
+        value=f"{progress}\n{warning_compactor.archived_by_guild.get(guild_id, 0)} archived here since the bot started",
+        inline=False
+    )
+    embed.set_footer(text="Expired warnings are moved to the archive every few minutes and stop counting")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 @tree.command(name="purge", description="Delete multiple messages")
 @app_commands.describe(amount="Number of messages to delete (1-100)")
 @app_commands.default_permissions(manage_messages=True)
@@ -795,7 +1187,7 @@ async def slash_purge(interaction: discord.Interaction, amount: int = 10):
 # CUSTOM COMMANDS
 
 @tree.command(name="addcommand", description="Add a custom command (Admin only)")
-@app_commands.describe(command="Command name (without prefix)", response="Response text")
+@app_commands.describe(command="Command name (without prefix)", response="Response text ({user}, {channel} and {args} are filled in)")
 @app_commands.default_permissions(administrator=True)
 async def slash_add_command(interaction: discord.Interaction, command: str, response: str):
     """Add a custom command."""
@@ -803,7 +1195,7 @@ async def slash_add_command(interaction: discord.Interaction, command: str, resp
         await interaction.response.send_message("❌ You need Administrator permission.", ephemeral=True)
         return
     
-    success = db.add_custom_command(interaction.guild.id, command, response)
+    success = await custom_commands.add(interaction.guild.id, command, response)
     if success:
         await interaction.response.send_message(
             f"✅ Custom command `{command}` added! Use `!{command}` to trigger it.",
@@ -825,7 +1217,7 @@ async def slash_delete_command(interaction: discord.Interaction, command: str):
         await interaction.response.send_message("❌ You need Administrator permission.", ephemeral=True)
         return
     
-    success = db.delete_custom_command(interaction.guild.id, command)
+    success = await custom_commands.delete(interaction.guild.id, command)
     if success:
         await interaction.response.send_message(f"✅ Command `{command}` deleted!", ephemeral=True)
     else:
@@ -835,7 +1227,7 @@ async def slash_delete_command(interaction: discord.Interaction, command: str):
 @tree.command(name="listcommands", description="List all custom commands")
 async def slash_list_commands(interaction: discord.Interaction):
     """List all custom commands."""
-    commands = db.get_all_custom_commands(interaction.guild.id)
+    commands = custom_commands.list(interaction.guild.id)
     
     if not commands:
         await interaction.response.send_message("No custom commands set up yet.", ephemeral=True)
@@ -847,7 +1239,7 @@ async def slash_list_commands(interaction: discord.Interaction):
         color=discord.Color.blue()
     )
     
-    cmd_list = "\n".join([f"`!{cmd['command_name']}`" for cmd in commands[:20]])
+    cmd_list = "\n".join([f"`!{cmd.name}`" for cmd in commands[:20]])
     embed.add_field(name="Commands", value=cmd_list or "None", inline=False)
     
     await interaction.response.send_message(embed=embed)
@@ -882,7 +1274,7 @@ async def slash_add_reaction_role(
         await message.add_reaction(emoji_obj)
         
         # Store in database
-        db.add_reaction_role(
+        await reaction_role_index.add(
             interaction.guild.id,
             msg_id,
             interaction.channel.id,
@@ -900,13 +1292,38 @@ async def slash_add_reaction_role(
         await interaction.response.send_message(f"❌ Error: {str(e)}", ephemeral=True)
 
 
+@tree.command(name="removereactionrole", description="Remove a reaction role from a message (Admin only)")
+@app_commands.describe(
+    message_id="ID of the message with the reaction role",
+    emoji="Emoji to remove"
+)
+@app_commands.default_permissions(administrator=True)
+async def slash_remove_reaction_role(interaction: discord.Interaction, message_id: str, emoji: str):
+    """Remove a reaction role."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need Administrator permission.", ephemeral=True)
+        return
+    
+    try:
+        msg_id = int(message_id)
+    except ValueError:
+        await interaction.response.send_message("❌ Invalid message ID.", ephemeral=True)
+        return
+    
+    success = await reaction_role_index.remove(interaction.guild.id, msg_id, emoji)
+    if success:
+        await interaction.response.send_message(f"✅ Reaction role {emoji} removed.", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"❌ No reaction role {emoji} found on that message.", ephemeral=True)
+
+
 # AFK SYSTEM
 
 @tree.command(name="afk", description="Set your AFK status")
 @app_commands.describe(message="AFK message (optional)")
 async def slash_afk(interaction: discord.Interaction, message: str = "AFK"):
     """Set AFK status."""
-    db.set_afk(interaction.guild.id, interaction.user.id, message)
+    await afk_registry.set(interaction.guild.id, interaction.user.id, message)
     embed = discord.Embed(
         description=f"✅ You are now AFK: {message}",
         color=discord.Color.blue()
@@ -921,7 +1338,7 @@ async def slash_afk(interaction: discord.Interaction, message: str = "AFK"):
 async def slash_level(interaction: discord.Interaction, member: discord.Member = None):
     """Check user level."""
     target = member or interaction.user
-    data = db.get_user_level(interaction.guild.id, target.id)
+    data = await xp_ledger.get(interaction.guild.id, target.id)
     
     # Calculate XP needed for next level
     current_level_xp = (data['level'] - 1) ** 2 * 100
@@ -936,6 +1353,10 @@ async def slash_level(interaction: discord.Interaction, member: discord.Member =
     embed.add_field(name="Level", value=f"{data['level']}", inline=True)
     embed.add_field(name="XP", value=f"{data['xp']}", inline=True)
     embed.add_field(name="Messages", value=f"{data['total_messages']}", inline=True)
+    rank = xp_ledger.leaderboard.rank(interaction.guild.id, target.id)
+    if rank is not None:
+        total = xp_ledger.leaderboard.size(interaction.guild.id)
+        embed.add_field(name="Rank", value=f"#{rank} of {total}", inline=True)
     embed.add_field(
         name="Progress to Next Level",
         value=f"{xp_progress}/{xp_needed} XP",
@@ -946,30 +1367,147 @@ async def slash_level(interaction: discord.Interaction, member: discord.Member =
     await interaction.response.send_message(embed=embed)
 
 
+def format_leaderboard(guild: discord.Guild, entries) -> str:
+    """Render (rank, user_id, xp) entries as leaderboard lines."""
+    lines = []
+    for rank, user_id, xp in entries:
+        user = guild.get_member(user_id)
+        name = user.display_name if user else "Unknown User"
+        lines.append(f"**{rank}.** {name} - Level {Database.calculate_level(xp)} ({xp} XP)")
+    return "\n".join(lines)
+
+
 @tree.command(name="leaderboard", description="View server level leaderboard")
-async def slash_leaderboard(interaction: discord.Interaction):
+@app_commands.describe(
+    page="Page of the leaderboard to show (10 per page)",
+    member="Show the members ranked around this member instead"
+)
+async def slash_leaderboard(interaction: discord.Interaction, page: app_commands.Range[int, 1] = 1,
+                            member: discord.Member = None):
     """Show level leaderboard."""
-    leaderboard = db.get_leaderboard(interaction.guild.id, limit=10)
+    ranks = xp_ledger.leaderboard
+    guild = interaction.guild
+    total = ranks.size(guild.id)
     
-    if not leaderboard:
+    if not total:
         await interaction.response.send_message("No leveling data yet!", ephemeral=True)
         return
     
+    if member:
+        entries = ranks.around(guild.id, member.id, radius=5)
+        if not entries:
+            await interaction.response.send_message(f"{member.mention} has no XP yet!", ephemeral=True)
+            return
+        leaderboard_text = format_leaderboard(guild, entries)
+    elif page == 1:
+        # The top 10 is cached until someone moves into, out of or within it
+        leaderboard_text = ranks.top_cache.get(guild.id)
+        if leaderboard_text is None:
+            leaderboard_text = ranks.top_cache[guild.id] = format_leaderboard(guild, ranks.page(guild.id, 1))
+    else:
+        entries = ranks.page(guild.id, page)
+        if not entries:
+            await interaction.response.send_message(f"There are only {(total + 9) // 10} page(s)!", ephemeral=True)
+            return
+        leaderboard_text = format_leaderboard(guild, entries)
+    
     embed = discord.Embed(
         title="🏆 Server Leaderboard",
         color=discord.Color.gold()
     )
-    
-    leaderboard_text = ""
-    for i, entry in enumerate(leaderboard, 1):
-        user = interaction.guild.get_member(entry['user_id'])
-        name = user.display_name if user else "Unknown User"
-        leaderboard_text += f"**{i}.** {name} - Level {entry['level']} ({entry['xp']} XP)\n"
-    
     embed.description = leaderboard_text
+    if member:
+        embed.set_footer(text=f"{total} members ranked")
+    else:
+        embed.set_footer(text=f"Page {page} of {(total + 9) // 10} • {total} members ranked")
     await interaction.response.send_message(embed=embed)
 
 
+@tree.command(name="xpsettings", description="Configure how members earn XP (Admin only)")
+@app_commands.describe(
+    cooldown="Seconds between XP awards for each member (0 for none)",
+    min_xp="Least XP a message can earn",
+    max_xp="Most XP a message can earn"
+)
+@app_commands.default_permissions(manage_guild=True)
+async def slash_xp_settings(interaction: discord.Interaction,
+                            cooldown: app_commands.Range[int, 0, 3600] = None,
+                            min_xp: app_commands.Range[int, 1, 1000] = None,
+                            max_xp: app_commands.Range[int, 1, 1000] = None):
+    """Show or change the leveling policy."""
+    guild = interaction.guild
+    async with settings_cache.transaction(guild.id):
+        if cooldown is not None:
+            await settings_cache.update_server_setting(guild.id, 'xp_cooldown', cooldown)
+        if min_xp is not None:
+            await settings_cache.update_server_setting(guild.id, 'xp_min', min_xp)
+        if max_xp is not None:
+            await settings_cache.update_server_setting(guild.id, 'xp_max', max_xp)
+    
+    policy = LevelingPolicy(await settings_cache.get_server_settings(guild.id))
+    embed = discord.Embed(title="XP Settings", color=discord.Color.gold())
+    embed.add_field(name="Cooldown", value=f"{policy.cooldown}s", inline=True)
+    embed.add_field(name="XP per Message", value=f"{policy.xp_min}-{policy.xp_max}", inline=True)
+    
+    channels = [f"<#{channel_id}>: x{multiplier:g}" for channel_id, multiplier in policy.channel_multipliers.items()]
+    channels += [f"<#{channel_id}>: no XP" for channel_id in policy.no_xp_channels]
+    embed.add_field(name="Channels", value="\n".join(channels) or "None", inline=False)
+    roles = [f"<@&{role_id}>: x{multiplier:g}" for role_id, multiplier in policy.role_multipliers.items()]
+    embed.add_field(name="Roles", value="\n".join(roles) or "None", inline=False)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+@tree.command(name="xpchannel", description="Set a channel's XP multiplier, 0 for no XP (Admin only)")
+@app_commands.describe(
+    channel="Channel to configure",
+    multiplier="XP multiplier (0 = no XP, 1 = normal)"
+)
+@app_commands.default_permissions(manage_guild=True)
+async def slash_xp_channel(interaction: discord.Interaction, channel: discord.TextChannel,
+                           multiplier: app_commands.Range[float, 0, 10]):
+    """Set a channel XP multiplier or turn XP off in a channel."""
+    settings = await settings_cache.get_server_settings(interaction.guild.id)
+    multipliers = parse_multipliers(settings.get('xp_channel_multipliers'))
+    no_xp = set(parse_id_list(settings.get('no_xp_channels')))
+    
+    multipliers.pop(channel.id, None)
+    no_xp.discard(channel.id)
+    if multiplier == 0:
+        no_xp.add(channel.id)
+    elif multiplier != 1:
+        multipliers[channel.id] = multiplier
+    
+    async with settings_cache.transaction(interaction.guild.id):
+        await settings_cache.update_server_setting(interaction.guild.id, 'xp_channel_multipliers', format_multipliers(multipliers))
+        await settings_cache.update_server_setting(
+            interaction.guild.id, 'no_xp_channels', ','.join(str(c) for c in sorted(no_xp)) or None
+        )
+    
+    if multiplier == 0:
+        await interaction.response.send_message(f"✅ Messages in {channel.mention} no longer earn XP", ephemeral=True)
+    else:
+        await interaction.response.send_message(f"✅ XP multiplier for {channel.mention} set to x{multiplier:g}", ephemeral=True)
+
+
+@tree.command(name="xprole", description="Set a role's XP multiplier (Admin only)")
+@app_commands.describe(
+    role="Role to configure",
+    multiplier="XP multiplier (1 = normal). Members get their highest role multiplier"
+)
+@app_commands.default_permissions(manage_guild=True)
+async def slash_xp_role(interaction: discord.Interaction, role: discord.Role,
+                        multiplier: app_commands.Range[float, 0, 10]):
+    """Set a role XP multiplier."""
+    settings = await settings_cache.get_server_settings(interaction.guild.id)
+    multipliers = parse_multipliers(settings.get('xp_role_multipliers'))
+    if multiplier == 1:
+        multipliers.pop(role.id, None)
+    else:
+        multipliers[role.id] = multiplier
+    await settings_cache.update_server_setting(interaction.guild.id, 'xp_role_multipliers', format_multipliers(multipliers))
+    await interaction.response.send_message(f"✅ XP multiplier for {role.mention} set to x{multiplier:g}", ephemeral=True)
+
+
 # CONFIGURATION COMMANDS
 
 @tree.command(name="setautorole", description="Set auto-role for new members (Admin only)")
@@ -988,7 +1526,7 @@ async def slash_set_autorole(interaction: discord.Interaction, role: discord.Rol
         )
         return
     
-    db.update_server_setting(interaction.guild.id, 'autorole_id', role.id if role else None)
+    await settings_cache.update_server_setting(interaction.guild.id, 'autorole_id', role.id if role else None)
     
     if role:
         await interaction.response.send_message(f"✅ Auto-role set to {role.mention}", ephemeral=True)
@@ -1001,7 +1539,7 @@ async def slash_set_autorole(interaction: discord.Interaction, role: discord.Rol
 @app_commands.default_permissions(manage_channels=True)
 async def slash_set_log_channel(interaction: discord.Interaction, channel: discord.TextChannel = None):
     """Set log channel."""
-    db.update_server_setting(interaction.guild.id, 'log_channel_id', channel.id if channel else None)
+    await settings_cache.update_server_setting(interaction.guild.id, 'log_channel_id', channel.id if channel else None)
     
     if channel:
         await interaction.response.send_message(f"✅ Log channel set to {channel.mention}", ephemeral=True)
@@ -1009,6 +1547,12 @@ async def slash_set_log_channel(interaction: discord.Interaction, channel: disco
         await interaction.response.send_message("✅ Log channel disabled", ephemeral=True)
 
 
+async def clear_welcome_channel(guild_id: int):
+    """Clear the welcome channel and return the value the database now holds."""
+    settings = await settings_cache.update_server_setting(guild_id, 'welcome_channel_id', None)
+    return settings.get('welcome_channel_id')
+
+
 @tree.command(name="setwelcomechannel", description="Set channel for welcome messages (Admin only)")
 @app_commands.describe(channel="Channel for welcome messages (leave empty to disable)")
 @app_commands.default_permissions(manage_channels=True)
@@ -1019,22 +1563,15 @@ async def slash_set_welcome_channel(interaction: discord.Interaction, channel: d
         return
     
     if channel:
-        db.update_server_setting(interaction.guild.id, 'welcome_channel_id', channel.id)
+        await settings_cache.update_server_setting(interaction.guild.id, 'welcome_channel_id', channel.id)
         await interaction.response.send_message(
             f"✅ Welcome messages will now be sent to {channel.mention}.\n"
             f"Welcome messages will only appear in the configured channel.",
             ephemeral=True
         )
     else:
-        # Explicitly set to NULL/None - use direct SQL for guaranteed clear
-        cursor = db.conn.cursor()
-        cursor.execute("UPDATE server_settings SET welcome_channel_id = NULL WHERE guild_id = ?", (interaction.guild.id,))
-        db.conn.commit()
-        
-        # Double-check it's cleared
-        cursor.execute("SELECT welcome_channel_id FROM server_settings WHERE guild_id = ?", (interaction.guild.id,))
-        result = cursor.fetchone()
-        cleared_value = result[0] if result else None
+        # Explicitly set to NULL/None and read it back
+        cleared_value = await clear_welcome_channel(interaction.guild.id)
         
         if cleared_value is None or cleared_value == 0:
             await interaction.response.send_message(
@@ -1059,7 +1596,7 @@ async def slash_set_welcome_channel(interaction: discord.Interaction, channel: d
 @app_commands.default_permissions(manage_channels=True)
 async def slash_set_goodbye_channel(interaction: discord.Interaction, channel: discord.TextChannel = None):
     """Set goodbye channel."""
-    db.update_server_setting(interaction.guild.id, 'goodbye_channel_id', channel.id if channel else None)
+    await settings_cache.update_server_setting(interaction.guild.id, 'goodbye_channel_id', channel.id if channel else None)
     
     if channel:
         await interaction.response.send_message(f"✅ Goodbye channel set to {channel.mention}", ephemeral=True)
@@ -1074,7 +1611,9 @@ async def slash_set_goodbye_channel(interaction: discord.Interaction, channel: d
     spam="Enable/disable spam detection",
     profanity="Enable/disable profanity filter",
     links="Enable/disable link filter",
-    mass_ping="Enable/disable mass ping detection"
+    mass_ping="Enable/disable mass ping detection",
+    word_boundary="Only match whole profane words (not inside other words)",
+    leetspeak="Also match profanity written with look-alike characters (e.g. sh1t)"
 )
 @app_commands.default_permissions(administrator=True)
 async def slash_automod(
@@ -1082,27 +1621,38 @@ async def slash_automod(
     spam: bool = None,
     profanity: bool = None,
     links: bool = None,
-    mass_ping: bool = None
+    mass_ping: bool = None,
+    word_boundary: bool = None,
+    leetspeak: bool = None
 ):
     """Configure auto-moderation."""
-    config = db.get_automod_config(interaction.guild.id)
+    config = await settings_cache.get_automod_config(interaction.guild.id)
     changes = []
     
-    if spam is not None:
-        db.update_automod_setting(interaction.guild.id, 'spam_enabled', int(spam))
-        changes.append(f"Spam detection: {'✅ Enabled' if spam else '❌ Disabled'}")
-    
-    if profanity is not None:
-        db.update_automod_setting(interaction.guild.id, 'profanity_enabled', int(profanity))
-        changes.append(f"Profanity filter: {'✅ Enabled' if profanity else '❌ Disabled'}")
-    
-    if links is not None:
-        db.update_automod_setting(interaction.guild.id, 'links_enabled', int(links))
-        changes.append(f"Link filter: {'✅ Enabled' if links else '❌ Disabled'}")
-    
-    if mass_ping is not None:
-        db.update_automod_setting(interaction.guild.id, 'mass_ping_enabled', int(mass_ping))
-        changes.append(f"Mass ping detection: {'✅ Enabled' if mass_ping else '❌ Disabled'}")
+    async with settings_cache.transaction(interaction.guild.id):
+        if spam is not None:
+            await settings_cache.update_automod_setting(interaction.guild.id, 'spam_enabled', int(spam))
+            changes.append(f"Spam detection: {'✅ Enabled' if spam else '❌ Disabled'}")
+        
+        if profanity is not None:
+            await settings_cache.update_automod_setting(interaction.guild.id, 'profanity_enabled', int(profanity))
+            changes.append(f"Profanity filter: {'✅ Enabled' if profanity else '❌ Disabled'}")
+        
+        if links is not None:
+            await settings_cache.update_automod_setting(interaction.guild.id, 'links_enabled', int(links))
+            changes.append(f"Link filter: {'✅ Enabled' if links else '❌ Disabled'}")
+        
+        if mass_ping is not None:
+            await settings_cache.update_automod_setting(interaction.guild.id, 'mass_ping_enabled', int(mass_ping))
+            changes.append(f"Mass ping detection: {'✅ Enabled' if mass_ping else '❌ Disabled'}")
+        
+        if word_boundary is not None:
+            await settings_cache.update_automod_setting(interaction.guild.id, 'profanity_word_boundary', int(word_boundary))
+            changes.append(f"Profanity whole-word matching: {'✅ Enabled' if word_boundary else '❌ Disabled'}")
+        
+        if leetspeak is not None:
+            await settings_cache.update_automod_setting(interaction.guild.id, 'profanity_leetspeak', int(leetspeak))
+            changes.append(f"Profanity leetspeak matching: {'✅ Enabled' if leetspeak else '❌ Disabled'}")
     
     if changes:
         embed = discord.Embed(
@@ -1121,39 +1671,95 @@ async def slash_automod(
         embed.add_field(name="Profanity Filter", value="✅ Enabled" if config.get('profanity_enabled') else "❌ Disabled", inline=True)
         embed.add_field(name="Link Filter", value="✅ Enabled" if config.get('links_enabled') else "❌ Disabled", inline=True)
         embed.add_field(name="Mass Ping Detection", value="✅ Enabled" if config.get('mass_ping_enabled') else "❌ Disabled", inline=True)
+        embed.add_field(name="Whole-Word Matching", value="✅ Enabled" if config.get('profanity_word_boundary') else "❌ Disabled", inline=True)
+        embed.add_field(name="Leetspeak Matching", value="✅ Enabled" if config.get('profanity_leetspeak') else "❌ Disabled", inline=True)
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
+@tree.command(name="messagestages", description="Turn message processing stages on or off (Admin only)")
+@app_commands.describe(
+    stage="Stage to change (leave empty to show all stages)",
+    enabled="Whether the stage should run in this server"
+)
+@app_commands.choices(stage=[app_commands.Choice(name=name, value=name) for name in message_pipeline.stage_names])
+@app_commands.default_permissions(administrator=True)
+async def slash_message_stages(interaction: discord.Interaction, stage: str = None, enabled: bool = None):
+    """Show or change message pipeline stages."""
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("❌ You need Administrator permission.", ephemeral=True)
+        return
+    
+    settings = await settings_cache.get_server_settings(interaction.guild.id)
+    disabled = set(message_pipeline.disabled_for(interaction.guild.id, settings))
+    
+    if stage is not None and enabled is not None:
+        if enabled:
+            disabled.discard(stage)
+        else:
+            disabled.add(stage)
+        await settings_cache.update_server_setting(
+            interaction.guild.id, 'disabled_stages', ','.join(sorted(disabled)) or None
+        )
+    
+    embed = discord.Embed(
+        title="Message Stages",
+        description="Stages run in this order for every message",
+        color=discord.Color.blue()
+    )
+    for name in message_pipeline.stage_names:
+        stats = message_pipeline.stats[name]
+        status = "❌ Disabled" if name in disabled else "✅ Enabled"
+        embed.add_field(
+            name=name,
+            value=f"{status}\nAvg {stats.average * 1000:.2f}ms, max {stats.max * 1000:.1f}ms ({stats.calls} runs)",
+            inline=True
+        )
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
 # SCHEDULED ANNOUNCEMENTS
 
 @tree.command(name="scheduleannouncement", description="Schedule a repeating announcement (Admin only)")
 @app_commands.describe(
     channel="Channel for announcement",
     message="Announcement message",
-    interval="Interval in minutes"
+    interval="Interval in minutes",
+    cron="Cron schedule in UTC instead of an interval, e.g. '0 9 * * 1-5'"
 )
 @app_commands.default_permissions(administrator=True)
 async def slash_schedule_announcement(
     interaction: discord.Interaction,
     channel: discord.TextChannel,
     message: str,
-    interval: int
+    interval: int = 0,
+    cron: str = None
 ):
     """Schedule a repeating announcement."""
-    if interval < 1:
+    next_run = None
+    if cron:
+        try:
+            next_run = CronSchedule(cron).next_after(datetime.utcnow()).isoformat()
+        except ValueError as e:
+            await interaction.response.send_message(f"❌ Invalid cron schedule: {e}", ephemeral=True)
+            return
+    elif interval < 1:
         await interaction.response.send_message("❌ Interval must be at least 1 minute.", ephemeral=True)
         return
     
-    announcement_id = db.add_scheduled_announcement(
+    announcement_id = await db.add_scheduled_announcement(
         interaction.guild.id,
         channel.id,
         message,
-        interval
+        interval if not cron else None,
+        cron=cron,
+        next_run=next_run
     )
+    announcement_scheduler.wake()
     
+    schedule_text = f"on schedule `{cron}` (UTC)" if cron else f"every {interval} minutes"
     embed = discord.Embed(
         title="✅ Announcement Scheduled",
-        description=f"Announcement will be sent every {interval} minutes in {channel.mention}",
+        description=f"Announcement will be sent {schedule_text} in {channel.mention}",
         color=discord.Color.green()
     )
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -1165,7 +1771,17 @@ async def slash_schedule_announcement(
 async def slash_ping(interaction: discord.Interaction):
     """Check bot latency."""
     latency = round(bot.latency * 1000)
-    await interaction.response.send_message(f"Pong! Latency: {latency}ms")
+    if bot.shard_count is None:
+        await interaction.response.send_message(f"Pong! Latency: {latency}ms")
+        return
+    
+    embed = discord.Embed(
+        title="Pong!",
+        description=f"Average latency: {latency}ms\nThis server is on shard {interaction.guild.shard_id}",
+        color=discord.Color.green()
+    )
+    embed.add_field(name=f"Shards ({describe_shards(bot)})", value=format_shard_stats(shard_stats(bot)), inline=False)
+    await interaction.response.send_message(embed=embed)
 
 
 @tree.command(name="serverinfo", description="Display server information")
@@ -1192,7 +1808,7 @@ async def slash_bot_config(interaction: discord.Interaction):
         await interaction.response.send_message("❌ You need Administrator permission.", ephemeral=True)
         return
     
-    settings = db.get_server_settings(interaction.guild.id)
+    settings = await settings_cache.get_server_settings(interaction.guild.id)
     
     embed = discord.Embed(
         title="Bot Configuration",
@@ -1236,6 +1852,13 @@ async def slash_bot_config(interaction: discord.Interaction):
         autorole_text = "❌ **DISABLED** - No auto-role"
     embed.add_field(name="Auto-Role", value=autorole_text, inline=False)
     
+    cache_stats = settings_cache.stats()
+    embed.add_field(
+        name="Settings Cache",
+        value=f"{cache_stats['hits']} hits / {cache_stats['misses']} misses ({cache_stats['hit_rate']:.0%} hit rate)",
+        inline=False
+    )
+    
     embed.set_footer(text="Use /setwelcomechannel (empty) to disable welcome messages")
     
     await interaction.response.send_message(embed=embed, ephemeral=True)
@@ -1249,15 +1872,8 @@ async def slash_disable_welcome(interaction: discord.Interaction):
         await interaction.response.send_message("❌ You need Administrator permission.", ephemeral=True)
         return
     
-    # Force clear using direct SQL
-    cursor = db.conn.cursor()
-    cursor.execute("UPDATE server_settings SET welcome_channel_id = NULL WHERE guild_id = ?", (interaction.guild.id,))
-    db.conn.commit()
-    
-    # Verify
-    cursor.execute("SELECT welcome_channel_id FROM server_settings WHERE guild_id = ?", (interaction.guild.id,))
-    result = cursor.fetchone()
-    value = result[0] if result else None
+    # Force clear and read it back
+    value = await clear_welcome_channel(interaction.guild.id)
     
     if value is None or value == 0:
         await interaction.response.send_message(
@@ -1287,5 +1903,8 @@ if __name__ == "__main__":
         try:
             bot.run(token)
         finally:
+            xp_ledger.flush_sync()
+            message_store.flush_sync()
+            leases.release_all_sync()  # Let other processes take over right away
             db.close()
 
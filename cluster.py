@@ -0,0 +1,185 @@
+"""
+Work ownership across bot processes that share one database.
+Each process (node) claims a lease row per resource (an announcement, a mute timer) and
+heartbeats its leases, so exactly one live node owns each piece of work. Leases of a node that
+stops heartbeating expire and are picked up by the others.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Iterable, List, Optional, Set, Tuple
+
+from storage import StorageBackend
+from timers import TimerService
+
+# Seconds a lease lives without a heartbeat
+LEASE_TTL = 60.0
+
+# Seconds between heartbeats (several per TTL so one slow write doesn't lose leases)
+HEARTBEAT_INTERVAL = 15.0
+
+
+def make_node_id() -> str:
+    """Unique ID for this process (unique per instance, so in-process test nodes differ too)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaseManager:
+    """Claims, heartbeats and releases work leases for one node."""
+
+    def __init__(self, db: StorageBackend, node_id: Optional[str] = None, ttl: float = LEASE_TTL,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        self.db = db
+        self.node_id = node_id or make_node_id()
+        self.ttl = ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.held: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def claim(self, resources: Iterable[str]) -> List[str]:
+        """Claim every resource that is free, expired or already ours. Returns the ones we now hold."""
+        resources = list(resources)
+        if not resources:
+            return []
+        now = time.time()
+        claimed = await self.db.claim_leases(resources, self.node_id, now + self.ttl, now)
+        self.held.update(claimed)
+        return claimed
+
+    async def claim_one(self, resource: str) -> bool:
+        """Claim a single resource (also confirms a lease we think we hold is still ours)."""
+        return bool(await self.claim([resource]))
+
+    async def release(self, resources: Iterable[str]):
+        """Give up resources, e.g. once the work is finished."""
+        resources = list(resources)
+        if resources:
+            await self.db.release_leases(self.node_id, resources)
+            self.held.difference_update(resources)
+
+    async def heartbeat(self) -> Set[str]:
+        """Extend all our leases. Returns the resources we lost (they expired and were taken)."""
+        now = time.time()
+        held = set(await self.db.renew_leases(self.node_id, now + self.ttl, now))
+        lost = self.held - held
+        self.held = held
+        if lost:
+            print(f"⚠️ Lost {len(lost)} lease(s) to other nodes")
+        return lost
+
+    def start(self):
+        """Start the heartbeat loop (does nothing if it is already running)."""
+        if self._task and not self._task.done():
+            return
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop the heartbeat loop."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def release_all_sync(self):
+        """Release every lease through the synchronous database, for use at shutdown."""
+        self.db.sync.release_leases(self.node_id)
+        self.held.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.heartbeat()
+                # Leases of nodes gone for a while are no use to anyone
+                await self.db.prune_leases(time.time() - self.ttl * 10)
+            except Exception as e:
+                print(f"Error renewing leases: {e}")
+            await asyncio.sleep(self.heartbeat_interval)
+
+
+def mute_resource(key: Tuple[int, int]) -> str:
+    """Lease name for a mute timer, keyed by (guild_id, user_id)."""
+    guild_id, user_id = key
+    return f"mute:{guild_id}:{user_id}"
+
+
+class MuteTimers:
+    """
+    Unmute timers for timed role mutes. Each node schedules only the mutes it holds a lease on,
+    so every expired mute is lifted once, and adopts the mutes of nodes that stopped heartbeating.
+    `unmute(guild_id, user_id, mute_role_id)` lifts the mute in Discord; it returns False to be
+    retried later (guild unavailable, request failed).
+    """
+
+    def __init__(self, db: StorageBackend, leases: LeaseManager,
+                 unmute: Callable[[int, int, Optional[int]], Awaitable[bool]],
+                 owns_guild: Callable[[int], bool] = None, retry_after: timedelta = timedelta(minutes=1)):
+        self.db = db
+        self.leases = leases
+        self.unmute = unmute
+        self.owns_guild = owns_guild or (lambda guild_id: True)  # Filter for guilds this process serves
+        self.retry_after = retry_after
+        self.timers = TimerService("mute", self.expire)
+
+    def start(self):
+        """Start the timer loop (does nothing if it is already running)."""
+        self.timers.start()
+
+    def stop(self):
+        """Stop the timer loop."""
+        self.timers.stop()
+
+    async def claim(self):
+        """Claim and schedule stored mutes no node owns yet. Mutes that expired while nobody was running fire right away."""
+        mutes = [m for m in await self.db.get_unclaimed_mutes(time.time()) if self.owns_guild(m['guild_id'])]
+        claimed = set(await self.leases.claim(mute_resource((m['guild_id'], m['user_id'])) for m in mutes))
+        for mute in mutes:
+            key = (mute['guild_id'], mute['user_id'])
+            if mute_resource(key) in claimed:
+                self.timers.schedule(key, datetime.fromisoformat(mute['unmute_time']), mute['mute_role_id'])
+
+    async def add(self, guild_id: int, user_id: int, mute_role_id: int, unmute_time: Optional[datetime] = None):
+        """Store a mute and take over its timer (unmute_time None = permanent)."""
+        key = (guild_id, user_id)
+        async with self.db.transaction():  # Mute row and lease change in one commit
+            await self.db.add_mute(guild_id, user_id, mute_role_id, unmute_time.isoformat() if unmute_time else None)
+            if unmute_time is None:
+                await self.leases.release([mute_resource(key)])
+                owned = False
+            else:
+                owned = await self.leases.claim_one(mute_resource(key))
+        if owned:
+            self.timers.schedule(key, unmute_time, mute_role_id)
+        else:
+            # Permanent, or another node owns the timer and picks up the new time when it fires
+            self.timers.cancel(key)
+
+    async def remove(self, guild_id: int, user_id: int):
+        """Forget a mute that was lifted by hand: its row, timer and lease."""
+        key = (guild_id, user_id)
+        await self.db.remove_mute(guild_id, user_id)
+        self.timers.cancel(key)
+        await self.leases.release([mute_resource(key)])
+
+    async def expire(self, key: Tuple[int, int], mute_role_id: Optional[int]):
+        """Lift an expired mute (the timer callback)."""
+        guild_id, user_id = key
+        if not await self.leases.claim_one(mute_resource(key)):
+            return  # Another node took this timer over
+
+        # The mute may have been lifted or extended by another node since it was scheduled
+        mute = await self.db.get_mute(guild_id, user_id)
+        if mute is None or mute['unmute_time'] is None:
+            await self.leases.release([mute_resource(key)])
+            return
+        unmute_time = datetime.fromisoformat(mute['unmute_time'])
+        if unmute_time > datetime.utcnow():
+            self.timers.schedule(key, unmute_time, mute['mute_role_id'])
+            return
+
+        if not await self.unmute(guild_id, user_id, mute['mute_role_id']):
+            self.timers.schedule(key, datetime.utcnow() + self.retry_after, mute['mute_role_id'])
+            return
+        await self.db.remove_mute(guild_id, user_id)
+        await self.leases.release([mute_resource(key)])
@@ -0,0 +1,98 @@
+"""
+Slash command sync manager.
+Hashes the command tree and only syncs scopes (global or per guild) whose commands changed
+since the last sync, running guild syncs concurrently with a bound.
+"""
+import asyncio
+import hashlib
+import json
+from typing import Dict, Iterable, Optional
+
+import discord
+from discord import app_commands
+
+# Scope ID used for the global command set
+GLOBAL_SCOPE = 0
+
+
+def command_payload(command, tree: app_commands.CommandTree) -> Dict:
+    """Get the API payload for a command (to_dict takes the tree from discord.py 2.4)."""
+    try:
+        return command.to_dict(tree)
+    except TypeError:
+        return command.to_dict()
+
+
+def tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """Hash the commands registered for a scope."""
+    payloads = [command_payload(command, tree) for command in tree.get_commands(guild=guild)]
+    payloads.sort(key=lambda payload: (payload.get('type', 1), payload['name']))
+    encoded = json.dumps(payloads, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+class CommandSyncManager:
+    """Syncs only what changed. Hashes are stored in the database, or in memory when db is None."""
+
+    def __init__(self, tree: app_commands.CommandTree, db=None, max_concurrency: int = 4):
+        self.tree = tree
+        self.db = db
+        self.max_concurrency = max_concurrency
+        self.hashes: Optional[Dict[int, str]] = None
+        self._lock = asyncio.Lock()
+
+    async def _load_hashes(self):
+        if self.hashes is None:
+            self.hashes = await self.db.get_command_sync_hashes() if self.db else {}
+
+    async def _save_hash(self, scope_id: int, digest: str):
+        self.hashes[scope_id] = digest
+        if self.db:
+            await self.db.set_command_sync_hash(scope_id, digest)
+
+    async def sync_global(self, force: bool = False) -> bool:
+        """Sync global commands if they changed. Returns True if a sync ran."""
+        await self._load_hashes()
+        digest = tree_hash(self.tree)
+        if not force and self.hashes.get(GLOBAL_SCOPE) == digest:
+            return False
+        synced = await self.tree.sync()
+        await self._save_hash(GLOBAL_SCOPE, digest)
+        print(f'✓ Synced {len(synced)} global slash command(s)')
+        return True
+
+    async def sync_guild(self, guild: discord.Guild, force: bool = False) -> bool:
+        """Copy global commands to a guild and sync them if they changed."""
+        await self._load_hashes()
+        self.tree.copy_global_to(guild=guild)
+        digest = tree_hash(self.tree, guild=guild)
+        if not force and self.hashes.get(guild.id) == digest:
+            return False
+        synced = await self.tree.sync(guild=guild)
+        await self._save_hash(guild.id, digest)
+        print(f'✓ Synced {len(synced)} command(s) to {guild.name}')
+        return True
+
+    async def sync_all(self, guilds: Iterable[discord.Guild]):
+        """Sync the global scope and every guild that needs it, a few guilds at a time."""
+        async with self._lock:  # A reconnect while a sync is running waits for it instead of repeating it
+            try:
+                await self.sync_global()
+            except Exception as e:
+                print(f'✗ Failed to sync slash commands: {e}')
+
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+
+            async def sync_one(guild: discord.Guild) -> Optional[bool]:
+                async with semaphore:
+                    try:
+                        return await self.sync_guild(guild)
+                    except Exception as e:
+                        print(f'✗ Failed to sync to {guild.name}: {e}')
+                        return None
+
+            guilds = list(guilds)
+            results = await asyncio.gather(*(sync_one(guild) for guild in guilds))
+            skipped = results.count(False)
+            if skipped:
+                print(f'✓ {skipped} guild(s) already up to date')
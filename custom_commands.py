@@ -0,0 +1,76 @@
+"""
+In-memory custom command registry.
+All commands are loaded at startup so the `!` prefix path never touches the database.
+"""
+import re
+from typing import Dict, List, Optional
+
+from storage import StorageBackend
+
+# Placeholders supported in command responses
+PLACEHOLDER_PATTERN = re.compile(r'\{(user|channel|args)\}')
+
+
+class CommandTemplate:
+    """A command response split into literal text and placeholders once, at load time."""
+
+    __slots__ = ('name', 'response', 'parts')
+
+    def __init__(self, name: str, response: str):
+        self.name = name
+        self.response = response
+        # re.split with a group alternates literal text and placeholder names
+        self.parts = PLACEHOLDER_PATTERN.split(response)
+
+    def render(self, **values: str) -> str:
+        """Fill in {user}, {channel} and {args}."""
+        if len(self.parts) == 1:
+            return self.response
+        rendered = []
+        for i, part in enumerate(self.parts):
+            rendered.append(values.get(part, '') if i % 2 else part)
+        return ''.join(rendered)
+
+
+class CustomCommandCache:
+    """Custom commands per guild, kept in sync by /addcommand and /deletecommand."""
+
+    def __init__(self, db: StorageBackend):
+        self.db = db
+        self.commands: Dict[int, Dict[str, CommandTemplate]] = {}
+
+    async def load(self):
+        """Load every custom command from the database."""
+        rows = await self.db.get_all_custom_command_rows()
+        self.commands = {}
+        for row in rows:
+            self._put(row['guild_id'], row['command_name'], row['command_response'])
+        print(f"Loaded {len(rows)} custom command(s) for {len(self.commands)} guild(s)")
+
+    def get(self, guild_id: int, command_name: str) -> Optional[CommandTemplate]:
+        """Look up a command in memory. Unknown names never hit the database."""
+        guild_commands = self.commands.get(guild_id)
+        if not guild_commands:
+            return None
+        return guild_commands.get(command_name.lower())
+
+    def list(self, guild_id: int) -> List[CommandTemplate]:
+        """Get all commands for a guild."""
+        return list(self.commands.get(guild_id, {}).values())
+
+    async def add(self, guild_id: int, command_name: str, response: str) -> bool:
+        """Add a command to the database and the cache."""
+        success = await self.db.add_custom_command(guild_id, command_name, response)
+        if success:
+            self._put(guild_id, command_name, response)
+        return success
+
+    async def delete(self, guild_id: int, command_name: str) -> bool:
+        """Delete a command from the database and the cache."""
+        success = await self.db.delete_custom_command(guild_id, command_name)
+        self.commands.get(guild_id, {}).pop(command_name.lower(), None)
+        return success
+
+    def _put(self, guild_id: int, command_name: str, response: str):
+        name = command_name.lower()
+        self.commands.setdefault(guild_id, {})[name] = CommandTemplate(name, response)
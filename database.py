@@ -1,23 +1,231 @@
 """
 Database module for storing server configurations and data.
-Uses SQLite for simplicity - can be upgraded to PostgreSQL/MySQL later.
+This is the SQLite storage backend; postgres_storage.py implements the same
+StorageBackend contract for PostgreSQL.
 """
 import sqlite3
 import os
-from typing import Optional, Dict, List, Tuple
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Dict, List, Tuple
+
+from storage import StorageBackend
 
 DB_PATH = "bot_data.db"
 
+# UPSERT ... RETURNING needs SQLite 3.35+; older versions read the row back instead
+SUPPORTS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Defaults for rows that haven't been written yet. Reads return these instead of inserting
+# a row, and the keys double as the whitelist of columns that can be updated by name.
+SERVER_SETTINGS_DEFAULTS = {
+    'autorole_id': None,
+    'log_channel_id': None,
+    'suggestion_channel_id': None,
+    'welcome_channel_id': None,
+    'goodbye_channel_id': None,
+    'automod_enabled': 1,
+    'spam_threshold': 5,
+    'profanity_filter': 1,
+    'link_filter': 0,
+    'mass_ping_threshold': 5,
+    'disabled_stages': None,
+    'xp_cooldown': 60,
+    'xp_min': 15,
+    'xp_max': 25,
+    'xp_channel_multipliers': None,
+    'xp_role_multipliers': None,
+    'no_xp_channels': None,
+    'warn_escalations': None,
+    'warn_expiry_days': None,
+}
+
+AUTOMOD_DEFAULTS = {
+    'spam_enabled': 1,
+    'profanity_enabled': 1,
+    'links_enabled': 0,
+    'mass_ping_enabled': 1,
+    'spam_threshold': 5,
+    'ping_threshold': 5,
+    'profanity_list': None,
+    'profanity_word_boundary': 0,
+    'profanity_leetspeak': 0,
+    'whitelisted_roles': None,
+    'whitelisted_channels': None,
+}
+
+USER_LEVEL_DEFAULTS = {'xp': 0, 'level': 1, 'total_messages': 0}
+
+# Channel and role settings where 0 or '' means "not set"
+OPTIONAL_ID_SETTINGS = ['welcome_channel_id', 'goodbye_channel_id', 'log_channel_id', 'autorole_id', 'suggestion_channel_id']
+
+# Per-connection tuning. synchronous=NORMAL is durable across app crashes in WAL mode.
+SYNCHRONOUS = "NORMAL"
+CACHE_SIZE_KB = 16384
+MMAP_SIZE = 64 * 1024 * 1024
+
+# Ordered schema migrations: (version, description, statements, transactional).
+# The tables created in init_database are version 0. Append new entries for schema
+# changes; never edit one that has shipped. The schema version is stored in
+# PRAGMA user_version. Journal mode changes cannot run inside a transaction.
+MIGRATIONS = [
+    (1, "Add indexes for hot queries", [
+        "CREATE INDEX IF NOT EXISTS idx_reaction_roles_message ON reaction_roles (guild_id, message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_user ON warnings (guild_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_user_levels_xp ON user_levels (guild_id, xp DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_announcements_due ON scheduled_announcements (enabled, next_run)",
+        "CREATE INDEX IF NOT EXISTS idx_muted_users_unmute ON muted_users (unmute_time)",
+    ], True),
+    (2, "Switch to WAL journal mode", [
+        "PRAGMA journal_mode = WAL",
+    ], False),
+    (3, "Add cron schedules to announcements", [
+        "ALTER TABLE scheduled_announcements ADD COLUMN cron TEXT",
+    ], True),
+    (4, "Add per-guild message pipeline stage toggles", [
+        "ALTER TABLE server_settings ADD COLUMN disabled_stages TEXT",
+    ], True),
+    (5, "Add message log indexes for lookups and pruning", [
+        "CREATE INDEX IF NOT EXISTS idx_message_logs_message ON message_logs (message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_message_logs_timestamp ON message_logs (timestamp)",
+    ], True),
+    (6, "Track slash command sync hashes", [
+        """CREATE TABLE IF NOT EXISTS command_sync (
+            scope_id INTEGER PRIMARY KEY,
+            command_hash TEXT NOT NULL,
+            synced_at TEXT NOT NULL
+        )""",
+    ], True),
+    (7, "Add per-guild leveling policy", [
+        "ALTER TABLE server_settings ADD COLUMN xp_cooldown INTEGER DEFAULT 60",
+        "ALTER TABLE server_settings ADD COLUMN xp_min INTEGER DEFAULT 15",
+        "ALTER TABLE server_settings ADD COLUMN xp_max INTEGER DEFAULT 25",
+        "ALTER TABLE server_settings ADD COLUMN xp_channel_multipliers TEXT",
+        "ALTER TABLE server_settings ADD COLUMN xp_role_multipliers TEXT",
+        "ALTER TABLE server_settings ADD COLUMN no_xp_channels TEXT",
+        # Guilds the bot already knows keep the old flat 10 XP per message with no cooldown;
+        # the column defaults above only apply to guilds added after the upgrade
+        "UPDATE server_settings SET xp_cooldown = 0, xp_min = 10, xp_max = 10",
+    ], True),
+    (8, "Add work leases for multi-process coordination", [
+        """CREATE TABLE IF NOT EXISTS work_leases (
+            resource TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_work_leases_owner ON work_leases (owner)",
+    ], True),
+    # idx_warnings_user already serves keyset paging on id: SQLite indexes end with the rowid
+    (9, "Add warning counters and escalation rules", [
+        """CREATE TABLE IF NOT EXISTS warning_counts (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS warning_buckets (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, hour)
+        )""",
+        """INSERT INTO warning_counts (guild_id, user_id, total)
+            SELECT guild_id, user_id, COUNT(*) FROM warnings GROUP BY guild_id, user_id""",
+        """INSERT INTO warning_buckets (guild_id, user_id, hour, count)
+            SELECT guild_id, user_id, CAST(strftime('%s', timestamp) AS INTEGER) / 3600, COUNT(*)
+            FROM warnings GROUP BY 1, 2, 3""",
+        "ALTER TABLE server_settings ADD COLUMN warn_escalations TEXT",
+    ], True),
+    (10, "Add warning expiry and the warnings archive", [
+        """CREATE TABLE IF NOT EXISTS warnings_archive (
+            id INTEGER PRIMARY KEY,
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            moderator_id INTEGER NOT NULL,
+            reason TEXT,
+            timestamp TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_archive_user ON warnings_archive (guild_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_guild_time ON warnings (guild_id, timestamp)",
+        "ALTER TABLE server_settings ADD COLUMN warn_expiry_days INTEGER",
+    ], True),
+    (11, "Add profanity word-boundary and leetspeak options", [
+        "ALTER TABLE automod_config ADD COLUMN profanity_word_boundary INTEGER DEFAULT 0",
+        "ALTER TABLE automod_config ADD COLUMN profanity_leetspeak INTEGER DEFAULT 0",
+    ], True),
+]
+
+
+def hour_bucket(when) -> int:
+    """Hours since the epoch for a naive UTC datetime: the warning_buckets key."""
+    from datetime import timezone
+    return int(when.replace(tzinfo=timezone.utc).timestamp()) // 3600
+
+
+def warning_counter_deltas(rows: List[Dict]) -> Tuple[Dict[int, int], Dict[Tuple[int, int], int]]:
+    """Count warning rows per user and per (user, hour bucket), for taking them off the counters."""
+    from datetime import datetime
+    per_user: Dict[int, int] = {}
+    per_bucket: Dict[Tuple[int, int], int] = {}
+    for row in rows:
+        user_id = row['user_id']
+        bucket = (user_id, hour_bucket(datetime.fromisoformat(row['timestamp'])))
+        per_user[user_id] = per_user.get(user_id, 0) + 1
+        per_bucket[bucket] = per_bucket.get(bucket, 0) + 1
+    return per_user, per_bucket
+
+
+def check_setting_name(setting: str, allowed: Dict):
+    """Reject column names that aren't known settings before they are put into SQL."""
+    if setting not in allowed:
+        raise ValueError(f"Unknown setting: {setting}")
+
+
+def normalize_server_settings(settings: Dict) -> Dict:
+    """Ensure unset IDs are None (not empty strings or 0)."""
+    for key in OPTIONAL_ID_SETTINGS:
+        if key in settings and (settings[key] == 0 or settings[key] == ''):
+            settings[key] = None
+    return settings
+
 
 class Database:
-    def __init__(self):
+    def __init__(self, path: str = DB_PATH, read_only: bool = False):
+        self.path = path
         self.conn = None
-        self.init_database()
+        self.transaction_depth = 0
+        if read_only:
+            self.connect_read_only()
+        else:
+            self.init_database()
+    
+    def connect_read_only(self):
+        """Open a read-only connection to an existing database."""
+        uri = Path(self.path).resolve().as_uri() + "?mode=ro"
+        self.conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.configure_connection()
+    
+    def configure_connection(self):
+        """Apply per-connection performance pragmas."""
+        self.conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        self.conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        self.conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+        # Lets upserts compute the level in the same statement as the XP
+        self.conn.create_function("xp_level", 1, Database.calculate_level, deterministic=True)
     
     def init_database(self):
         """Initialize database and create tables if they don't exist."""
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row  # Return rows as dictionaries
+        self.configure_connection()
         cursor = self.conn.cursor()
         
         # Server settings table
@@ -150,47 +358,130 @@ class Database:
         """)
         
         self.conn.commit()
+        self.migrate()
         print("✅ Database initialized successfully")
     
+    def get_schema_version(self) -> int:
+        """Get the schema version recorded in the database."""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    def migrate(self):
+        """Apply every migration newer than the recorded schema version, in order."""
+        version = self.get_schema_version()
+        for target, description, statements, transactional in MIGRATIONS:
+            if target <= version:
+                continue
+            try:
+                if transactional:
+                    self._rollback_stray_transaction()
+                    # IMMEDIATE takes the write lock first, so processes starting together apply it once
+                    self.conn.execute("BEGIN IMMEDIATE")
+                    if self.get_schema_version() >= target:
+                        self.conn.rollback()
+                        version = target
+                        continue
+                for statement in statements:
+                    self.conn.execute(statement)
+                self.conn.execute(f"PRAGMA user_version = {int(target)}")
+                self.conn.commit()
+            except Exception:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                raise
+            version = target
+            print(f"✅ Applied migration {target}: {description}")
+    
+    # Transactions
+    def begin_transaction(self):
+        """Open a transaction, or a savepoint when one is already open."""
+        if self.transaction_depth == 0:
+            self._rollback_stray_transaction()
+            # IMMEDIATE takes the write lock up front instead of failing on the first write
+            self.conn.execute("BEGIN IMMEDIATE")
+        else:
+            self.conn.execute(f"SAVEPOINT sp_{self.transaction_depth}")
+        self.transaction_depth += 1
+    
+    def end_transaction(self, success: bool = True):
+        """Commit or roll back the innermost transaction or savepoint."""
+        self.transaction_depth -= 1
+        depth = self.transaction_depth
+        if depth == 0:
+            if success:
+                self.conn.commit()
+            else:
+                self.conn.rollback()
+        else:
+            if not success:
+                self.conn.execute(f"ROLLBACK TO sp_{depth}")
+            self.conn.execute(f"RELEASE sp_{depth}")
+    
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Group writes into one commit: `with db.transaction(): ...`. Methods called inside
+        join it instead of committing. Nested blocks become savepoints, so an exception
+        only undoes the innermost block it escapes.
+        """
+        self.begin_transaction()
+        try:
+            yield self
+        except BaseException:
+            self.end_transaction(False)
+            raise
+        self.end_transaction(True)
+    
+    def _commit(self):
+        """Commit, unless an outer transaction() will commit for us."""
+        if self.transaction_depth == 0:
+            self.conn.commit()
+    
+    def _rollback(self):
+        """Roll back a failed write, unless it ran inside transaction() (SQLite only undid the statement)."""
+        if self.transaction_depth == 0:
+            self.conn.rollback()
+    
+    def _rollback_stray_transaction(self):
+        """
+        Roll back a transaction sqlite3 opened implicitly and nobody closed, since BEGIN fails
+        while one is open. Its writes are half-done work from a failed call, so they are dropped.
+        """
+        if self.conn.in_transaction:
+            print("⚠️ Rolling back an unfinished database transaction (a failed write left it open)")
+            self.conn.rollback()
+    
     # Server Settings Methods
     def get_server_settings(self, guild_id: int) -> Dict:
-        """Get server settings or create default."""
+        """Get server settings, or the defaults if the guild has none stored (never writes)."""
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM server_settings WHERE guild_id = ?", (guild_id,))
         row = cursor.fetchone()
-        
         if row:
-            settings = dict(row)
-            # Ensure None values are properly None (not empty strings or 0)
-            for key in ['welcome_channel_id', 'goodbye_channel_id', 'log_channel_id', 'autorole_id', 'suggestion_channel_id']:
-                if key in settings and (settings[key] == 0 or settings[key] == ''):
-                    settings[key] = None
-            return settings
-        else:
-            # Create default settings
-            cursor.execute("""
-                INSERT INTO server_settings (guild_id) VALUES (?)
-            """, (guild_id,))
-            self.conn.commit()
-            return self.get_server_settings(guild_id)
+            return normalize_server_settings(dict(row))
+        return {'guild_id': guild_id, **SERVER_SETTINGS_DEFAULTS}
+    
+    def update_server_setting(self, guild_id: int, setting: str, value) -> Dict:
+        """Update a server setting in one upsert and return the updated settings."""
+        check_setting_name(setting, SERVER_SETTINGS_DEFAULTS)
+        row = self._upsert_setting("server_settings", guild_id, setting, value)
+        return normalize_server_settings(row)
     
-    def update_server_setting(self, guild_id: int, setting: str, value):
-        """Update a server setting."""
+    def _upsert_setting(self, table: str, guild_id: int, setting: str, value) -> Dict:
+        """Set one column of a per-guild row, creating the row if needed. setting must be whitelisted."""
         cursor = self.conn.cursor()
-        # First ensure row exists
-        self.get_server_settings(guild_id)
-        # Use NULL explicitly for None values
-        if value is None:
-            cursor.execute(f"UPDATE server_settings SET {setting} = NULL WHERE guild_id = ?", (guild_id,))
+        sql = f"""
+            INSERT INTO {table} (guild_id, {setting}) VALUES (?, ?)
+            ON CONFLICT (guild_id) DO UPDATE SET {setting} = excluded.{setting}
+        """
+        if SUPPORTS_RETURNING:
+            cursor.execute(sql + " RETURNING *", (guild_id, value))
+            row = dict(cursor.fetchone())
         else:
-            cursor.execute(f"UPDATE server_settings SET {setting} = ? WHERE guild_id = ?", (value, guild_id))
-        self.conn.commit()
-        
-        # Verify the update
-        cursor.execute(f"SELECT {setting} FROM server_settings WHERE guild_id = ?", (guild_id,))
-        result = cursor.fetchone()
-        if result:
-            print(f"[DB DEBUG] Updated {setting} for guild {guild_id} to: {result[0]}")
+            cursor.execute(sql, (guild_id, value))
+            cursor.execute(f"SELECT * FROM {table} WHERE guild_id = ?", (guild_id,))
+            row = dict(cursor.fetchone())
+        self._commit()
+        return row
     
     # Custom Commands Methods
     def add_custom_command(self, guild_id: int, command_name: str, response: str):
@@ -201,9 +492,10 @@ class Database:
                 INSERT INTO custom_commands (guild_id, command_name, command_response)
                 VALUES (?, ?, ?)
             """, (guild_id, command_name.lower(), response))
-            self.conn.commit()
+            self._commit()
             return True
         except sqlite3.IntegrityError:
+            self._rollback()
             return False  # Command already exists
     
     def get_custom_command(self, guild_id: int, command_name: str) -> Optional[Dict]:
@@ -224,6 +516,12 @@ class Database:
         """, (guild_id,))
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_all_custom_command_rows(self) -> List[Dict]:
+        """Get every custom command for every guild (used to warm the cache)."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM custom_commands")
+        return [dict(row) for row in cursor.fetchall()]
+    
     def delete_custom_command(self, guild_id: int, command_name: str):
         """Delete a custom command."""
         cursor = self.conn.cursor()
@@ -231,40 +529,143 @@ class Database:
             DELETE FROM custom_commands 
             WHERE guild_id = ? AND command_name = ?
         """, (guild_id, command_name.lower()))
-        self.conn.commit()
+        self._commit()
         return cursor.rowcount > 0
     
     # Warnings Methods
     def add_warning(self, guild_id: int, user_id: int, moderator_id: int, reason: str):
-        """Add a warning to a user."""
+        """Add a warning to a user and bump their warning counters."""
         cursor = self.conn.cursor()
         from datetime import datetime
-        cursor.execute("""
-            INSERT INTO warnings (guild_id, user_id, moderator_id, reason, timestamp)
-            VALUES (?, ?, ?, ?, ?)
-        """, (guild_id, user_id, moderator_id, reason, datetime.utcnow().isoformat()))
-        self.conn.commit()
-        return cursor.lastrowid
+        now = datetime.utcnow()
+        with self.transaction():
+            cursor.execute("""
+                INSERT INTO warnings (guild_id, user_id, moderator_id, reason, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """, (guild_id, user_id, moderator_id, reason, now.isoformat()))
+            warning_id = cursor.lastrowid
+            cursor.execute("""
+                INSERT INTO warning_counts (guild_id, user_id, total) VALUES (?, ?, 1)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET total = total + 1
+            """, (guild_id, user_id))
+            cursor.execute("""
+                INSERT INTO warning_buckets (guild_id, user_id, hour, count) VALUES (?, ?, ?, 1)
+                ON CONFLICT (guild_id, user_id, hour) DO UPDATE SET count = count + 1
+            """, (guild_id, user_id, hour_bucket(now)))
+        return warning_id
     
-    def get_warnings(self, guild_id: int, user_id: int) -> List[Dict]:
-        """Get all warnings for a user."""
+    def get_warnings(self, guild_id: int, user_id: int, limit: int = 10, before_id: int = None) -> List[Dict]:
+        """Get a page of a user's warnings, newest first. Pass the last id seen as before_id for the next page."""
         cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT * FROM warnings 
-            WHERE guild_id = ? AND user_id = ?
-            ORDER BY timestamp DESC
-        """, (guild_id, user_id))
+        if before_id is None:
+            cursor.execute("""
+                SELECT * FROM warnings 
+                WHERE guild_id = ? AND user_id = ?
+                ORDER BY id DESC LIMIT ?
+            """, (guild_id, user_id, limit))
+        else:
+            cursor.execute("""
+                SELECT * FROM warnings 
+                WHERE guild_id = ? AND user_id = ? AND id < ?
+                ORDER BY id DESC LIMIT ?
+            """, (guild_id, user_id, before_id, limit))
         return [dict(row) for row in cursor.fetchall()]
     
-    def clear_warnings(self, guild_id: int, user_id: int):
-        """Clear all warnings for a user."""
+    def get_warning_counts(self, guild_id: int, user_id: int, window_hours: List[int] = ()) -> Dict:
+        """
+        Get a user's warning total and their counts within each window, from the counters.
+        Windows are whole hours and include the current hour, so they can run up to an hour long.
+        """
         cursor = self.conn.cursor()
         cursor.execute("""
-            DELETE FROM warnings WHERE guild_id = ? AND user_id = ?
+            SELECT total FROM warning_counts WHERE guild_id = ? AND user_id = ?
         """, (guild_id, user_id))
-        self.conn.commit()
+        row = cursor.fetchone()
+        counts = {'total': row['total'] if row else 0, 'recent': {}}
+        if window_hours:
+            from datetime import datetime
+            current = hour_bucket(datetime.utcnow())
+            cursor.execute("""
+                SELECT hour, count FROM warning_buckets
+                WHERE guild_id = ? AND user_id = ? AND hour >= ?
+            """, (guild_id, user_id, current - max(window_hours)))
+            buckets = cursor.fetchall()
+            for hours in window_hours:
+                counts['recent'][hours] = sum(b['count'] for b in buckets if b['hour'] >= current - hours)
+        return counts
+    
+    def clear_warnings(self, guild_id: int, user_id: int):
+        """Clear all warnings (and warning counters) for a user."""
+        cursor = self.conn.cursor()
+        with self.transaction():
+            cursor.execute("""
+                DELETE FROM warnings WHERE guild_id = ? AND user_id = ?
+            """, (guild_id, user_id))
+            count = cursor.rowcount
+            cursor.execute("DELETE FROM warning_counts WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+            cursor.execute("DELETE FROM warning_buckets WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+        return count
+    
+    def prune_warning_buckets(self, before_hour: int) -> int:
+        """Delete hourly warning counts older than every escalation window."""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM warning_buckets WHERE hour < ?", (before_hour,))
+        self._commit()
         return cursor.rowcount
     
+    def get_warning_expiry_days(self) -> Dict[int, int]:
+        """Get {guild_id: days} for every guild whose warnings expire."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT guild_id, warn_expiry_days FROM server_settings WHERE warn_expiry_days > 0")
+        return {row['guild_id']: row['warn_expiry_days'] for row in cursor.fetchall()}
+    
+    def archive_warnings(self, guild_id: int, before: str, limit: int) -> int:
+        """
+        Move up to limit of a guild's warnings older than the ISO timestamp into warnings_archive,
+        taking them off the warning counters. Returns the number moved.
+        """
+        from datetime import datetime
+        cursor = self.conn.cursor()
+        with self.transaction():
+            cursor.execute("""
+                SELECT * FROM warnings WHERE guild_id = ? AND timestamp < ?
+                ORDER BY timestamp LIMIT ?
+            """, (guild_id, before, limit))
+            rows = [dict(row) for row in cursor.fetchall()]
+            if not rows:
+                return 0
+            archived_at = datetime.utcnow().isoformat()
+            cursor.executemany("""
+                INSERT INTO warnings_archive (id, guild_id, user_id, moderator_id, reason, timestamp, archived_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(r['id'], r['guild_id'], r['user_id'], r['moderator_id'], r['reason'], r['timestamp'], archived_at)
+                  for r in rows])
+            cursor.executemany("DELETE FROM warnings WHERE id = ?", [(r['id'],) for r in rows])
+            
+            per_user, per_bucket = warning_counter_deltas(rows)
+            cursor.executemany("""
+                UPDATE warning_counts SET total = MAX(total - ?, 0) WHERE guild_id = ? AND user_id = ?
+            """, [(count, guild_id, user_id) for user_id, count in per_user.items()])
+            cursor.executemany("""
+                DELETE FROM warning_counts WHERE guild_id = ? AND user_id = ? AND total = 0
+            """, [(guild_id, user_id) for user_id in per_user])
+            # Buckets may already be pruned; the ones still there would otherwise keep counting
+            cursor.executemany("""
+                UPDATE warning_buckets SET count = count - ? WHERE guild_id = ? AND user_id = ? AND hour = ?
+            """, [(count, guild_id, user_id, hour) for (user_id, hour), count in per_bucket.items()])
+            cursor.executemany("""
+                DELETE FROM warning_buckets WHERE guild_id = ? AND user_id = ? AND hour = ? AND count <= 0
+            """, [(guild_id, user_id, hour) for user_id, hour in per_bucket])
+        return len(rows)
+    
+    def count_warning_rows(self, guild_id: int) -> Dict:
+        """Get how many of a guild's warnings are active and how many are archived."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM warnings WHERE guild_id = ?", (guild_id,))
+        active = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM warnings_archive WHERE guild_id = ?", (guild_id,))
+        return {'active': active, 'archived': cursor.fetchone()[0]}
+    
     # Mute Methods
     def add_mute(self, guild_id: int, user_id: int, mute_role_id: int, unmute_time: str = None):
         """Add a muted user."""
@@ -273,7 +674,7 @@ class Database:
             INSERT OR REPLACE INTO muted_users (guild_id, user_id, mute_role_id, unmute_time)
             VALUES (?, ?, ?, ?)
         """, (guild_id, user_id, mute_role_id, unmute_time))
-        self.conn.commit()
+        self._commit()
     
     def remove_mute(self, guild_id: int, user_id: int):
         """Remove a muted user."""
@@ -281,7 +682,16 @@ class Database:
         cursor.execute("""
             DELETE FROM muted_users WHERE guild_id = ? AND user_id = ?
         """, (guild_id, user_id))
-        self.conn.commit()
+        self._commit()
+    
+    def get_mute(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        """Get one muted user's row."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM muted_users WHERE guild_id = ? AND user_id = ?
+        """, (guild_id, user_id))
+        row = cursor.fetchone()
+        return dict(row) if row else None
     
     def get_muted_users(self, guild_id: int) -> List[Dict]:
         """Get all muted users."""
@@ -291,6 +701,24 @@ class Database:
         """, (guild_id,))
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_timed_mutes(self) -> List[Dict]:
+        """Get every mute with an expiry time, across all guilds."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM muted_users WHERE unmute_time IS NOT NULL
+        """)
+        return [dict(row) for row in cursor.fetchall()]
+    
+    def get_unclaimed_mutes(self, now: float) -> List[Dict]:
+        """Get timed mutes that no process holds a live lease on."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT m.* FROM muted_users m
+            LEFT JOIN work_leases l ON l.resource = 'mute:' || m.guild_id || ':' || m.user_id
+            WHERE m.unmute_time IS NOT NULL AND (l.resource IS NULL OR l.expires_at < ?)
+        """, (now,))
+        return [dict(row) for row in cursor.fetchall()]
+    
     # Reaction Roles Methods
     def add_reaction_role(self, guild_id: int, message_id: int, channel_id: int, emoji: str, role_id: int):
         """Add a reaction role."""
@@ -299,7 +727,7 @@ class Database:
             INSERT INTO reaction_roles (guild_id, message_id, channel_id, emoji, role_id)
             VALUES (?, ?, ?, ?, ?)
         """, (guild_id, message_id, channel_id, emoji, role_id))
-        self.conn.commit()
+        self._commit()
         return cursor.lastrowid
     
     def get_reaction_roles(self, guild_id: int, message_id: int = None) -> List[Dict]:
@@ -316,6 +744,12 @@ class Database:
             """, (guild_id,))
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_all_reaction_role_rows(self) -> List[Dict]:
+        """Get every reaction role for every guild (used to build the index)."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM reaction_roles")
+        return [dict(row) for row in cursor.fetchall()]
+    
     def remove_reaction_role(self, guild_id: int, message_id: int, emoji: str):
         """Remove a reaction role."""
         cursor = self.conn.cursor()
@@ -323,45 +757,58 @@ class Database:
             DELETE FROM reaction_roles 
             WHERE guild_id = ? AND message_id = ? AND emoji = ?
         """, (guild_id, message_id, emoji))
-        self.conn.commit()
+        self._commit()
         return cursor.rowcount > 0
     
     # Leveling Methods
     def get_user_level(self, guild_id: int, user_id: int) -> Dict:
-        """Get user level data."""
+        """Get user level data, or the defaults if the user has none stored (never writes)."""
         cursor = self.conn.cursor()
         cursor.execute("""
             SELECT * FROM user_levels 
             WHERE guild_id = ? AND user_id = ?
         """, (guild_id, user_id))
         row = cursor.fetchone()
-        
         if row:
             return dict(row)
-        else:
-            # Create default
-            cursor.execute("""
-                INSERT INTO user_levels (guild_id, user_id) VALUES (?, ?)
-            """, (guild_id, user_id))
-            self.conn.commit()
-            return {'guild_id': guild_id, 'user_id': user_id, 'xp': 0, 'level': 1, 'total_messages': 0}
+        return {'guild_id': guild_id, 'user_id': user_id, **USER_LEVEL_DEFAULTS}
     
     def add_xp(self, guild_id: int, user_id: int, xp: int):
-        """Add XP to a user."""
+        """Add XP to a user, updating their level in the same statement."""
         cursor = self.conn.cursor()
-        data = self.get_user_level(guild_id, user_id)
-        new_xp = data['xp'] + xp
-        new_level = self.calculate_level(new_xp)
-        
-        cursor.execute("""
-            UPDATE user_levels 
-            SET xp = ?, level = ?, total_messages = total_messages + 1
-            WHERE guild_id = ? AND user_id = ?
-        """, (new_xp, new_level, guild_id, user_id))
-        self.conn.commit()
-        
-        leveled_up = new_level > data['level']
-        return {'level': new_level, 'xp': new_xp, 'leveled_up': leveled_up}
+        sql = """
+            INSERT INTO user_levels (guild_id, user_id, xp, level, total_messages)
+            VALUES (?, ?, ?, xp_level(?), 1)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                xp = xp + excluded.xp,
+                level = xp_level(xp + excluded.xp),
+                total_messages = total_messages + 1
+        """
+        params = (guild_id, user_id, xp, xp)
+        if SUPPORTS_RETURNING:
+            cursor.execute(sql + " RETURNING xp, level", params)
+            row = cursor.fetchone()
+        else:
+            cursor.execute(sql, params)
+            cursor.execute("SELECT xp, level FROM user_levels WHERE guild_id = ? AND user_id = ?", (guild_id, user_id))
+            row = cursor.fetchone()
+        self._commit()
+        new_xp, new_level = row['xp'], row['level']
+        old_level = self.calculate_level(new_xp - xp)
+        return {'level': new_level, 'xp': new_xp, 'leveled_up': new_level > old_level}
+    
+    def save_user_levels(self, rows: List[Dict]):
+        """Write a batch of user level rows in a single transaction."""
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO user_levels (guild_id, user_id, xp, level, total_messages)
+            VALUES (:guild_id, :user_id, :xp, :level, :total_messages)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                xp = excluded.xp,
+                level = excluded.level,
+                total_messages = excluded.total_messages
+        """, rows)
+        self._commit()
     
     @staticmethod
     def calculate_level(xp: int) -> int:
@@ -380,6 +827,12 @@ class Database:
         """, (guild_id, limit))
         return [dict(row) for row in cursor.fetchall()]
     
+    def get_all_user_xp(self) -> List[Dict]:
+        """Get XP for every user in every guild (used to build the rank index)."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT guild_id, user_id, xp FROM user_levels")
+        return [dict(row) for row in cursor.fetchall()]
+    
     # AFK Methods
     def set_afk(self, guild_id: int, user_id: int, message: str):
         """Set user as AFK."""
@@ -389,7 +842,7 @@ class Database:
             INSERT OR REPLACE INTO afk_users (guild_id, user_id, afk_message, afk_since)
             VALUES (?, ?, ?, ?)
         """, (guild_id, user_id, message, datetime.utcnow().isoformat()))
-        self.conn.commit()
+        self._commit()
     
     def remove_afk(self, guild_id: int, user_id: int):
         """Remove user from AFK."""
@@ -397,7 +850,7 @@ class Database:
         cursor.execute("""
             DELETE FROM afk_users WHERE guild_id = ? AND user_id = ?
         """, (guild_id, user_id))
-        self.conn.commit()
+        self._commit()
     
     def is_afk(self, guild_id: int, user_id: int) -> Optional[Dict]:
         """Check if user is AFK."""
@@ -409,25 +862,34 @@ class Database:
         row = cursor.fetchone()
         return dict(row) if row else None
     
+    def get_all_afk_rows(self) -> List[Dict]:
+        """Get every AFK user for every guild (used to warm the registry)."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT * FROM afk_users")
+        return [dict(row) for row in cursor.fetchall()]
+    
     # Scheduled Announcements
-    def add_scheduled_announcement(self, guild_id: int, channel_id: int, message: str, interval_minutes: int):
-        """Add a scheduled announcement."""
+    def add_scheduled_announcement(self, guild_id: int, channel_id: int, message: str, interval_minutes: int,
+                                   cron: str = None, next_run: str = None):
+        """Add a scheduled announcement (interval-based, or cron-based with next_run given)."""
         cursor = self.conn.cursor()
         from datetime import datetime, timedelta
-        next_run = (datetime.utcnow() + timedelta(minutes=interval_minutes)).isoformat()
+        if next_run is None:
+            next_run = (datetime.utcnow() + timedelta(minutes=interval_minutes)).isoformat()
         cursor.execute("""
             INSERT INTO scheduled_announcements 
-            (guild_id, channel_id, message, interval_minutes, next_run)
-            VALUES (?, ?, ?, ?, ?)
-        """, (guild_id, channel_id, message, interval_minutes, next_run))
-        self.conn.commit()
+            (guild_id, channel_id, message, interval_minutes, next_run, cron)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (guild_id, channel_id, message, interval_minutes, next_run, cron))
+        self._commit()
         return cursor.lastrowid
     
-    def get_due_announcements(self) -> List[Dict]:
+    def get_due_announcements(self, now: str = None) -> List[Dict]:
         """Get announcements that are due to run."""
         cursor = self.conn.cursor()
         from datetime import datetime
-        now = datetime.utcnow().isoformat()
+        if now is None:
+            now = datetime.utcnow().isoformat()
         cursor.execute("""
             SELECT * FROM scheduled_announcements 
             WHERE enabled = 1 AND next_run <= ?
@@ -446,34 +908,301 @@ class Database:
             cursor.execute("""
                 UPDATE scheduled_announcements SET next_run = ? WHERE id = ?
             """, (next_run, announcement_id))
-            self.conn.commit()
+            self._commit()
+    
+    def update_announcement_next_runs(self, updates: List[Tuple[str, int]]):
+        """Set next_run for several announcements in one transaction. Takes (next_run, id) pairs."""
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            UPDATE scheduled_announcements SET next_run = ? WHERE id = ?
+        """, updates)
+        self._commit()
+    
+    def get_next_announcement_run(self) -> Optional[str]:
+        """Get the earliest next_run of any enabled announcement."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT MIN(next_run) FROM scheduled_announcements WHERE enabled = 1
+        """)
+        return cursor.fetchone()[0]
+    
+    # Work Leases (one owner per resource across processes)
+    def claim_leases(self, resources: List[str], owner: str, expires_at: float, now: float) -> List[str]:
+        """Claim or extend leases that are free, expired or already ours. Returns the ones we hold."""
+        cursor = self.conn.cursor()
+        claimed = []
+        for resource in resources:
+            cursor.execute("""
+                INSERT INTO work_leases (resource, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (resource) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE work_leases.owner = excluded.owner OR work_leases.expires_at < ?
+            """, (resource, owner, expires_at, now))
+            if cursor.rowcount:
+                claimed.append(resource)
+        self._commit()
+        return claimed
+    
+    def renew_leases(self, owner: str, expires_at: float, now: float) -> List[str]:
+        """Extend every live lease held by owner (the heartbeat). Returns the leases still held."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            UPDATE work_leases SET expires_at = ? WHERE owner = ? AND expires_at >= ?
+        """, (expires_at, owner, now))
+        cursor.execute("SELECT resource FROM work_leases WHERE owner = ? AND expires_at >= ?", (owner, now))
+        held = [row[0] for row in cursor.fetchall()]
+        self._commit()
+        return held
+    
+    def release_leases(self, owner: str, resources: List[str] = None) -> int:
+        """Release some (or all) of owner's leases."""
+        cursor = self.conn.cursor()
+        if resources is None:
+            cursor.execute("DELETE FROM work_leases WHERE owner = ?", (owner,))
+        else:
+            cursor.executemany("""
+                DELETE FROM work_leases WHERE resource = ? AND owner = ?
+            """, [(resource, owner) for resource in resources])
+        self._commit()
+        return cursor.rowcount
+    
+    def prune_leases(self, before: float) -> int:
+        """Delete leases that expired before the given time."""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM work_leases WHERE expires_at < ?", (before,))
+        self._commit()
+        return cursor.rowcount
+    
+    # Message Logs
+    def add_message_logs(self, rows: List[Dict]):
+        """Insert a batch of message log rows in a single transaction."""
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO message_logs (guild_id, user_id, channel_id, message_id, content, action, timestamp)
+            VALUES (:guild_id, :user_id, :channel_id, :message_id, :content, :action, :timestamp)
+        """, rows)
+        self._commit()
+    
+    def get_logged_message(self, message_id: int) -> Optional[Dict]:
+        """Get the latest logged state of a message."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT * FROM message_logs WHERE message_id = ?
+            ORDER BY id DESC LIMIT 1
+        """, (message_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+    
+    def prune_message_logs(self, before: str) -> int:
+        """Delete message logs older than the given ISO timestamp."""
+        cursor = self.conn.cursor()
+        cursor.execute("DELETE FROM message_logs WHERE timestamp < ?", (before,))
+        self._commit()
+        return cursor.rowcount
+    
+    # Command Sync
+    def get_command_sync_hashes(self) -> Dict[int, str]:
+        """Get the last synced command hash per scope (0 = global, otherwise guild ID)."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT scope_id, command_hash FROM command_sync")
+        return {row['scope_id']: row['command_hash'] for row in cursor.fetchall()}
+    
+    def set_command_sync_hash(self, scope_id: int, command_hash: str):
+        """Record the command hash that was just synced for a scope."""
+        cursor = self.conn.cursor()
+        from datetime import datetime
+        cursor.execute("""
+            INSERT OR REPLACE INTO command_sync (scope_id, command_hash, synced_at)
+            VALUES (?, ?, ?)
+        """, (scope_id, command_hash, datetime.utcnow().isoformat()))
+        self._commit()
     
     # Auto-mod Config
     def get_automod_config(self, guild_id: int) -> Dict:
-        """Get auto-mod configuration."""
+        """Get auto-mod configuration, or the defaults if the guild has none stored (never writes)."""
         cursor = self.conn.cursor()
         cursor.execute("SELECT * FROM automod_config WHERE guild_id = ?", (guild_id,))
         row = cursor.fetchone()
-        
         if row:
             return dict(row)
-        else:
-            # Create default
-            cursor.execute("""
-                INSERT INTO automod_config (guild_id) VALUES (?)
-            """, (guild_id,))
-            self.conn.commit()
-            return self.get_automod_config(guild_id)
+        return {'guild_id': guild_id, **AUTOMOD_DEFAULTS}
     
-    def update_automod_setting(self, guild_id: int, setting: str, value):
-        """Update auto-mod setting."""
-        cursor = self.conn.cursor()
-        self.get_automod_config(guild_id)  # Ensure exists
-        cursor.execute(f"UPDATE automod_config SET {setting} = ? WHERE guild_id = ?", (value, guild_id))
-        self.conn.commit()
+    def update_automod_setting(self, guild_id: int, setting: str, value) -> Dict:
+        """Update an auto-mod setting in one upsert and return the updated config."""
+        check_setting_name(setting, AUTOMOD_DEFAULTS)
+        return self._upsert_setting("automod_config", guild_id, setting, value)
     
     def close(self):
         """Close database connection."""
         if self.conn:
             self.conn.close()
 
+
+def _reader(name: str):
+    """Build an AsyncDatabase method that runs a Database read on the reader pool."""
+    async def method(self, *args, **kwargs):
+        return await self.read(getattr(Database, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Database, name).__doc__
+    return method
+
+
+def _writer(name: str):
+    """Build an AsyncDatabase method that runs a Database write on the writer thread."""
+    async def method(self, *args, **kwargs):
+        return await self.write(getattr(Database, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(Database, name).__doc__
+    return method
+
+
+class AsyncDatabase(StorageBackend):
+    """
+    SQLite storage backend for use inside the event loop.
+    All writes go through one dedicated writer thread in submission order, so
+    writes for a guild are applied in the order they were awaited. Reads run
+    on a small pool of read-only connections. `self.sync` is the plain
+    synchronous Database for scripts and shutdown code.
+    
+    `async with db.transaction():` runs the task's writes (and reads, so it sees
+    its own writes) on the writer connection as one commit. Writes from other
+    tasks wait until it ends rather than joining it.
+    """
+    
+    def __init__(self, path: str = DB_PATH, readers: int = 4):
+        self.path = path
+        self.sync = Database(path)
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._local = threading.local()
+        self._reader_dbs: List[Database] = []
+        self._reader_lock = threading.Lock()
+        self._transaction_lock = asyncio.Lock()
+        self._in_transaction = contextvars.ContextVar(f"db_transaction_{id(self)}", default=False)
+    
+    def _reader_db(self) -> Database:
+        """Get the read-only connection owned by the current reader thread."""
+        reader = getattr(self._local, "db", None)
+        if reader is None:
+            reader = Database(self.path, read_only=True)
+            self._local.db = reader
+            with self._reader_lock:
+                self._reader_dbs.append(reader)
+        return reader
+    
+    async def write(self, fn: Callable, *args, **kwargs):
+        """Run fn(database, *args) on the writer thread."""
+        if self._transaction_lock.locked() and not self._in_transaction.get():
+            # Another task has a transaction open; don't slip this write into it
+            async with self._transaction_lock:
+                future = self._submit_write(fn, *args, **kwargs)
+            return await future
+        return await self._submit_write(fn, *args, **kwargs)
+    
+    def _submit_write(self, fn: Callable, *args, **kwargs) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._writer, functools.partial(fn, self.sync, *args, **kwargs))
+    
+    async def read(self, fn: Callable, *args, **kwargs):
+        """Run fn(database, *args) on a read-only connection."""
+        if self._in_transaction.get():
+            # Readers can't see uncommitted writes, so stay on the transaction's connection
+            return await self._submit_write(fn, *args, **kwargs)
+        def run():
+            return fn(self._reader_db(), *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, run)
+    
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """
+        Group this task's database calls into one commit. Nested blocks become savepoints.
+        Don't await other tasks' database calls inside the block; they wait for it to end.
+        """
+        outer = not self._in_transaction.get()
+        if outer:
+            await self._transaction_lock.acquire()
+        token = self._in_transaction.set(True)
+        try:
+            await self._submit_write(Database.begin_transaction)
+            try:
+                yield self
+            except BaseException:
+                await self._submit_write(Database.end_transaction, False)
+                raise
+            await self._submit_write(Database.end_transaction, True)
+        finally:
+            self._in_transaction.reset(token)
+            if outer:
+                self._transaction_lock.release()
+    
+    get_server_settings = _reader("get_server_settings")
+    update_server_setting = _writer("update_server_setting")
+    
+    add_custom_command = _writer("add_custom_command")
+    get_custom_command = _reader("get_custom_command")
+    get_all_custom_commands = _reader("get_all_custom_commands")
+    get_all_custom_command_rows = _reader("get_all_custom_command_rows")
+    delete_custom_command = _writer("delete_custom_command")
+    
+    add_warning = _writer("add_warning")
+    get_warnings = _reader("get_warnings")
+    get_warning_counts = _reader("get_warning_counts")
+    clear_warnings = _writer("clear_warnings")
+    prune_warning_buckets = _writer("prune_warning_buckets")
+    get_warning_expiry_days = _reader("get_warning_expiry_days")
+    archive_warnings = _writer("archive_warnings")
+    count_warning_rows = _reader("count_warning_rows")
+    
+    add_mute = _writer("add_mute")
+    remove_mute = _writer("remove_mute")
+    get_mute = _reader("get_mute")
+    get_muted_users = _reader("get_muted_users")
+    get_timed_mutes = _reader("get_timed_mutes")
+    get_unclaimed_mutes = _reader("get_unclaimed_mutes")
+    
+    add_reaction_role = _writer("add_reaction_role")
+    get_reaction_roles = _reader("get_reaction_roles")
+    get_all_reaction_role_rows = _reader("get_all_reaction_role_rows")
+    remove_reaction_role = _writer("remove_reaction_role")
+    
+    get_user_level = _reader("get_user_level")
+    add_xp = _writer("add_xp")
+    save_user_levels = _writer("save_user_levels")
+    get_leaderboard = _reader("get_leaderboard")
+    get_all_user_xp = _reader("get_all_user_xp")
+    
+    set_afk = _writer("set_afk")
+    remove_afk = _writer("remove_afk")
+    is_afk = _reader("is_afk")
+    get_all_afk_rows = _reader("get_all_afk_rows")
+    
+    add_scheduled_announcement = _writer("add_scheduled_announcement")
+    get_due_announcements = _reader("get_due_announcements")
+    update_announcement_next_run = _writer("update_announcement_next_run")
+    update_announcement_next_runs = _writer("update_announcement_next_runs")
+    get_next_announcement_run = _reader("get_next_announcement_run")
+    
+    claim_leases = _writer("claim_leases")
+    renew_leases = _writer("renew_leases")
+    release_leases = _writer("release_leases")
+    prune_leases = _writer("prune_leases")
+    
+    add_message_logs = _writer("add_message_logs")
+    get_logged_message = _reader("get_logged_message")
+    prune_message_logs = _writer("prune_message_logs")
+    
+    get_command_sync_hashes = _reader("get_command_sync_hashes")
+    set_command_sync_hash = _writer("set_command_sync_hash")
+    
+    get_automod_config = _reader("get_automod_config")
+    update_automod_setting = _writer("update_automod_setting")
+    
+    def close(self):
+        """Wait for pending work, then close every connection."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        with self._reader_lock:
+            for reader in self._reader_dbs:
+                reader.close()
+            self._reader_dbs.clear()
+        self.sync.close()
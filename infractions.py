@@ -0,0 +1,168 @@
+"""
+Warning escalation policy and expiry.
+Guilds set rules like "3 warnings within 24 hours: mute for 60 minutes". Rules are checked
+against the per-user warning counters the database keeps (a running total plus hourly
+buckets), so issuing a warning never reads the user's warning history.
+Guilds can also let warnings expire. The compactor moves expired warnings into
+warnings_archive in batches, so they stop counting and history queries only see active rows.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from storage import StorageBackend
+
+# Actions in increasing severity
+ESCALATION_ACTIONS = ('mute', 'kick', 'ban')
+
+# Longest escalation window. Hourly warning buckets older than this are pruned.
+MAX_WINDOW_HOURS = 24 * 30
+
+# Warnings shown per /warnings page
+HISTORY_PAGE_SIZE = 10
+
+# Warnings archived per transaction, and batches per guild per compaction pass
+COMPACTION_BATCH_SIZE = 500
+COMPACTION_MAX_BATCHES = 20
+
+
+class EscalationRule:
+    """Take an action once a user has `count` warnings within `window_hours` (0 = ever)."""
+
+    __slots__ = ('count', 'window_hours', 'action', 'duration')
+
+    def __init__(self, count: int, window_hours: int, action: str, duration: int = 0):
+        if action not in ESCALATION_ACTIONS:
+            raise ValueError(f"Unknown escalation action: {action}")
+        self.count = count
+        self.window_hours = window_hours
+        self.action = action
+        self.duration = duration if action == 'mute' else 0  # Mute minutes, 0 = permanent
+
+    @property
+    def severity(self):
+        return ESCALATION_ACTIONS.index(self.action), self.duration == 0, self.duration
+
+    def describe(self) -> str:
+        window = f" within {format_window(self.window_hours)}" if self.window_hours else ""
+        action = self.action
+        if self.action == 'mute':
+            action = f"mute for {self.duration} minutes" if self.duration else "permanent mute"
+        return f"{self.count} warning(s){window}: {action}"
+
+
+def format_window(hours: int) -> str:
+    if hours % 24 == 0:
+        return f"{hours // 24} day(s)"
+    return f"{hours} hour(s)"
+
+
+def parse_escalations(value: Optional[str]) -> List[EscalationRule]:
+    """Parse a "count/hours:action[:minutes]" list from the database."""
+    rules = []
+    if not value:
+        return rules
+    for item in value.split(','):
+        parts = item.strip().split(':')
+        if len(parts) < 2:
+            continue
+        count, _, hours = parts[0].partition('/')
+        duration = int(parts[2]) if len(parts) > 2 else 0
+        rules.append(EscalationRule(int(count), int(hours or 0), parts[1], duration))
+    return rules
+
+
+def format_escalations(rules: Iterable[EscalationRule]) -> Optional[str]:
+    """Format rules for storage (None when empty)."""
+    items = []
+    for rule in sorted(rules, key=lambda r: (r.count, r.window_hours)):
+        item = f"{rule.count}/{rule.window_hours}:{rule.action}"
+        if rule.duration:
+            item += f":{rule.duration}"
+        items.append(item)
+    return ','.join(items) or None
+
+
+def escalation_windows(rules: Iterable[EscalationRule]) -> List[int]:
+    """Windows (in hours) whose warning counts the rules need, besides the total."""
+    return sorted({rule.window_hours for rule in rules if rule.window_hours})
+
+
+def pick_escalation(rules: Iterable[EscalationRule], counts: Dict) -> Optional[EscalationRule]:
+    """
+    Get the most severe rule a user's warning counts meet, or None.
+    counts is get_warning_counts() output: {'total': n, 'recent': {window_hours: n}}.
+    """
+    matched = None
+    for rule in rules:
+        if rule.window_hours:
+            count = counts['recent'].get(rule.window_hours, 0)
+        else:
+            count = counts['total']
+        if count >= rule.count and (matched is None or rule.severity > matched.severity):
+            matched = rule
+    return matched
+
+
+class WarningCompactor:
+    """Archives expired warnings for every guild with an expiry, a bounded number of batches per pass."""
+
+    def __init__(self, db: StorageBackend, batch_size: int = COMPACTION_BATCH_SIZE,
+                 max_batches: int = COMPACTION_MAX_BATCHES, owns_guild: Callable[[int], bool] = None):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_batches = max_batches  # Per guild per pass, so one big backlog can't hog the writer
+        self.owns_guild = owns_guild or (lambda guild_id: True)
+        self.archived_total = 0
+        self.archived_by_guild: Dict[int, int] = {}
+        self.backlog: List[int] = []  # Guilds that still had expired warnings when the last pass ended
+        self.passes = 0
+        self.last_run: Optional[datetime] = None
+        self.last_archived = 0
+        self.last_duration = 0.0
+        self.running = False
+
+    async def run(self) -> int:
+        """Run one compaction pass. Returns the number of warnings archived."""
+        if self.running:
+            return 0
+        self.running = True
+        started = time.monotonic()
+        archived = 0
+        backlog = []
+        try:
+            expiry = await self.db.get_warning_expiry_days()
+            for guild_id, days in expiry.items():
+                if not self.owns_guild(guild_id):
+                    continue
+                cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
+                for _ in range(self.max_batches):
+                    moved = await self.db.archive_warnings(guild_id, cutoff, self.batch_size)
+                    archived += moved
+                    self.archived_by_guild[guild_id] = self.archived_by_guild.get(guild_id, 0) + moved
+                    if moved < self.batch_size:
+                        break
+                    await asyncio.sleep(0)  # Let other writes in between batches
+                else:
+                    backlog.append(guild_id)
+        finally:
+            self.running = False
+            self.passes += 1
+            self.archived_total += archived
+            self.backlog = backlog
+            self.last_run = datetime.utcnow()
+            self.last_archived = archived
+            self.last_duration = time.monotonic() - started
+        return archived
+
+    def stats(self) -> Dict:
+        return {
+            'passes': self.passes,
+            'archived_total': self.archived_total,
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'last_archived': self.last_archived,
+            'last_duration_ms': round(self.last_duration * 1000),
+            'backlog_guilds': len(self.backlog),
+            'running': self.running,
+        }
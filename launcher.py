@@ -0,0 +1,136 @@
+"""
+Cluster launcher for sharded deployments.
+Starts several bot_advanced.py processes, each owning a contiguous range of shards, and
+restarts any process that exits unexpectedly.
+
+    python launcher.py --processes 4 --shards 16
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from sharding import format_shard_ids
+
+# Seconds to wait before restarting a process that exited
+RESTART_DELAY = 5
+
+
+def recommended_shards(token: str) -> int:
+    """Ask Discord how many shards the bot should use."""
+    request = urllib.request.Request(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={'Authorization': f"Bot {token}", 'User-Agent': "DiscordBot (launcher, 1.0)"}
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)['shards']
+
+
+def shard_ranges(shard_count: int, processes: int) -> List[List[int]]:
+    """Split shards into contiguous, evenly sized ranges, one per process."""
+    processes = min(processes, shard_count)
+    base, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for i in range(processes):
+        size = base + (1 if i < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+
+class Cluster:
+    """One bot process and the shards it owns."""
+
+    def __init__(self, cluster_id: int, shard_ids: List[int], shard_count: int, script: str):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.script = script
+        self.process: Optional[subprocess.Popen] = None
+        self.exited_at: Optional[float] = None
+
+    def start(self):
+        env = dict(os.environ)
+        env['SHARD_COUNT'] = str(self.shard_count)
+        env['SHARD_IDS'] = format_shard_ids(self.shard_ids)
+        env['CLUSTER_ID'] = str(self.cluster_id)
+        self.process = subprocess.Popen([sys.executable, self.script], env=env)
+        self.exited_at = None
+        print(f"🚀 Cluster {self.cluster_id}: started shard(s) {env['SHARD_IDS']} (pid {self.process.pid})")
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            # SIGINT lets the bot flush buffered XP and message logs before exiting
+            self.process.send_signal(signal.SIGINT)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Run the bot as a cluster of sharded processes")
+    parser.add_argument('--processes', type=int, default=int(os.getenv('CLUSTER_PROCESSES', '2')),
+                        help="Number of bot processes (default CLUSTER_PROCESSES or 2)")
+    parser.add_argument('--shards', type=int, default=int(os.getenv('SHARD_COUNT', '0') or 0),
+                        help="Total shard count (default SHARD_COUNT, or Discord's recommendation)")
+    parser.add_argument('--script', default='bot_advanced.py', help="Bot script to run")
+    args = parser.parse_args()
+
+    shard_count = args.shards
+    if not shard_count:
+        token = os.getenv('DISCORD_TOKEN')
+        if not token:
+            print("Error: DISCORD_TOKEN not found in environment variables!")
+            sys.exit(1)
+        shard_count = recommended_shards(token)
+        print(f"Discord recommends {shard_count} shard(s)")
+
+    clusters = [Cluster(i, shard_ids, shard_count, args.script)
+                for i, shard_ids in enumerate(shard_ranges(shard_count, args.processes))]
+
+    stopping = False
+
+    def handle_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    for cluster in clusters:
+        cluster.start()
+        # Stagger logins, Discord limits how fast shards can identify
+        time.sleep(RESTART_DELAY)
+        if stopping:
+            break
+
+    while not stopping:
+        for cluster in clusters:
+            if cluster.process is None or cluster.process.poll() is None:
+                continue
+            if cluster.exited_at is None:
+                cluster.exited_at = time.monotonic()
+                print(f"⚠️ Cluster {cluster.cluster_id} exited with code {cluster.process.returncode}, restarting in {RESTART_DELAY}s")
+            elif time.monotonic() - cluster.exited_at >= RESTART_DELAY:
+                cluster.start()
+        time.sleep(1)
+
+    print("Stopping clusters...")
+    for cluster in clusters:
+        cluster.stop()
+    for cluster in clusters:
+        if cluster.process:
+            try:
+                cluster.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                cluster.process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Leveling engine with an in-memory write-back XP ledger.
+Hot user rows live in memory and dirty rows are flushed to the database in batches.
+Every XP grant also moves the user in the leaderboard rank index.
+The XP policy (cooldowns, random XP ranges, multipliers, no-XP channels) is decided in
+memory before the ledger is touched, so messages on cooldown never reach the database.
+"""
+import random
+import sys
+import time
+from array import array
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import discord
+
+from automod import parse_id_list
+from database import Database
+from ranking import Leaderboard
+from storage import StorageBackend
+
+# Defaults for guilds that haven't configured leveling
+DEFAULT_COOLDOWN = 60  # Seconds between XP awards per user
+DEFAULT_XP_MIN = 15
+DEFAULT_XP_MAX = 25
+
+
+def parse_multipliers(value: Optional[str]) -> Dict[int, float]:
+    """Parse an "id:multiplier,id:multiplier" list from the database."""
+    multipliers = {}
+    if not value:
+        return multipliers
+    for item in value.split(','):
+        if ':' in item:
+            target_id, multiplier = item.split(':', 1)
+            multipliers[int(target_id)] = float(multiplier)
+    return multipliers
+
+
+def format_multipliers(multipliers: Dict[int, float]) -> Optional[str]:
+    """Format multipliers for storage (None when empty)."""
+    return ','.join(f"{target_id}:{multiplier:g}" for target_id, multiplier in sorted(multipliers.items())) or None
+
+
+class LevelingPolicy:
+    """A guild's XP rules, parsed once from its server settings."""
+
+    def __init__(self, settings: Dict):
+        self.settings = settings
+        cooldown = settings.get('xp_cooldown')
+        self.cooldown = DEFAULT_COOLDOWN if cooldown is None else cooldown
+        self.xp_min = settings.get('xp_min') or DEFAULT_XP_MIN
+        self.xp_max = max(settings.get('xp_max') or DEFAULT_XP_MAX, self.xp_min)
+        self.channel_multipliers = parse_multipliers(settings.get('xp_channel_multipliers'))
+        self.role_multipliers = parse_multipliers(settings.get('xp_role_multipliers'))
+        self.no_xp_channels = parse_id_list(settings.get('no_xp_channels'))
+
+    def earns_xp(self, channel_id: int) -> bool:
+        return channel_id not in self.no_xp_channels
+
+    def roll(self, message: discord.Message) -> int:
+        """Roll the XP for a message, applying the channel and best role multiplier."""
+        multiplier = self.channel_multipliers.get(message.channel.id, 1.0)
+        if self.role_multipliers:
+            role_multipliers = [self.role_multipliers[role.id] for role in message.author.roles
+                                if role.id in self.role_multipliers]
+            if role_multipliers:
+                multiplier *= max(role_multipliers)
+        return round(random.randint(self.xp_min, self.xp_max) * multiplier)
+
+
+class CooldownTable:
+    """Last XP award time per user in one guild, packed into an array of whole seconds."""
+
+    __slots__ = ('slots', 'stamps', 'free')
+
+    def __init__(self):
+        self.slots: Dict[int, int] = {}  # {user_id: index into stamps}
+        self.stamps = array('L')
+        self.free: List[int] = []
+
+    def try_award(self, user_id: int, now: int, cooldown: int) -> bool:
+        """Start a new cooldown and return True if the last one has passed."""
+        slot = self.slots.get(user_id)
+        if slot is None:
+            if self.free:
+                slot = self.free.pop()
+                self.stamps[slot] = now
+            else:
+                slot = len(self.stamps)
+                self.stamps.append(now)
+            self.slots[user_id] = slot
+            return True
+        if now - self.stamps[slot] < cooldown:
+            return False
+        self.stamps[slot] = now
+        return True
+
+    def sweep(self, now: int, cooldown: int) -> int:
+        """Free the slots of users whose cooldown has passed."""
+        expired = [user_id for user_id, slot in self.slots.items() if now - self.stamps[slot] >= cooldown]
+        for user_id in expired:
+            self.free.append(self.slots.pop(user_id))
+        if not self.slots:
+            self.stamps = array('L')
+            self.free.clear()
+        return len(expired)
+
+    def memory_bytes(self) -> int:
+        return (sys.getsizeof(self.slots) + sys.getsizeof(self.stamps) + sys.getsizeof(self.free)
+                + 32 * len(self.slots))  # Roughly one int object per user ID
+
+
+class XPPolicyEngine:
+    """Decides how much XP a message earns without touching the database."""
+
+    def __init__(self):
+        self.policies: Dict[int, LevelingPolicy] = {}
+        self.cooldowns: Dict[int, CooldownTable] = {}
+        self.started = time.monotonic()
+
+    def policy(self, guild_id: int, settings: Dict) -> LevelingPolicy:
+        """Get a guild's policy, rebuilding it when its settings change."""
+        policy = self.policies.get(guild_id)
+        # The settings cache hands out a new dict after every invalidation
+        if policy is None or policy.settings is not settings:
+            policy = self.policies[guild_id] = LevelingPolicy(settings)
+        return policy
+
+    def _now(self) -> int:
+        return int(time.monotonic() - self.started)
+
+    def award(self, message: discord.Message, settings: Dict) -> int:
+        """Get the XP a message earns, or 0 if it's in a no-XP channel or on cooldown."""
+        guild_id = message.guild.id
+        policy = self.policy(guild_id, settings)
+        if not policy.earns_xp(message.channel.id):
+            return 0
+        table = self.cooldowns.get(guild_id)
+        if table is None:
+            table = self.cooldowns[guild_id] = CooldownTable()
+        if not table.try_award(message.author.id, self._now(), policy.cooldown):
+            return 0
+        return policy.roll(message)
+
+    def sweep(self) -> int:
+        """Forget users whose cooldown has passed so memory stays bounded."""
+        now = self._now()
+        removed = 0
+        for guild_id, table in list(self.cooldowns.items()):
+            policy = self.policies.get(guild_id)
+            removed += table.sweep(now, policy.cooldown if policy else DEFAULT_COOLDOWN)
+            if not table.slots:
+                del self.cooldowns[guild_id]
+        return removed
+
+    def stats(self) -> Dict:
+        """Get the number of users on cooldown and an estimate of memory used."""
+        return {
+            'tracked_users': sum(len(table.slots) for table in self.cooldowns.values()),
+            'memory_bytes': sum(table.memory_bytes() for table in self.cooldowns.values()),
+        }
+
+
+class XPLedger:
+    """Write-back cache of user_levels rows keyed by (guild_id, user_id)."""
+
+    def __init__(self, db: StorageBackend, flush_interval: int = 30, max_dirty: int = 5000, max_cached: int = 100000,
+                 leaderboard: Optional[Leaderboard] = None):
+        self.db = db
+        self.leaderboard = leaderboard or Leaderboard()
+        self.flush_interval = flush_interval  # Max seconds of XP lost on a crash
+        self.max_dirty = max_dirty  # Flush early once this many rows are pending
+        self.max_cached = max_cached
+        self.rows: "OrderedDict[Tuple[int, int], Dict]" = OrderedDict()
+        self.dirty = set()
+        self.in_flight: Counter = Counter()  # Keys of rows being written, pinned until the write finishes
+        self.last_flush = time.monotonic()
+
+    async def get(self, guild_id: int, user_id: int) -> Dict:
+        """Get a user's level row, loading it from the database on a miss."""
+        key = (guild_id, user_id)
+        row = self.rows.get(key)
+        if row is None:
+            row = await self.db.get_user_level(guild_id, user_id)
+            # Another message for this user may have loaded the row while we waited
+            row = self.rows.setdefault(key, row)
+            self._evict()
+        else:
+            self.rows.move_to_end(key)
+        return row
+
+    async def add_xp(self, guild_id: int, user_id: int, xp: int) -> Dict:
+        """Add XP in memory and report whether the user leveled up."""
+        row = await self.get(guild_id, user_id)
+        old_level = row['level']
+        row['xp'] += xp
+        row['level'] = Database.calculate_level(row['xp'])
+        row['total_messages'] += 1
+        self.dirty.add((guild_id, user_id))
+        self.leaderboard.update(guild_id, user_id, row['xp'])
+        return {'level': row['level'], 'xp': row['xp'], 'leveled_up': row['level'] > old_level}
+
+    async def load_ranks(self):
+        """Rebuild the rank index from the database, keeping XP that hasn't been flushed yet."""
+        self.leaderboard.rebuild(await self.db.get_all_user_xp())
+        for (guild_id, user_id), row in self.rows.items():
+            self.leaderboard.update(guild_id, user_id, row['xp'])
+
+    def needs_flush(self) -> bool:
+        """Check if the dirty set is too large or the flush interval has passed."""
+        if not self.dirty:
+            return False
+        return (len(self.dirty) >= self.max_dirty
+                or time.monotonic() - self.last_flush >= self.flush_interval)
+
+    def take_dirty(self) -> List[Dict]:
+        """
+        Snapshot and clear the dirty rows so they can be written out. Their rows stay pinned in
+        memory until finish_flush(), so a cache miss can't reload a stale copy mid-write.
+        """
+        keys = list(self.dirty)
+        self.dirty.clear()
+        self.in_flight.update(keys)
+        self.last_flush = time.monotonic()
+        return [dict(self.rows[key]) for key in keys]
+
+    def finish_flush(self, rows: List[Dict], saved: bool):
+        """Unpin rows from take_dirty(), marking them dirty again if the write failed."""
+        keys = [(row['guild_id'], row['user_id']) for row in rows]
+        self.in_flight.subtract(keys)
+        for key in keys:
+            if self.in_flight[key] <= 0:
+                del self.in_flight[key]
+        if not saved:
+            # The next flush retries them, with any XP added since
+            self.dirty.update(keys)
+
+    async def flush(self) -> int:
+        """Write all dirty rows to the database in one transaction."""
+        rows = self.take_dirty()
+        if not rows:
+            return 0
+        saved = False
+        try:
+            await self.db.save_user_levels(rows)
+            saved = True
+        finally:
+            self.finish_flush(rows, saved)
+        return len(rows)
+
+    def flush_sync(self) -> int:
+        """Flush through the synchronous database, for use after the event loop has stopped."""
+        rows = self.take_dirty()
+        if not rows:
+            return 0
+        saved = False
+        try:
+            self.db.sync.save_user_levels(rows)
+            saved = True
+        finally:
+            self.finish_flush(rows, saved)
+        return len(rows)
+
+    def _evict(self):
+        """Drop the least recently used rows that are neither dirty nor being written, once the cache is full."""
+        excess = len(self.rows) - self.max_cached
+        if excess <= 0:
+            return
+        victims = []
+        for key in self.rows:
+            if key not in self.dirty and key not in self.in_flight:
+                victims.append(key)
+                if len(victims) == excess:
+                    break
+        # If everything left is pinned, the next flush frees it up
+        for key in victims:
+            del self.rows[key]
@@ -0,0 +1,130 @@
+"""
+Message content store for delete/edit logging.
+Recent messages are kept in a bounded per-guild LRU and written to message_logs in batches,
+so messages discord.py no longer has cached (or that predate a restart) can still be logged.
+"""
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import discord
+
+from storage import StorageBackend
+
+# Longest content kept per message, matching what fits in an embed field
+MAX_CONTENT = 1024
+
+
+class StoredMessage:
+    """The parts of a message needed to log its deletion or edit."""
+
+    __slots__ = ('message_id', 'guild_id', 'channel_id', 'user_id', 'content')
+
+    def __init__(self, message_id: int, guild_id: int, channel_id: int, user_id: int, content: str):
+        self.message_id = message_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.user_id = user_id
+        self.content = content
+
+    def to_row(self, action: str) -> Dict:
+        return {
+            'guild_id': self.guild_id, 'user_id': self.user_id, 'channel_id': self.channel_id,
+            'message_id': self.message_id, 'content': self.content, 'action': action,
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+
+
+class MessageStore:
+    """Bounded in-memory cache of message content backed by message_logs."""
+
+    def __init__(self, db: StorageBackend, per_guild: int = 2000, retention_days: int = 7):
+        self.db = db
+        self.per_guild = per_guild
+        self.retention_days = retention_days
+        self.messages: Dict[int, "OrderedDict[int, StoredMessage]"] = {}
+        self.pending: List[Dict] = []
+
+    def _remember(self, stored: StoredMessage):
+        guild_messages = self.messages.setdefault(stored.guild_id, OrderedDict())
+        guild_messages[stored.message_id] = stored
+        guild_messages.move_to_end(stored.message_id)
+        if len(guild_messages) > self.per_guild:
+            guild_messages.popitem(last=False)
+
+    def record(self, message: discord.Message):
+        """Remember a new message and queue it for the database."""
+        stored = StoredMessage(
+            message.id, message.guild.id, message.channel.id, message.author.id,
+            message.content[:MAX_CONTENT]
+        )
+        self._remember(stored)
+        self.pending.append(stored.to_row('create'))
+
+    def record_edit(self, stored: StoredMessage, content: str):
+        """Update a message's content after an edit."""
+        stored.content = content[:MAX_CONTENT]
+        self._remember(stored)
+        self.pending.append(stored.to_row('edit'))
+
+    def record_delete(self, stored: StoredMessage):
+        """Forget a deleted message, keeping its last content in the database."""
+        guild_messages = self.messages.get(stored.guild_id)
+        if guild_messages:
+            guild_messages.pop(stored.message_id, None)
+        self.pending.append(stored.to_row('delete'))
+
+    def from_message(self, message: discord.Message) -> StoredMessage:
+        """Wrap a cached discord.py message."""
+        return StoredMessage(
+            message.id, message.guild.id, message.channel.id, message.author.id,
+            (message.content or '')[:MAX_CONTENT]
+        )
+
+    async def lookup(self, guild_id: int, message_id: int) -> Optional[StoredMessage]:
+        """Find a message in memory, falling back to message_logs."""
+        stored = self.messages.get(guild_id, {}).get(message_id)
+        if stored is not None:
+            return stored
+        # It may still be waiting to be written
+        for row in reversed(self.pending):
+            if row['message_id'] == message_id:
+                return StoredMessage(row['message_id'], row['guild_id'], row['channel_id'], row['user_id'], row['content'])
+        row = await self.db.get_logged_message(message_id)
+        if row is None or row['guild_id'] != guild_id:
+            return None
+        return StoredMessage(row['message_id'], row['guild_id'], row['channel_id'], row['user_id'], row['content'])
+
+    def take_pending(self) -> List[Dict]:
+        rows, self.pending = self.pending, []
+        return rows
+
+    async def flush(self) -> int:
+        """Write queued rows to message_logs in one transaction."""
+        rows = self.take_pending()
+        if rows:
+            try:
+                await self.db.add_message_logs(rows)
+            except Exception:
+                self.pending[:0] = rows  # Retry on the next flush
+                raise
+        return len(rows)
+
+    def flush_sync(self) -> int:
+        """Flush through the synchronous database, for use after the event loop has stopped."""
+        rows = self.take_pending()
+        if rows:
+            self.db.sync.add_message_logs(rows)
+        return len(rows)
+
+    async def prune(self) -> int:
+        """Delete logged content older than the retention period."""
+        cutoff = (datetime.utcnow() - timedelta(days=self.retention_days)).isoformat()
+        return await self.db.prune_message_logs(cutoff)
+
+    def stats(self) -> Dict:
+        return {
+            'guilds': len(self.messages),
+            'messages': sum(len(m) for m in self.messages.values()),
+            'pending': len(self.pending),
+        }
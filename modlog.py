@@ -0,0 +1,104 @@
+"""
+Batched mod-log dispatcher.
+Log embeds are queued per log channel and sent up to 10 per message. When a channel falls
+too far behind (purges, raids) the backlog is sent as a single text attachment instead.
+"""
+import asyncio
+import io
+from typing import Dict, List
+
+import discord
+
+# Discord limits per message
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARS_PER_MESSAGE = 6000
+
+
+def embed_to_text(embed: discord.Embed) -> str:
+    """Render an embed as plain text for the summary attachment."""
+    lines = []
+    if embed.timestamp:
+        lines.append(embed.timestamp.strftime("%Y-%m-%d %H:%M:%S UTC"))
+    if embed.title:
+        lines.append(embed.title)
+    if embed.description:
+        lines.append(embed.description)
+    for field in embed.fields:
+        lines.append(f"{field.name}: {field.value}")
+    return "\n".join(lines)
+
+
+def pack_embeds(embeds: List[discord.Embed]) -> List[List[discord.Embed]]:
+    """Split embeds into messages that respect the per-message count and size limits."""
+    batches: List[List[discord.Embed]] = []
+    batch: List[discord.Embed] = []
+    size = 0
+    for embed in embeds:
+        embed_size = len(embed)
+        if batch and (len(batch) >= EMBEDS_PER_MESSAGE or size + embed_size > EMBED_CHARS_PER_MESSAGE):
+            batches.append(batch)
+            batch, size = [], 0
+        batch.append(embed)
+        size += embed_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+class ModLogDispatcher:
+    """Per-channel queues of log embeds, flushed on a size or time trigger."""
+
+    def __init__(self, flush_delay: float = 2.0, max_pending: int = 50):
+        self.flush_delay = flush_delay  # Seconds to wait for more entries before sending
+        self.max_pending = max_pending  # Backlog size that switches to a summary attachment
+        self.queues: Dict[int, List[discord.Embed]] = {}
+        self.channels: Dict[int, discord.abc.Messageable] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+        self.full: Dict[int, asyncio.Event] = {}
+
+    def enqueue(self, channel: discord.abc.Messageable, embed: discord.Embed):
+        """Queue an embed for a log channel."""
+        queue = self.queues.setdefault(channel.id, [])
+        queue.append(embed)
+        self.channels[channel.id] = channel
+
+        task = self.tasks.get(channel.id)
+        if task is None or task.done():
+            self.tasks[channel.id] = asyncio.create_task(self._drain(channel.id))
+        elif len(queue) >= EMBEDS_PER_MESSAGE and channel.id in self.full:
+            self.full[channel.id].set()
+
+    def pending(self) -> int:
+        """Get the number of queued embeds across all channels."""
+        return sum(len(queue) for queue in self.queues.values())
+
+    async def _drain(self, channel_id: int):
+        while self.queues.get(channel_id):
+            if len(self.queues[channel_id]) < EMBEDS_PER_MESSAGE:
+                # Give related events a moment to arrive so they share a message
+                event = self.full[channel_id] = asyncio.Event()
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.flush_delay)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    self.full.pop(channel_id, None)
+
+            embeds = self.queues.pop(channel_id, [])
+            channel = self.channels[channel_id]
+            try:
+                if len(embeds) > self.max_pending:
+                    await self._send_summary(channel, embeds)
+                else:
+                    for batch in pack_embeds(embeds):
+                        await channel.send(embeds=batch)
+            except Exception as e:
+                print(f"Error sending mod log to {channel_id}: {e}")
+
+    async def _send_summary(self, channel: discord.abc.Messageable, embeds: List[discord.Embed]):
+        text = "\n\n".join(embed_to_text(embed) for embed in embeds)
+        file = discord.File(io.BytesIO(text.encode("utf-8")), filename="mod-log.txt")
+        await channel.send(
+            content=f"📦 {len(embeds)} log entries arrived at once and were collected into one file.",
+            file=file
+        )
@@ -0,0 +1,105 @@
+"""
+Message pipeline for on_message.
+Stages run in order on a shared per-message context, stop early once a stage ends processing
+(e.g. auto-mod deleted the message), record their own timings and can be switched off per guild.
+"""
+import time
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import discord
+
+
+class MessageContext:
+    """State shared by every stage while one message is processed."""
+
+    __slots__ = ('message', 'guild_id', 'settings', 'stopped', 'deleted', 'verdict')
+
+    def __init__(self, message: discord.Message, settings: Dict):
+        self.message = message
+        self.guild_id = message.guild.id
+        self.settings = settings
+        self.stopped = False  # Set to skip every later stage
+        self.deleted = False
+        self.verdict: Optional[str] = None
+
+    def stop(self, deleted: bool = False):
+        """End processing after the current stage."""
+        self.stopped = True
+        self.deleted = self.deleted or deleted
+
+
+Stage = Callable[[MessageContext], Awaitable[None]]
+
+
+class StageStats:
+    """Call count and timing for one stage."""
+
+    __slots__ = ('calls', 'total', 'max')
+
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed: float):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    @property
+    def average(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+
+def parse_disabled_stages(value: Optional[str]) -> FrozenSet[str]:
+    """Parse the comma-separated disabled_stages setting."""
+    if not value:
+        return frozenset()
+    return frozenset(name.strip() for name in value.split(',') if name.strip())
+
+
+class MessagePipeline:
+    """An ordered list of named stages."""
+
+    def __init__(self):
+        self.stages: List[Tuple[str, Stage]] = []
+        self.stats: Dict[str, StageStats] = {}
+        self._disabled: Dict[int, Tuple[Optional[str], FrozenSet[str]]] = {}
+
+    def stage(self, name: str):
+        """Decorator that appends a stage to the pipeline."""
+        def register(func: Stage) -> Stage:
+            self.stages.append((name, func))
+            self.stats[name] = StageStats()
+            return func
+        return register
+
+    @property
+    def stage_names(self) -> List[str]:
+        return [name for name, _ in self.stages]
+
+    def disabled_for(self, guild_id: int, settings: Dict) -> FrozenSet[str]:
+        """Get the stages a guild has switched off, parsing the setting only when it changes."""
+        value = settings.get('disabled_stages')
+        cached = self._disabled.get(guild_id)
+        if cached is None or cached[0] != value:
+            cached = (value, parse_disabled_stages(value))
+            self._disabled[guild_id] = cached
+        return cached[1]
+
+    async def run(self, message: discord.Message, settings: Dict) -> MessageContext:
+        """Run every enabled stage in order until one stops processing."""
+        ctx = MessageContext(message, settings)
+        disabled = self.disabled_for(ctx.guild_id, settings)
+        for name, func in self.stages:
+            if name in disabled:
+                continue
+            start = time.perf_counter()
+            try:
+                await func(ctx)
+            finally:
+                self.stats[name].record(time.perf_counter() - start)
+            if ctx.stopped:
+                break
+        return ctx
@@ -0,0 +1,674 @@
+"""
+PostgreSQL storage backend using an asyncpg connection pool.
+Implements the StorageBackend contract with the same tables and row shapes as the SQLite backend,
+using INSERT ... ON CONFLICT upserts with RETURNING so writes never need a read-back.
+Reads never write: missing rows come back as the defaults from database.py.
+"""
+import asyncio
+import contextlib
+import contextvars
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import asyncpg
+except ImportError:  # Only needed when DATABASE_URL points at PostgreSQL
+    asyncpg = None
+
+from database import (AUTOMOD_DEFAULTS, SERVER_SETTINGS_DEFAULTS, USER_LEVEL_DEFAULTS, Database,
+                      check_setting_name, hour_bucket, normalize_server_settings, warning_counter_deltas)
+from storage import StorageBackend
+
+# Ordered schema migrations: (version, description, statements). Version 1 matches the
+# SQLite schema at its migration 8. Append new entries for schema changes; never edit one
+# that has shipped. The schema version is stored in the schema_version table.
+PG_MIGRATIONS = [
+    (1, "Initial schema", [
+        """CREATE TABLE IF NOT EXISTS server_settings (
+            guild_id BIGINT PRIMARY KEY,
+            autorole_id BIGINT,
+            log_channel_id BIGINT,
+            suggestion_channel_id BIGINT,
+            welcome_channel_id BIGINT,
+            goodbye_channel_id BIGINT,
+            automod_enabled INTEGER DEFAULT 1,
+            spam_threshold INTEGER DEFAULT 5,
+            profanity_filter INTEGER DEFAULT 1,
+            link_filter INTEGER DEFAULT 0,
+            mass_ping_threshold INTEGER DEFAULT 5,
+            disabled_stages TEXT,
+            xp_cooldown INTEGER DEFAULT 60,
+            xp_min INTEGER DEFAULT 15,
+            xp_max INTEGER DEFAULT 25,
+            xp_channel_multipliers TEXT,
+            xp_role_multipliers TEXT,
+            no_xp_channels TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS automod_config (
+            guild_id BIGINT PRIMARY KEY,
+            spam_enabled INTEGER DEFAULT 1,
+            profanity_enabled INTEGER DEFAULT 1,
+            links_enabled INTEGER DEFAULT 0,
+            mass_ping_enabled INTEGER DEFAULT 1,
+            spam_threshold INTEGER DEFAULT 5,
+            ping_threshold INTEGER DEFAULT 5,
+            profanity_list TEXT,
+            whitelisted_roles TEXT,
+            whitelisted_channels TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS custom_commands (
+            id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            command_name TEXT NOT NULL,
+            command_response TEXT NOT NULL,
+            UNIQUE (guild_id, command_name)
+        )""",
+        """CREATE TABLE IF NOT EXISTS warnings (
+            id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            moderator_id BIGINT NOT NULL,
+            reason TEXT,
+            timestamp TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS muted_users (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            mute_role_id BIGINT,
+            unmute_time TEXT,
+            PRIMARY KEY (guild_id, user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS reaction_roles (
+            id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            emoji TEXT NOT NULL,
+            role_id BIGINT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS user_levels (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            xp INTEGER DEFAULT 0,
+            level INTEGER DEFAULT 1,
+            total_messages INTEGER DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS afk_users (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            afk_message TEXT,
+            afk_since TEXT NOT NULL,
+            PRIMARY KEY (guild_id, user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS scheduled_announcements (
+            id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            message TEXT NOT NULL,
+            interval_minutes INTEGER,
+            next_run TEXT NOT NULL,
+            enabled INTEGER DEFAULT 1,
+            cron TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS message_logs (
+            id BIGSERIAL PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            channel_id BIGINT NOT NULL,
+            message_id BIGINT NOT NULL,
+            content TEXT,
+            action TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS command_sync (
+            scope_id BIGINT PRIMARY KEY,
+            command_hash TEXT NOT NULL,
+            synced_at TEXT NOT NULL
+        )""",
+        """CREATE TABLE IF NOT EXISTS work_leases (
+            resource TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at DOUBLE PRECISION NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_reaction_roles_message ON reaction_roles (guild_id, message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_user ON warnings (guild_id, user_id)",
+        "CREATE INDEX IF NOT EXISTS idx_user_levels_xp ON user_levels (guild_id, xp DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_announcements_due ON scheduled_announcements (enabled, next_run)",
+        "CREATE INDEX IF NOT EXISTS idx_muted_users_unmute ON muted_users (unmute_time)",
+        "CREATE INDEX IF NOT EXISTS idx_message_logs_message ON message_logs (message_id)",
+        "CREATE INDEX IF NOT EXISTS idx_message_logs_timestamp ON message_logs (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_work_leases_owner ON work_leases (owner)",
+    ]),
+    (2, "Add warning counters and escalation rules", [
+        """CREATE TABLE IF NOT EXISTS warning_counts (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS warning_buckets (
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            hour BIGINT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id, hour)
+        )""",
+        """INSERT INTO warning_counts (guild_id, user_id, total)
+            SELECT guild_id, user_id, COUNT(*) FROM warnings GROUP BY guild_id, user_id""",
+        """INSERT INTO warning_buckets (guild_id, user_id, hour, count)
+            SELECT guild_id, user_id, EXTRACT(EPOCH FROM timestamp::timestamp)::bigint / 3600, COUNT(*)
+            FROM warnings GROUP BY 1, 2, 3""",
+        # Keyset paging on id for /warnings
+        "CREATE INDEX IF NOT EXISTS idx_warnings_user_id ON warnings (guild_id, user_id, id)",
+        "DROP INDEX IF EXISTS idx_warnings_user",
+        "ALTER TABLE server_settings ADD COLUMN IF NOT EXISTS warn_escalations TEXT",
+    ]),
+    (3, "Add warning expiry and the warnings archive", [
+        """CREATE TABLE IF NOT EXISTS warnings_archive (
+            id BIGINT PRIMARY KEY,
+            guild_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            moderator_id BIGINT NOT NULL,
+            reason TEXT,
+            timestamp TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )""",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_archive_user ON warnings_archive (guild_id, user_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_warnings_guild_time ON warnings (guild_id, timestamp)",
+        "ALTER TABLE server_settings ADD COLUMN IF NOT EXISTS warn_expiry_days INTEGER",
+    ]),
+    (4, "Add profanity word-boundary and leetspeak options", [
+        "ALTER TABLE automod_config ADD COLUMN IF NOT EXISTS profanity_word_boundary INTEGER DEFAULT 0",
+        "ALTER TABLE automod_config ADD COLUMN IF NOT EXISTS profanity_leetspeak INTEGER DEFAULT 0",
+    ]),
+]
+
+# Arbitrary key for the advisory lock that serializes migrations across processes
+MIGRATION_LOCK_ID = 74201
+
+
+def rowcount(status: str) -> int:
+    """Get the affected row count from a command status like "DELETE 3"."""
+    try:
+        return int(status.split()[-1])
+    except (ValueError, IndexError):
+        return 0
+
+
+class PostgresStorage(StorageBackend):
+    """PostgreSQL storage backend. Call connect() inside the event loop before use."""
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("PostgreSQL storage needs asyncpg: pip install asyncpg")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool = None  # asyncpg Pool, or a single Connection for the sync helper
+        self.sync = SyncPostgresStorage(dsn)
+        # Connection of the transaction the current task has open, if any
+        self._transaction_conn = contextvars.ContextVar(f"pg_transaction_{id(self)}", default=None)
+
+    async def connect(self):
+        """Create the connection pool and apply migrations."""
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size)
+            await self.migrate()
+            print("✅ Database initialized successfully")
+
+    def close(self):
+        """Close every connection. Safe to call after the event loop has stopped."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def _db(self):
+        """Where single statements run: the open transaction's connection, else the pool."""
+        conn = self._transaction_conn.get()
+        return conn if conn is not None else self.pool
+
+    @contextlib.asynccontextmanager
+    async def _connection(self):
+        """Get a connection for multi-statement work (from the pool, or the single connection)."""
+        conn = self._transaction_conn.get()
+        if conn is not None:
+            yield conn
+        elif isinstance(self.pool, asyncpg.Pool):
+            async with self.pool.acquire() as conn:
+                yield conn
+        else:
+            yield self.pool
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Group this task's calls into one transaction on one connection. Nested blocks are savepoints."""
+        conn = self._transaction_conn.get()
+        if conn is not None:
+            async with conn.transaction():
+                yield self
+            return
+        async with self._connection() as conn:
+            async with conn.transaction():
+                token = self._transaction_conn.set(conn)
+                try:
+                    yield self
+                finally:
+                    self._transaction_conn.reset(token)
+
+    async def migrate(self):
+        """Apply every migration newer than the recorded schema version, in order."""
+        async with self._connection() as conn:
+            async with conn.transaction():
+                # Processes starting together wait here and then find the migrations applied
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATION_LOCK_ID)
+                await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                version = await conn.fetchval("SELECT MAX(version) FROM schema_version") or 0
+                for target, description, statements in PG_MIGRATIONS:
+                    if target <= version:
+                        continue
+                    for statement in statements:
+                        await conn.execute(statement)
+                    await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", target)
+                    print(f"✅ Applied migration {target}: {description}")
+
+    # Server Settings
+    async def get_server_settings(self, guild_id: int) -> Dict:
+        row = await self._db().fetchrow("SELECT * FROM server_settings WHERE guild_id = $1", guild_id)
+        if row:
+            return normalize_server_settings(dict(row))
+        return {'guild_id': guild_id, **SERVER_SETTINGS_DEFAULTS}
+
+    async def update_server_setting(self, guild_id: int, setting: str, value) -> Dict:
+        check_setting_name(setting, SERVER_SETTINGS_DEFAULTS)
+        return normalize_server_settings(await self._upsert_setting("server_settings", guild_id, setting, value))
+
+    async def _upsert_setting(self, table: str, guild_id: int, setting: str, value) -> Dict:
+        """Set one column of a per-guild row, creating the row if needed. setting must be whitelisted."""
+        row = await self._db().fetchrow(f"""
+            INSERT INTO {table} (guild_id, {setting}) VALUES ($1, $2)
+            ON CONFLICT (guild_id) DO UPDATE SET {setting} = EXCLUDED.{setting}
+            RETURNING *
+        """, guild_id, value)
+        return dict(row)
+
+    # Custom Commands
+    async def add_custom_command(self, guild_id: int, command_name: str, response: str) -> bool:
+        command_id = await self._db().fetchval("""
+            INSERT INTO custom_commands (guild_id, command_name, command_response) VALUES ($1, $2, $3)
+            ON CONFLICT (guild_id, command_name) DO NOTHING
+            RETURNING id
+        """, guild_id, command_name.lower(), response)
+        return command_id is not None  # None when the command already exists
+
+    async def get_custom_command(self, guild_id: int, command_name: str) -> Optional[Dict]:
+        row = await self._db().fetchrow("""
+            SELECT * FROM custom_commands WHERE guild_id = $1 AND command_name = $2
+        """, guild_id, command_name.lower())
+        return dict(row) if row else None
+
+    async def get_all_custom_commands(self, guild_id: int) -> List[Dict]:
+        rows = await self._db().fetch("SELECT * FROM custom_commands WHERE guild_id = $1", guild_id)
+        return [dict(row) for row in rows]
+
+    async def get_all_custom_command_rows(self) -> List[Dict]:
+        return [dict(row) for row in await self._db().fetch("SELECT * FROM custom_commands")]
+
+    async def delete_custom_command(self, guild_id: int, command_name: str) -> bool:
+        status = await self._db().execute("""
+            DELETE FROM custom_commands WHERE guild_id = $1 AND command_name = $2
+        """, guild_id, command_name.lower())
+        return rowcount(status) > 0
+
+    # Warnings
+    async def add_warning(self, guild_id: int, user_id: int, moderator_id: int, reason: str) -> int:
+        now = datetime.utcnow()
+        async with self.transaction():
+            conn = self._db()
+            warning_id = await conn.fetchval("""
+                INSERT INTO warnings (guild_id, user_id, moderator_id, reason, timestamp)
+                VALUES ($1, $2, $3, $4, $5)
+                RETURNING id
+            """, guild_id, user_id, moderator_id, reason, now.isoformat())
+            await conn.execute("""
+                INSERT INTO warning_counts (guild_id, user_id, total) VALUES ($1, $2, 1)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET total = warning_counts.total + 1
+            """, guild_id, user_id)
+            await conn.execute("""
+                INSERT INTO warning_buckets (guild_id, user_id, hour, count) VALUES ($1, $2, $3, 1)
+                ON CONFLICT (guild_id, user_id, hour) DO UPDATE SET count = warning_buckets.count + 1
+            """, guild_id, user_id, hour_bucket(now))
+        return warning_id
+
+    async def get_warnings(self, guild_id: int, user_id: int, limit: int = 10, before_id: int = None) -> List[Dict]:
+        if before_id is None:
+            rows = await self._db().fetch("""
+                SELECT * FROM warnings WHERE guild_id = $1 AND user_id = $2
+                ORDER BY id DESC LIMIT $3
+            """, guild_id, user_id, limit)
+        else:
+            rows = await self._db().fetch("""
+                SELECT * FROM warnings WHERE guild_id = $1 AND user_id = $2 AND id < $3
+                ORDER BY id DESC LIMIT $4
+            """, guild_id, user_id, before_id, limit)
+        return [dict(row) for row in rows]
+
+    async def get_warning_counts(self, guild_id: int, user_id: int, window_hours: List[int] = ()) -> Dict:
+        total = await self._db().fetchval("""
+            SELECT total FROM warning_counts WHERE guild_id = $1 AND user_id = $2
+        """, guild_id, user_id)
+        counts = {'total': total or 0, 'recent': {}}
+        if window_hours:
+            current = hour_bucket(datetime.utcnow())
+            buckets = await self._db().fetch("""
+                SELECT hour, count FROM warning_buckets
+                WHERE guild_id = $1 AND user_id = $2 AND hour >= $3
+            """, guild_id, user_id, current - max(window_hours))
+            for hours in window_hours:
+                counts['recent'][hours] = sum(b['count'] for b in buckets if b['hour'] >= current - hours)
+        return counts
+
+    async def clear_warnings(self, guild_id: int, user_id: int) -> int:
+        async with self.transaction():
+            conn = self._db()
+            status = await conn.execute("""
+                DELETE FROM warnings WHERE guild_id = $1 AND user_id = $2
+            """, guild_id, user_id)
+            await conn.execute("DELETE FROM warning_counts WHERE guild_id = $1 AND user_id = $2", guild_id, user_id)
+            await conn.execute("DELETE FROM warning_buckets WHERE guild_id = $1 AND user_id = $2", guild_id, user_id)
+        return rowcount(status)
+
+    async def prune_warning_buckets(self, before_hour: int) -> int:
+        return rowcount(await self._db().execute("DELETE FROM warning_buckets WHERE hour < $1", before_hour))
+
+    async def get_warning_expiry_days(self) -> Dict[int, int]:
+        rows = await self._db().fetch("SELECT guild_id, warn_expiry_days FROM server_settings WHERE warn_expiry_days > 0")
+        return {row['guild_id']: row['warn_expiry_days'] for row in rows}
+
+    async def archive_warnings(self, guild_id: int, before: str, limit: int) -> int:
+        async with self.transaction():
+            conn = self._db()
+            # SKIP LOCKED lets compactors in other processes take different rows
+            rows = await conn.fetch("""
+                WITH moved AS (
+                    DELETE FROM warnings WHERE id IN (
+                        SELECT id FROM warnings WHERE guild_id = $1 AND timestamp < $2
+                        ORDER BY timestamp LIMIT $3
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                )
+                INSERT INTO warnings_archive (id, guild_id, user_id, moderator_id, reason, timestamp, archived_at)
+                SELECT id, guild_id, user_id, moderator_id, reason, timestamp, $4 FROM moved
+                RETURNING user_id, timestamp
+            """, guild_id, before, limit, datetime.utcnow().isoformat())
+            if not rows:
+                return 0
+
+            per_user, per_bucket = warning_counter_deltas(rows)
+            await conn.executemany("""
+                UPDATE warning_counts SET total = GREATEST(total - $1, 0) WHERE guild_id = $2 AND user_id = $3
+            """, [(count, guild_id, user_id) for user_id, count in per_user.items()])
+            await conn.executemany("""
+                DELETE FROM warning_counts WHERE guild_id = $1 AND user_id = $2 AND total = 0
+            """, [(guild_id, user_id) for user_id in per_user])
+            await conn.executemany("""
+                UPDATE warning_buckets SET count = count - $1 WHERE guild_id = $2 AND user_id = $3 AND hour = $4
+            """, [(count, guild_id, user_id, hour) for (user_id, hour), count in per_bucket.items()])
+            await conn.executemany("""
+                DELETE FROM warning_buckets WHERE guild_id = $1 AND user_id = $2 AND hour = $3 AND count <= 0
+            """, [(guild_id, user_id, hour) for user_id, hour in per_bucket])
+        return len(rows)
+
+    async def count_warning_rows(self, guild_id: int) -> Dict:
+        active = await self._db().fetchval("SELECT COUNT(*) FROM warnings WHERE guild_id = $1", guild_id)
+        archived = await self._db().fetchval("SELECT COUNT(*) FROM warnings_archive WHERE guild_id = $1", guild_id)
+        return {'active': active, 'archived': archived}
+
+    # Mutes
+    async def add_mute(self, guild_id: int, user_id: int, mute_role_id: int, unmute_time: str = None):
+        await self._db().execute("""
+            INSERT INTO muted_users (guild_id, user_id, mute_role_id, unmute_time) VALUES ($1, $2, $3, $4)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                mute_role_id = EXCLUDED.mute_role_id,
+                unmute_time = EXCLUDED.unmute_time
+        """, guild_id, user_id, mute_role_id, unmute_time)
+
+    async def remove_mute(self, guild_id: int, user_id: int):
+        await self._db().execute("DELETE FROM muted_users WHERE guild_id = $1 AND user_id = $2", guild_id, user_id)
+
+    async def get_mute(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        row = await self._db().fetchrow("""
+            SELECT * FROM muted_users WHERE guild_id = $1 AND user_id = $2
+        """, guild_id, user_id)
+        return dict(row) if row else None
+
+    async def get_muted_users(self, guild_id: int) -> List[Dict]:
+        rows = await self._db().fetch("SELECT * FROM muted_users WHERE guild_id = $1", guild_id)
+        return [dict(row) for row in rows]
+
+    async def get_timed_mutes(self) -> List[Dict]:
+        rows = await self._db().fetch("SELECT * FROM muted_users WHERE unmute_time IS NOT NULL")
+        return [dict(row) for row in rows]
+
+    async def get_unclaimed_mutes(self, now: float) -> List[Dict]:
+        rows = await self._db().fetch("""
+            SELECT m.* FROM muted_users m
+            LEFT JOIN work_leases l ON l.resource = 'mute:' || m.guild_id || ':' || m.user_id
+            WHERE m.unmute_time IS NOT NULL AND (l.resource IS NULL OR l.expires_at < $1)
+        """, now)
+        return [dict(row) for row in rows]
+
+    # Reaction Roles
+    async def add_reaction_role(self, guild_id: int, message_id: int, channel_id: int, emoji: str, role_id: int) -> int:
+        return await self._db().fetchval("""
+            INSERT INTO reaction_roles (guild_id, message_id, channel_id, emoji, role_id)
+            VALUES ($1, $2, $3, $4, $5)
+            RETURNING id
+        """, guild_id, message_id, channel_id, emoji, role_id)
+
+    async def get_reaction_roles(self, guild_id: int, message_id: int = None) -> List[Dict]:
+        if message_id:
+            rows = await self._db().fetch("""
+                SELECT * FROM reaction_roles WHERE guild_id = $1 AND message_id = $2
+            """, guild_id, message_id)
+        else:
+            rows = await self._db().fetch("SELECT * FROM reaction_roles WHERE guild_id = $1", guild_id)
+        return [dict(row) for row in rows]
+
+    async def get_all_reaction_role_rows(self) -> List[Dict]:
+        return [dict(row) for row in await self._db().fetch("SELECT * FROM reaction_roles")]
+
+    async def remove_reaction_role(self, guild_id: int, message_id: int, emoji: str) -> bool:
+        status = await self._db().execute("""
+            DELETE FROM reaction_roles WHERE guild_id = $1 AND message_id = $2 AND emoji = $3
+        """, guild_id, message_id, emoji)
+        return rowcount(status) > 0
+
+    # Leveling
+    async def get_user_level(self, guild_id: int, user_id: int) -> Dict:
+        row = await self._db().fetchrow("""
+            SELECT * FROM user_levels WHERE guild_id = $1 AND user_id = $2
+        """, guild_id, user_id)
+        if row:
+            return dict(row)
+        return {'guild_id': guild_id, 'user_id': user_id, **USER_LEVEL_DEFAULTS}
+
+    async def add_xp(self, guild_id: int, user_id: int, xp: int) -> Dict:
+        # Same formula as Database.calculate_level
+        row = await self._db().fetchrow("""
+            INSERT INTO user_levels (guild_id, user_id, xp, level, total_messages)
+            VALUES ($1, $2, $3, FLOOR(SQRT($3::integer / 100.0))::int + 1, 1)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                xp = user_levels.xp + EXCLUDED.xp,
+                level = FLOOR(SQRT((user_levels.xp + EXCLUDED.xp) / 100.0))::int + 1,
+                total_messages = user_levels.total_messages + 1
+            RETURNING xp, level
+        """, guild_id, user_id, xp)
+        old_level = Database.calculate_level(row['xp'] - xp)
+        return {'level': row['level'], 'xp': row['xp'], 'leveled_up': row['level'] > old_level}
+
+    async def save_user_levels(self, rows: List[Dict]):
+        async with self._connection() as conn:
+            await conn.executemany("""
+                INSERT INTO user_levels (guild_id, user_id, xp, level, total_messages)
+                VALUES ($1, $2, $3, $4, $5)
+                ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                    xp = EXCLUDED.xp,
+                    level = EXCLUDED.level,
+                    total_messages = EXCLUDED.total_messages
+            """, [(r['guild_id'], r['user_id'], r['xp'], r['level'], r['total_messages']) for r in rows])
+
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Dict]:
+        rows = await self._db().fetch("""
+            SELECT * FROM user_levels WHERE guild_id = $1 ORDER BY xp DESC LIMIT $2
+        """, guild_id, limit)
+        return [dict(row) for row in rows]
+
+    async def get_all_user_xp(self) -> List[Dict]:
+        return [dict(row) for row in await self._db().fetch("SELECT guild_id, user_id, xp FROM user_levels")]
+
+    # AFK
+    async def set_afk(self, guild_id: int, user_id: int, message: str):
+        await self._db().execute("""
+            INSERT INTO afk_users (guild_id, user_id, afk_message, afk_since) VALUES ($1, $2, $3, $4)
+            ON CONFLICT (guild_id, user_id) DO UPDATE SET
+                afk_message = EXCLUDED.afk_message,
+                afk_since = EXCLUDED.afk_since
+        """, guild_id, user_id, message, datetime.utcnow().isoformat())
+
+    async def remove_afk(self, guild_id: int, user_id: int):
+        await self._db().execute("DELETE FROM afk_users WHERE guild_id = $1 AND user_id = $2", guild_id, user_id)
+
+    async def is_afk(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        row = await self._db().fetchrow("""
+            SELECT * FROM afk_users WHERE guild_id = $1 AND user_id = $2
+        """, guild_id, user_id)
+        return dict(row) if row else None
+
+    async def get_all_afk_rows(self) -> List[Dict]:
+        return [dict(row) for row in await self._db().fetch("SELECT * FROM afk_users")]
+
+    # Scheduled Announcements
+    async def add_scheduled_announcement(self, guild_id: int, channel_id: int, message: str, interval_minutes: int,
+                                         cron: str = None, next_run: str = None) -> int:
+        if next_run is None:
+            next_run = (datetime.utcnow() + timedelta(minutes=interval_minutes)).isoformat()
+        return await self._db().fetchval("""
+            INSERT INTO scheduled_announcements (guild_id, channel_id, message, interval_minutes, next_run, cron)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            RETURNING id
+        """, guild_id, channel_id, message, interval_minutes, next_run, cron)
+
+    async def get_due_announcements(self, now: str = None) -> List[Dict]:
+        if now is None:
+            now = datetime.utcnow().isoformat()
+        rows = await self._db().fetch("""
+            SELECT * FROM scheduled_announcements WHERE enabled = 1 AND next_run <= $1
+        """, now)
+        return [dict(row) for row in rows]
+
+    async def update_announcement_next_runs(self, updates: List[Tuple[str, int]]):
+        async with self._connection() as conn:
+            await conn.executemany("UPDATE scheduled_announcements SET next_run = $1 WHERE id = $2", updates)
+
+    async def get_next_announcement_run(self) -> Optional[str]:
+        return await self._db().fetchval("SELECT MIN(next_run) FROM scheduled_announcements WHERE enabled = 1")
+
+    # Work Leases
+    async def claim_leases(self, resources: List[str], owner: str, expires_at: float, now: float) -> List[str]:
+        rows = await self._db().fetch("""
+            INSERT INTO work_leases (resource, owner, expires_at)
+            SELECT resource, $2::text, $3::double precision FROM unnest($1::text[]) AS resource
+            ON CONFLICT (resource) DO UPDATE SET owner = EXCLUDED.owner, expires_at = EXCLUDED.expires_at
+            WHERE work_leases.owner = EXCLUDED.owner OR work_leases.expires_at < $4
+            RETURNING resource
+        """, list(dict.fromkeys(resources)), owner, expires_at, now)
+        return [row['resource'] for row in rows]
+
+    async def renew_leases(self, owner: str, expires_at: float, now: float) -> List[str]:
+        rows = await self._db().fetch("""
+            UPDATE work_leases SET expires_at = $2 WHERE owner = $1 AND expires_at >= $3
+            RETURNING resource
+        """, owner, expires_at, now)
+        return [row['resource'] for row in rows]
+
+    async def release_leases(self, owner: str, resources: List[str] = None) -> int:
+        if resources is None:
+            status = await self._db().execute("DELETE FROM work_leases WHERE owner = $1", owner)
+        else:
+            status = await self._db().execute("""
+                DELETE FROM work_leases WHERE owner = $1 AND resource = ANY($2::text[])
+            """, owner, list(resources))
+        return rowcount(status)
+
+    async def prune_leases(self, before: float) -> int:
+        return rowcount(await self._db().execute("DELETE FROM work_leases WHERE expires_at < $1", before))
+
+    # Message Logs
+    async def add_message_logs(self, rows: List[Dict]):
+        async with self._connection() as conn:
+            await conn.executemany("""
+                INSERT INTO message_logs (guild_id, user_id, channel_id, message_id, content, action, timestamp)
+                VALUES ($1, $2, $3, $4, $5, $6, $7)
+            """, [(r['guild_id'], r['user_id'], r['channel_id'], r['message_id'], r['content'], r['action'],
+                   r['timestamp']) for r in rows])
+
+    async def get_logged_message(self, message_id: int) -> Optional[Dict]:
+        row = await self._db().fetchrow("""
+            SELECT * FROM message_logs WHERE message_id = $1 ORDER BY id DESC LIMIT 1
+        """, message_id)
+        return dict(row) if row else None
+
+    async def prune_message_logs(self, before: str) -> int:
+        return rowcount(await self._db().execute("DELETE FROM message_logs WHERE timestamp < $1", before))
+
+    # Command Sync
+    async def get_command_sync_hashes(self) -> Dict[int, str]:
+        rows = await self._db().fetch("SELECT scope_id, command_hash FROM command_sync")
+        return {row['scope_id']: row['command_hash'] for row in rows}
+
+    async def set_command_sync_hash(self, scope_id: int, command_hash: str):
+        await self._db().execute("""
+            INSERT INTO command_sync (scope_id, command_hash, synced_at) VALUES ($1, $2, $3)
+            ON CONFLICT (scope_id) DO UPDATE SET
+                command_hash = EXCLUDED.command_hash,
+                synced_at = EXCLUDED.synced_at
+        """, scope_id, command_hash, datetime.utcnow().isoformat())
+
+    # Auto-mod Config
+    async def get_automod_config(self, guild_id: int) -> Dict:
+        row = await self._db().fetchrow("SELECT * FROM automod_config WHERE guild_id = $1", guild_id)
+        if row:
+            return dict(row)
+        return {'guild_id': guild_id, **AUTOMOD_DEFAULTS}
+
+    async def update_automod_setting(self, guild_id: int, setting: str, value) -> Dict:
+        check_setting_name(setting, AUTOMOD_DEFAULTS)
+        return await self._upsert_setting("automod_config", guild_id, setting, value)
+
+
+class SyncPostgresStorage:
+    """
+    Synchronous access to PostgresStorage methods for shutdown code that runs after the event
+    loop has stopped. Each call opens its own connection in a short-lived event loop.
+    """
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+
+    def __getattr__(self, name: str):
+        method = getattr(PostgresStorage, name)
+
+        def call(*args, **kwargs):
+            async def run():
+                storage = PostgresStorage(self.dsn)
+                storage.pool = await asyncpg.connect(self.dsn)
+                try:
+                    return await method(storage, *args, **kwargs)
+                finally:
+                    await storage.pool.close()
+            return asyncio.run(run())
+
+        call.__name__ = name
+        return call
@@ -0,0 +1,185 @@
+"""
+Leaderboard ranking per guild.
+Each guild keeps an order-statistics list of (-xp, user_id) so rank, page and "around me"
+queries are logarithmic, updated incrementally from XP grants and rebuilt from SQLite on startup.
+"""
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Target block size for RankIndex
+BLOCK_SIZE = 256
+
+Key = Tuple[int, int]  # (-xp, user_id), so higher XP sorts first and ties break by user ID
+
+
+class RankIndex:
+    """
+    Sorted list split into blocks, with a Fenwick tree over block lengths.
+    Finding a key's position or the key at a position takes O(log n); inserts and
+    removals move at most one block's worth of items.
+    """
+
+    def __init__(self, keys: Iterable[Key] = ()):
+        self._build(sorted(keys))
+
+    def _build(self, keys: List[Key]):
+        self.blocks: List[List[Key]] = [keys[i:i + BLOCK_SIZE] for i in range(0, len(keys), BLOCK_SIZE)]
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        self.maxes = [block[-1] for block in self.blocks]
+        self.tree = [0] * (len(self.blocks) + 1)
+        for i, block in enumerate(self.blocks):
+            self._tree_add(i, len(block))
+
+    def _tree_add(self, block_index: int, delta: int):
+        i = block_index + 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, block_index: int) -> int:
+        """Number of items in blocks before block_index."""
+        total = 0
+        i = block_index
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self) -> int:
+        return self._tree_prefix(len(self.blocks))
+
+    def add(self, key: Key):
+        if not self.blocks:
+            self._build([key])
+            return
+        block_index = min(bisect_left(self.maxes, key), len(self.blocks) - 1)
+        block = self.blocks[block_index]
+        insort(block, key)
+        self.maxes[block_index] = block[-1]
+        if len(block) > BLOCK_SIZE * 2:
+            self.blocks[block_index:block_index + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._rebuild_index()
+        else:
+            self._tree_add(block_index, 1)
+
+    def remove(self, key: Key) -> bool:
+        block_index = bisect_left(self.maxes, key)
+        if block_index == len(self.blocks):
+            return False
+        block = self.blocks[block_index]
+        i = bisect_left(block, key)
+        if i == len(block) or block[i] != key:
+            return False
+        del block[i]
+        if block:
+            self.maxes[block_index] = block[-1]
+            self._tree_add(block_index, -1)
+        else:
+            del self.blocks[block_index]
+            self._rebuild_index()
+        return True
+
+    def index(self, key: Key) -> Optional[int]:
+        """Zero-based position of a key, or None if absent."""
+        block_index = bisect_left(self.maxes, key)
+        if block_index == len(self.blocks):
+            return None
+        block = self.blocks[block_index]
+        i = bisect_left(block, key)
+        if i == len(block) or block[i] != key:
+            return None
+        return self._tree_prefix(block_index) + i
+
+    def _locate(self, position: int) -> Tuple[int, int]:
+        """Find (block index, offset) for a position by descending the Fenwick tree."""
+        block_index = 0
+        step = 1 << (len(self.tree) - 1).bit_length()
+        while step:
+            nxt = block_index + step
+            if nxt < len(self.tree) and self.tree[nxt] <= position:
+                block_index = nxt
+                position -= self.tree[nxt]
+            step >>= 1
+        return block_index, position
+
+    def slice(self, start: int, stop: int) -> List[Key]:
+        """Keys at positions [start, stop)."""
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        if start >= stop:
+            return []
+        block_index, offset = self._locate(start)
+        result: List[Key] = []
+        while len(result) < stop - start and block_index < len(self.blocks):
+            block = self.blocks[block_index]
+            result.extend(block[offset:offset + (stop - start - len(result))])
+            block_index += 1
+            offset = 0
+        return result
+
+
+class Leaderboard:
+    """Rank indexes for every guild plus a cache of the rendered top 10."""
+
+    TOP_SIZE = 10
+
+    def __init__(self):
+        self.indexes: Dict[int, RankIndex] = {}
+        self.xp: Dict[int, Dict[int, int]] = {}  # {guild_id: {user_id: xp}}
+        self.top_cache: Dict[int, str] = {}
+
+    def rebuild(self, rows: Iterable[Dict]):
+        """Rebuild every guild from user_levels rows."""
+        keys: Dict[int, List[Key]] = {}
+        self.xp = {}
+        for row in rows:
+            self.xp.setdefault(row['guild_id'], {})[row['user_id']] = row['xp']
+            keys.setdefault(row['guild_id'], []).append((-row['xp'], row['user_id']))
+        self.indexes = {guild_id: RankIndex(guild_keys) for guild_id, guild_keys in keys.items()}
+        self.top_cache.clear()
+
+    def update(self, guild_id: int, user_id: int, xp: int):
+        """Move a user to their new XP."""
+        guild_xp = self.xp.setdefault(guild_id, {})
+        index = self.indexes.setdefault(guild_id, RankIndex())
+        old_xp = guild_xp.get(user_id)
+        if old_xp == xp:
+            return
+        old_position = None
+        if old_xp is not None:
+            old_position = index.index((-old_xp, user_id))
+            index.remove((-old_xp, user_id))
+        guild_xp[user_id] = xp
+        index.add((-xp, user_id))
+        if (old_position is not None and old_position < self.TOP_SIZE) or index.index((-xp, user_id)) < self.TOP_SIZE:
+            self.top_cache.pop(guild_id, None)
+
+    def rank(self, guild_id: int, user_id: int) -> Optional[int]:
+        """1-based rank of a user, or None if they have no XP row."""
+        xp = self.xp.get(guild_id, {}).get(user_id)
+        if xp is None:
+            return None
+        return self.indexes[guild_id].index((-xp, user_id)) + 1
+
+    def size(self, guild_id: int) -> int:
+        index = self.indexes.get(guild_id)
+        return len(index) if index else 0
+
+    def page(self, guild_id: int, page: int = 1, per_page: int = 10) -> List[Tuple[int, int, int]]:
+        """Get (rank, user_id, xp) entries for a 1-based page."""
+        index = self.indexes.get(guild_id)
+        if not index:
+            return []
+        start = (page - 1) * per_page
+        return [(start + i + 1, user_id, -neg_xp) for i, (neg_xp, user_id) in enumerate(index.slice(start, start + per_page))]
+
+    def around(self, guild_id: int, user_id: int, radius: int = 2) -> List[Tuple[int, int, int]]:
+        """Get (rank, user_id, xp) entries for the users just above and below a user."""
+        rank = self.rank(guild_id, user_id)
+        if rank is None:
+            return []
+        start = max(rank - 1 - radius, 0)
+        keys = self.indexes[guild_id].slice(start, rank + radius)
+        return [(start + i + 1, uid, -neg_xp) for i, (neg_xp, uid) in enumerate(keys)]
@@ -0,0 +1,88 @@
+"""
+In-memory reaction role index keyed by message ID.
+Reactions on messages without reaction roles are rejected with a single dict lookup.
+"""
+import re
+from typing import Dict, List, Tuple
+
+import discord
+
+from storage import StorageBackend
+
+# Custom emoji as sent in chat: <:name:id> or <a:name:id>
+CUSTOM_EMOJI_PATTERN = re.compile(r'<a?:(\w+):(\d+)>')
+
+
+def normalize_emoji(emoji: str) -> str:
+    """Normalize a stored emoji string: custom emoji become their ID, unicode loses variation selectors."""
+    emoji = emoji.strip()
+    match = CUSTOM_EMOJI_PATTERN.fullmatch(emoji)
+    if match:
+        return match.group(2)
+    return emoji.replace('\ufe0f', '')
+
+
+def payload_emoji_keys(emoji: discord.PartialEmoji) -> Tuple[str, ...]:
+    """Keys a reaction can match: the custom emoji ID (or unicode) and the bare name."""
+    if emoji.id:
+        return (str(emoji.id), emoji.name or '')
+    return (normalize_emoji(emoji.name or ''),)
+
+
+class ReactionRoleIndex:
+    """Reaction roles grouped by message, then by normalized emoji."""
+
+    def __init__(self, db: StorageBackend):
+        self.db = db
+        # {message_id: {emoji_key: [row, ...]}}
+        self.messages: Dict[int, Dict[str, List[Dict]]] = {}
+
+    async def load(self):
+        """Load every reaction role from the database."""
+        rows = await self.db.get_all_reaction_role_rows()
+        self.messages = {}
+        for row in rows:
+            self._put(row)
+        print(f"Loaded {len(rows)} reaction role(s) on {len(self.messages)} message(s)")
+
+    def lookup(self, guild_id: int, message_id: int, emoji: discord.PartialEmoji) -> List[int]:
+        """Get role IDs for a reaction. Returns an empty list without any other work for unindexed messages."""
+        by_emoji = self.messages.get(message_id)
+        if not by_emoji:
+            return []
+        role_ids = []
+        for key in payload_emoji_keys(emoji):
+            for row in by_emoji.get(key, ()):
+                if row['guild_id'] == guild_id and row['role_id'] not in role_ids:
+                    role_ids.append(row['role_id'])
+        return role_ids
+
+    async def add(self, guild_id: int, message_id: int, channel_id: int, emoji: str, role_id: int) -> int:
+        """Add a reaction role to the database and the index."""
+        row_id = await self.db.add_reaction_role(guild_id, message_id, channel_id, emoji, role_id)
+        self._put({
+            'id': row_id, 'guild_id': guild_id, 'message_id': message_id,
+            'channel_id': channel_id, 'emoji': emoji, 'role_id': role_id,
+        })
+        return row_id
+
+    async def remove(self, guild_id: int, message_id: int, emoji: str) -> bool:
+        """Remove every reaction role for an emoji on a message, however the emoji was stored."""
+        by_emoji = self.messages.get(message_id, {})
+        key = normalize_emoji(emoji)
+        stored = {row['emoji'] for row in by_emoji.get(key, []) if row['guild_id'] == guild_id}
+        stored.add(emoji)
+        removed = False
+        for raw_emoji in stored:
+            removed = await self.db.remove_reaction_role(guild_id, message_id, raw_emoji) or removed
+        if key in by_emoji:
+            by_emoji[key] = [row for row in by_emoji[key] if row['guild_id'] != guild_id]
+            if not by_emoji[key]:
+                del by_emoji[key]
+        if not by_emoji:
+            self.messages.pop(message_id, None)
+        return removed
+
+    def _put(self, row: Dict):
+        by_emoji = self.messages.setdefault(row['message_id'], {})
+        by_emoji.setdefault(normalize_emoji(row['emoji']), []).append(row)
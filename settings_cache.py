@@ -0,0 +1,137 @@
+"""
+Per-guild cache for server settings and auto-mod config.
+Both tables change rarely, so reads are served from memory and every write replaces the cached row
+with the one the database returns.
+"""
+import contextlib
+from typing import Dict, Iterable, Optional, TypedDict
+
+from storage import StorageBackend
+
+
+class ServerSettings(TypedDict, total=False):
+    guild_id: int
+    autorole_id: Optional[int]
+    log_channel_id: Optional[int]
+    suggestion_channel_id: Optional[int]
+    welcome_channel_id: Optional[int]
+    goodbye_channel_id: Optional[int]
+    automod_enabled: int
+    spam_threshold: int
+    profanity_filter: int
+    link_filter: int
+    mass_ping_threshold: int
+    disabled_stages: Optional[str]
+    xp_cooldown: int
+    xp_min: int
+    xp_max: int
+    xp_channel_multipliers: Optional[str]
+    xp_role_multipliers: Optional[str]
+    no_xp_channels: Optional[str]
+    warn_escalations: Optional[str]
+    warn_expiry_days: Optional[int]
+
+
+class AutomodConfig(TypedDict, total=False):
+    guild_id: int
+    spam_enabled: int
+    profanity_enabled: int
+    links_enabled: int
+    mass_ping_enabled: int
+    spam_threshold: int
+    ping_threshold: int
+    profanity_list: Optional[str]
+    profanity_word_boundary: int
+    profanity_leetspeak: int
+    whitelisted_roles: Optional[str]
+    whitelisted_channels: Optional[str]
+
+
+class SettingsCache:
+    """Read-through cache over server_settings and automod_config."""
+
+    def __init__(self, db: StorageBackend):
+        self.db = db
+        self.server: Dict[int, ServerSettings] = {}
+        self.automod: Dict[int, AutomodConfig] = {}
+        self.generation: Dict[int, int] = {}  # Bumped on invalidate so stale loads are dropped
+        self.hits = 0
+        self.misses = 0
+
+    async def get_server_settings(self, guild_id: int) -> ServerSettings:
+        """Get server settings, loading them on a miss."""
+        settings = self.server.get(guild_id)
+        if settings is not None:
+            self.hits += 1
+            return settings
+        self.misses += 1
+        generation = self.generation.get(guild_id, 0)
+        settings = await self.db.get_server_settings(guild_id)
+        if self.generation.get(guild_id, 0) == generation:
+            self.server[guild_id] = settings
+        return settings
+
+    async def get_automod_config(self, guild_id: int) -> AutomodConfig:
+        """Get auto-mod config, loading it on a miss."""
+        config = self.automod.get(guild_id)
+        if config is not None:
+            self.hits += 1
+            return config
+        self.misses += 1
+        generation = self.generation.get(guild_id, 0)
+        config = await self.db.get_automod_config(guild_id)
+        if self.generation.get(guild_id, 0) == generation:
+            self.automod[guild_id] = config
+        return config
+
+    async def update_server_setting(self, guild_id: int, setting: str, value) -> ServerSettings:
+        """Update a server setting and cache the row the database returns."""
+        settings = await self.db.update_server_setting(guild_id, setting, value)
+        self._bump(guild_id)
+        self.server[guild_id] = settings
+        return settings
+
+    async def update_automod_setting(self, guild_id: int, setting: str, value) -> AutomodConfig:
+        """Update an auto-mod setting and cache the row the database returns."""
+        config = await self.db.update_automod_setting(guild_id, setting, value)
+        self._bump(guild_id)
+        self.automod[guild_id] = config
+        return config
+
+    @contextlib.asynccontextmanager
+    async def transaction(self, guild_id: int):
+        """
+        Apply several updates for a guild as one database transaction. The guild is dropped from
+        the cache afterwards: rows cached mid-transaction might be rolled back, and loads by other
+        tasks during it saw the old values.
+        """
+        try:
+            async with self.db.transaction():
+                yield self
+        finally:
+            self.invalidate(guild_id)
+
+    def _bump(self, guild_id: int):
+        self.generation[guild_id] = self.generation.get(guild_id, 0) + 1
+
+    def invalidate(self, guild_id: int):
+        """Drop cached rows for a guild (call after any direct SQL write)."""
+        self.server.pop(guild_id, None)
+        self.automod.pop(guild_id, None)
+        self._bump(guild_id)
+
+    async def warm(self, guild_ids: Iterable[int]):
+        """Preload settings for the given guilds."""
+        for guild_id in guild_ids:
+            await self.get_server_settings(guild_id)
+            await self.get_automod_config(guild_id)
+
+    def stats(self) -> Dict:
+        """Get cache hit/miss counters."""
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'guilds': len(self.server),
+        }
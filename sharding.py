@@ -0,0 +1,112 @@
+"""
+Sharding configuration and per-shard metrics.
+SHARD_COUNT turns on sharded mode ("auto" lets Discord pick the count). SHARD_IDS limits this
+process to some of the shards, so a cluster of processes can split them (see launcher.py).
+"""
+import os
+from typing import Dict, List, Optional
+
+import discord
+from discord.ext import commands
+
+
+def parse_shard_ids(value: Optional[str]) -> Optional[List[int]]:
+    """Parse shard IDs like "0-3,8,10-11"."""
+    if not value or not value.strip():
+        return None
+    shard_ids = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            shard_ids.update(range(int(start), int(end) + 1))
+        else:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+
+def format_shard_ids(shard_ids: List[int]) -> str:
+    """Format shard IDs as ranges, the inverse of parse_shard_ids."""
+    ranges = []
+    for shard_id in sorted(shard_ids):
+        if ranges and ranges[-1][1] == shard_id - 1:
+            ranges[-1][1] = shard_id
+        else:
+            ranges.append([shard_id, shard_id])
+    return ','.join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+def shard_config_from_env() -> Optional[Dict]:
+    """Get AutoShardedBot arguments from SHARD_COUNT/SHARD_IDS, or None to run unsharded."""
+    count = os.getenv('SHARD_COUNT', '').strip().lower()
+    if not count:
+        return None
+    if count == 'auto':
+        if os.getenv('SHARD_IDS'):
+            raise ValueError("SHARD_IDS needs an explicit SHARD_COUNT")
+        return {}
+    config = {'shard_count': int(count)}
+    shard_ids = parse_shard_ids(os.getenv('SHARD_IDS'))
+    if shard_ids is not None:
+        invalid = [shard_id for shard_id in shard_ids if shard_id >= config['shard_count']]
+        if invalid:
+            raise ValueError(f"SHARD_IDS {invalid} out of range for SHARD_COUNT {config['shard_count']}")
+        config['shard_ids'] = shard_ids
+    return config
+
+
+def create_bot(**kwargs) -> commands.Bot:
+    """Create an AutoShardedBot when sharding is configured, otherwise a plain Bot."""
+    config = shard_config_from_env()
+    if config is None:
+        return commands.Bot(**kwargs)
+    return commands.AutoShardedBot(**config, **kwargs)
+
+
+def shard_stats(bot: commands.Bot) -> List[Dict]:
+    """Get latency (ms) and guild count for each shard this process runs."""
+    guild_counts: Dict[int, int] = {}
+    for guild in bot.guilds:
+        shard_id = guild.shard_id or 0
+        guild_counts[shard_id] = guild_counts.get(shard_id, 0) + 1
+
+    if isinstance(bot, commands.AutoShardedBot):
+        latencies = bot.latencies
+    else:
+        latencies = [(0, bot.latency)]
+    return [
+        {
+            'shard_id': shard_id,
+            # latency is inf until the first heartbeat is acknowledged
+            'latency_ms': round(latency * 1000) if latency != float('inf') else None,
+            'guilds': guild_counts.get(shard_id, 0),
+        }
+        for shard_id, latency in latencies
+    ]
+
+
+def format_shard_stats(stats: List[Dict]) -> str:
+    """Render shard stats as one line per shard."""
+    lines = []
+    for shard in stats:
+        latency = f"{shard['latency_ms']}ms" if shard['latency_ms'] is not None else "connecting"
+        lines.append(f"Shard {shard['shard_id']}: {latency}, {shard['guilds']} guild(s)")
+    return "\n".join(lines)
+
+
+def owns_guild(bot: discord.Client, guild_id: int) -> bool:
+    """Check whether one of this process's shards serves a guild (true when unsharded)."""
+    if bot.shard_count is None:
+        return True
+    shard_ids = getattr(bot, 'shard_ids', None)
+    return shard_ids is None or (guild_id >> 22) % bot.shard_count in shard_ids
+
+
+def describe_shards(bot: discord.Client) -> str:
+    """Describe which shards this process runs."""
+    if bot.shard_count is None:
+        return "unsharded"
+    shard_ids = getattr(bot, 'shard_ids', None) or range(bot.shard_count)
+    return f"shard(s) {format_shard_ids(list(shard_ids))} of {bot.shard_count}"
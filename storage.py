@@ -0,0 +1,219 @@
+"""
+Storage backend contract.
+The bot only talks to storage through these async methods, so SQLite (database.AsyncDatabase)
+and PostgreSQL (postgres_storage.PostgresStorage) are interchangeable. Pick one with DATABASE_URL.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+
+class StorageBackend:
+    """
+    Async storage API used by the bot. Rows are plain dicts with the same keys on every backend,
+    and timestamps are ISO strings. `sync` offers the write methods synchronously for shutdown
+    code that runs after the event loop has stopped.
+    """
+
+    sync = None
+
+    async def connect(self):
+        """Open connections and apply the schema. Call once inside the event loop before use."""
+
+    def close(self):
+        """Close every connection."""
+        raise NotImplementedError
+
+    def transaction(self):
+        """
+        Async context manager grouping the calling task's storage calls into one commit:
+        `async with db.transaction(): ...`. Methods called inside join it; nested blocks are
+        savepoints. An exception rolls back the innermost block it escapes.
+        """
+        raise NotImplementedError
+
+    # Server settings
+    async def get_server_settings(self, guild_id: int) -> Dict:
+        """Stored settings, or the defaults. Never writes."""
+        raise NotImplementedError
+
+    async def update_server_setting(self, guild_id: int, setting: str, value) -> Dict:
+        """Upsert one whitelisted setting and return the updated settings."""
+        raise NotImplementedError
+
+    # Custom commands
+    async def add_custom_command(self, guild_id: int, command_name: str, response: str) -> bool:
+        raise NotImplementedError
+
+    async def get_custom_command(self, guild_id: int, command_name: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def get_all_custom_commands(self, guild_id: int) -> List[Dict]:
+        raise NotImplementedError
+
+    async def get_all_custom_command_rows(self) -> List[Dict]:
+        raise NotImplementedError
+
+    async def delete_custom_command(self, guild_id: int, command_name: str) -> bool:
+        raise NotImplementedError
+
+    # Warnings
+    async def add_warning(self, guild_id: int, user_id: int, moderator_id: int, reason: str) -> int:
+        raise NotImplementedError
+
+    async def get_warnings(self, guild_id: int, user_id: int, limit: int = 10, before_id: int = None) -> List[Dict]:
+        """Newest first, paged by id (pass the last id seen as before_id)."""
+        raise NotImplementedError
+
+    async def get_warning_counts(self, guild_id: int, user_id: int, window_hours: List[int] = ()) -> Dict:
+        """{'total': n, 'recent': {hours: n}} from the warning counters, never the warnings table."""
+        raise NotImplementedError
+
+    async def clear_warnings(self, guild_id: int, user_id: int) -> int:
+        raise NotImplementedError
+
+    async def prune_warning_buckets(self, before_hour: int) -> int:
+        raise NotImplementedError
+
+    async def get_warning_expiry_days(self) -> Dict[int, int]:
+        raise NotImplementedError
+
+    async def archive_warnings(self, guild_id: int, before: str, limit: int) -> int:
+        """Move one batch of expired warnings to warnings_archive and off the counters."""
+        raise NotImplementedError
+
+    async def count_warning_rows(self, guild_id: int) -> Dict:
+        """{'active': n, 'archived': n} for a guild."""
+        raise NotImplementedError
+
+    # Mutes
+    async def add_mute(self, guild_id: int, user_id: int, mute_role_id: int, unmute_time: str = None):
+        raise NotImplementedError
+
+    async def remove_mute(self, guild_id: int, user_id: int):
+        raise NotImplementedError
+
+    async def get_mute(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def get_muted_users(self, guild_id: int) -> List[Dict]:
+        raise NotImplementedError
+
+    async def get_timed_mutes(self) -> List[Dict]:
+        raise NotImplementedError
+
+    async def get_unclaimed_mutes(self, now: float) -> List[Dict]:
+        raise NotImplementedError
+
+    # Reaction roles
+    async def add_reaction_role(self, guild_id: int, message_id: int, channel_id: int, emoji: str, role_id: int) -> int:
+        raise NotImplementedError
+
+    async def get_reaction_roles(self, guild_id: int, message_id: int = None) -> List[Dict]:
+        raise NotImplementedError
+
+    async def get_all_reaction_role_rows(self) -> List[Dict]:
+        raise NotImplementedError
+
+    async def remove_reaction_role(self, guild_id: int, message_id: int, emoji: str) -> bool:
+        raise NotImplementedError
+
+    # Leveling
+    async def get_user_level(self, guild_id: int, user_id: int) -> Dict:
+        """Stored level row, or the defaults. Never writes."""
+        raise NotImplementedError
+
+    async def add_xp(self, guild_id: int, user_id: int, xp: int) -> Dict:
+        raise NotImplementedError
+
+    async def save_user_levels(self, rows: List[Dict]):
+        raise NotImplementedError
+
+    async def get_leaderboard(self, guild_id: int, limit: int = 10) -> List[Dict]:
+        raise NotImplementedError
+
+    async def get_all_user_xp(self) -> List[Dict]:
+        raise NotImplementedError
+
+    # AFK
+    async def set_afk(self, guild_id: int, user_id: int, message: str):
+        raise NotImplementedError
+
+    async def remove_afk(self, guild_id: int, user_id: int):
+        raise NotImplementedError
+
+    async def is_afk(self, guild_id: int, user_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def get_all_afk_rows(self) -> List[Dict]:
+        raise NotImplementedError
+
+    # Scheduled announcements
+    async def add_scheduled_announcement(self, guild_id: int, channel_id: int, message: str, interval_minutes: int,
+                                         cron: str = None, next_run: str = None) -> int:
+        raise NotImplementedError
+
+    async def get_due_announcements(self, now: str = None) -> List[Dict]:
+        raise NotImplementedError
+
+    async def update_announcement_next_runs(self, updates: List[Tuple[str, int]]):
+        raise NotImplementedError
+
+    async def get_next_announcement_run(self) -> Optional[str]:
+        raise NotImplementedError
+
+    # Work leases
+    async def claim_leases(self, resources: List[str], owner: str, expires_at: float, now: float) -> List[str]:
+        raise NotImplementedError
+
+    async def renew_leases(self, owner: str, expires_at: float, now: float) -> List[str]:
+        raise NotImplementedError
+
+    async def release_leases(self, owner: str, resources: List[str] = None) -> int:
+        raise NotImplementedError
+
+    async def prune_leases(self, before: float) -> int:
+        raise NotImplementedError
+
+    # Message logs
+    async def add_message_logs(self, rows: List[Dict]):
+        raise NotImplementedError
+
+    async def get_logged_message(self, message_id: int) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def prune_message_logs(self, before: str) -> int:
+        raise NotImplementedError
+
+    # Command sync
+    async def get_command_sync_hashes(self) -> Dict[int, str]:
+        raise NotImplementedError
+
+    async def set_command_sync_hash(self, scope_id: int, command_hash: str):
+        raise NotImplementedError
+
+    # Auto-mod config
+    async def get_automod_config(self, guild_id: int) -> Dict:
+        """Stored config, or the defaults. Never writes."""
+        raise NotImplementedError
+
+    async def update_automod_setting(self, guild_id: int, setting: str, value) -> Dict:
+        """Upsert one whitelisted setting and return the updated config."""
+        raise NotImplementedError
+
+
+def open_storage(url: Optional[str] = None) -> StorageBackend:
+    """
+    Create the backend for a URL (default DATABASE_URL): postgres:// or postgresql:// uses
+    PostgreSQL, sqlite:///path or no URL uses SQLite.
+    """
+    url = url if url is not None else os.getenv('DATABASE_URL', '')
+    if url.startswith(('postgres://', 'postgresql://')):
+        from postgres_storage import PostgresStorage
+        return PostgresStorage(url)
+
+    from database import AsyncDatabase, DB_PATH
+    if url.startswith('sqlite:///'):
+        return AsyncDatabase(url[len('sqlite:///'):])
+    if url:
+        raise ValueError(f"Unsupported DATABASE_URL: {url.split(':', 1)[0]}")
+    return AsyncDatabase(DB_PATH)
@@ -0,0 +1,202 @@
+"""
+Several nodes sharing one SQLite file: each due announcement and each expired mute must be
+handled exactly once, and work held by a node that dies must be taken over after its lease TTL.
+Nodes are wired like bot_advanced: LeaseManager, AnnouncementScheduler and MuteTimers, with
+Discord replaced by callbacks that record what each node did.
+"""
+import asyncio
+from datetime import datetime, timedelta
+
+from announcements import AnnouncementScheduler, announcement_resource
+from cluster import LeaseManager, MuteTimers
+from database import AsyncDatabase
+
+TTL = 0.5
+
+
+class Node:
+    """One bot process. `log` is shared by every node and records (node, kind, id) per action."""
+
+    def __init__(self, name: str, db_path: str, log: list):
+        self.name = name
+        self.log = log
+        self.db = AsyncDatabase(db_path)
+        self.leases = LeaseManager(self.db, node_id=name, ttl=TTL, heartbeat_interval=TTL / 5)
+        self.announcements = AnnouncementScheduler(self.db, self.send, leases=self.leases)
+        self.mutes = MuteTimers(self.db, self.leases, self.unmute)
+        self.guild_available = True
+
+    async def send(self, announcement):
+        await asyncio.sleep(0.01)  # Let other nodes run while we "talk to Discord"
+        self.log.append((self.name, 'announcement', announcement['id']))
+
+    async def unmute(self, guild_id, user_id, mute_role_id):
+        if not self.guild_available:
+            return False
+        await asyncio.sleep(0.01)
+        self.log.append((self.name, 'unmute', (guild_id, user_id)))
+        return True
+
+    def start(self):
+        self.leases.start()
+        self.mutes.start()
+
+    def stop(self):
+        """Stop without releasing any leases, like a crashed process."""
+        self.leases.stop()
+        self.mutes.stop()
+        self.db.close()
+
+
+async def add_due_announcements(db, count: int):
+    past = (datetime.utcnow() - timedelta(minutes=5)).isoformat()
+    return [await db.add_scheduled_announcement(1, 100 + n % 3, f"news {n}", 60, next_run=past)
+            for n in range(count)]
+
+
+async def add_mutes(db, count: int, expires_in: float):
+    unmute_time = (datetime.utcnow() + timedelta(seconds=expires_in)).isoformat()
+    for user_id in range(count):
+        await db.add_mute(1, user_id, 50, unmute_time)
+    return [(1, user_id) for user_id in range(count)]
+
+
+async def run_rounds(nodes, rounds: int, interval: float = 0.05):
+    """Every node checks for due announcements and unowned mutes, concurrently, several times."""
+    for _ in range(rounds):
+        await asyncio.gather(*(node.announcements.run_due() for node in nodes),
+                             *(node.mutes.claim() for node in nodes))
+        await asyncio.sleep(interval)
+
+
+def handled(log, kind):
+    return sorted(item for _, k, item in log if k == kind)
+
+
+def test_each_announcement_and_mute_fires_once(db_path):
+    async def main():
+        log = []
+        nodes = [Node(f"node-{n}", db_path, log) for n in range(3)]
+        try:
+            announcement_ids = await add_due_announcements(nodes[0].db, 12)
+            mutes = await add_mutes(nodes[0].db, 8, expires_in=0.3)
+            for node in nodes:
+                node.start()
+            await run_rounds(nodes, 12)
+
+            assert handled(log, 'announcement') == announcement_ids
+            assert handled(log, 'unmute') == mutes
+            assert await nodes[0].db.get_due_announcements() == []
+            assert await nodes[0].db.get_timed_mutes() == []
+            # Finished work leaves no leases behind
+            rows = await nodes[0].db.read(lambda db: db.conn.execute("SELECT * FROM work_leases").fetchall())
+            assert rows == []
+        finally:
+            for node in nodes:
+                node.stop()
+    asyncio.run(main())
+
+
+def test_killed_node_work_is_taken_over_after_ttl(db_path):
+    async def main():
+        log = []
+        nodes = [Node(f"node-{n}", db_path, log) for n in range(3)]
+        dead, survivors = nodes[0], nodes[1:]
+        try:
+            announcement_ids = await add_due_announcements(dead.db, 6)
+            mutes = await add_mutes(dead.db, 4, expires_in=0.1)
+            for node in nodes:
+                node.start()
+
+            # The first node claims everything, then dies before doing any of it
+            await dead.leases.claim(announcement_resource({'id': a_id}) for a_id in announcement_ids)
+            await dead.mutes.claim()
+            assert len(dead.leases.held) == 10
+            dead.stop()
+            died_at = asyncio.get_running_loop().time()
+
+            # Its leases are still live, so nobody else may touch the work yet
+            await run_rounds(survivors, 3)
+            assert log == []
+
+            await asyncio.sleep(max(0.0, died_at + TTL - asyncio.get_running_loop().time()))
+            await run_rounds(survivors, 10)
+
+            assert handled(log, 'announcement') == announcement_ids
+            assert handled(log, 'unmute') == mutes
+            assert {name for name, _, _ in log} <= {node.name for node in survivors}
+        finally:
+            for node in survivors:
+                node.stop()
+    asyncio.run(main())
+
+
+def test_announcement_lease_released_after_send(db_path):
+    async def main():
+        log = []
+        node = Node("node-0", db_path, log)
+        try:
+            (announcement_id,) = await add_due_announcements(node.db, 1)
+            assert await node.announcements.run_due() == 1
+            assert node.leases.held == set()
+            # Another node can claim it for the next run straight away
+            other = LeaseManager(node.db, node_id="node-1", ttl=TTL)
+            assert await other.claim_one(announcement_resource({'id': announcement_id}))
+        finally:
+            node.stop()
+    asyncio.run(main())
+
+
+def test_stale_schedule_read_does_not_resend(db_path):
+    async def main():
+        log = []
+        first, second = Node("node-0", db_path, log), Node("node-1", db_path, log)
+        try:
+            await add_due_announcements(first.db, 3)
+            # The second node reads the schedule, then stalls until the first has sent and released everything
+            stale = await second.db.get_due_announcements()
+            assert await first.announcements.run_due() == 3
+            fresh = second.db.get_due_announcements
+
+            async def read_stale_once(now=None):
+                second.db.get_due_announcements = fresh
+                return stale
+            second.db.get_due_announcements = read_stale_once
+
+            assert await second.announcements.run_due() == 0
+            assert len(log) == 3
+            assert second.leases.held == set()
+        finally:
+            first.stop()
+            second.stop()
+    asyncio.run(main())
+
+
+def test_mute_lifecycle_on_one_node(db_path):
+    async def main():
+        log = []
+        node = Node("node-0", db_path, log)
+        node.mutes.retry_after = timedelta(seconds=0.1)
+        node.start()
+        try:
+            soon = datetime.utcnow() + timedelta(seconds=0.1)
+            await node.mutes.add(1, 1, 50, soon)
+            await node.mutes.add(1, 2, 50)  # Permanent: no timer, no lease
+            await node.mutes.add(1, 3, 50, soon)
+            await node.mutes.remove(1, 3)  # Lifted by hand before it expired
+            assert node.leases.held == {"mute:1:1"}
+
+            # The guild is unavailable when the mute expires, so it is retried
+            node.guild_available = False
+            await asyncio.sleep(0.2)
+            assert log == [] and await node.db.get_mute(1, 1) is not None
+            node.guild_available = True
+            await asyncio.sleep(0.2)
+
+            assert log == [("node-0", 'unmute', (1, 1))]
+            assert await node.db.get_mute(1, 1) is None
+            assert await node.db.get_mute(1, 2) is not None
+            assert node.leases.held == set()
+        finally:
+            node.stop()
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""XPLedger write-back: rows being flushed must survive eviction and failed writes."""
+import asyncio
+
+import pytest
+
+from leveling import XPLedger
+
+
+class SlowStorage:
+    """Just the user_levels calls the ledger makes. Saves wait for `gate` and can be made to fail."""
+
+    def __init__(self):
+        self.saved = {}
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.fail = False
+
+    async def get_user_level(self, guild_id, user_id):
+        row = self.saved.get((guild_id, user_id))
+        return dict(row) if row else {'guild_id': guild_id, 'user_id': user_id, 'xp': 0, 'level': 1,
+                                      'total_messages': 0}
+
+    async def save_user_levels(self, rows):
+        await self.gate.wait()
+        if self.fail:
+            raise RuntimeError("database is locked")
+        for row in rows:
+            self.saved[(row['guild_id'], row['user_id'])] = dict(row)
+
+
+def test_rows_being_flushed_are_not_evicted():
+    async def main():
+        db = SlowStorage()
+        ledger = XPLedger(db, max_cached=2)
+        await ledger.add_xp(1, 1, 50)
+        db.gate.clear()
+        flush = asyncio.create_task(ledger.flush())
+        await asyncio.sleep(0)
+
+        # Misses while the write is pending would have evicted the row being written
+        await ledger.get(1, 2)
+        await ledger.get(1, 3)
+        assert (1, 1) in ledger.rows
+        assert (await ledger.add_xp(1, 1, 10))['xp'] == 60
+
+        db.gate.set()
+        assert await flush == 1
+        assert not ledger.in_flight
+        await ledger.flush()
+        assert db.saved[(1, 1)]['xp'] == 60
+    asyncio.run(main())
+
+
+def test_failed_flush_is_retried_even_after_cache_pressure():
+    async def main():
+        db = SlowStorage()
+        ledger = XPLedger(db, max_cached=1)
+        await ledger.add_xp(1, 1, 50)
+        db.fail = True
+        with pytest.raises(RuntimeError):
+            await ledger.flush()
+        await ledger.get(1, 2)
+        assert (1, 1) in ledger.rows and (1, 1) in ledger.dirty
+
+        db.fail = False
+        assert await ledger.flush() == 1
+        assert db.saved[(1, 1)]['xp'] == 50
+        assert ledger.dirty == set() and not ledger.in_flight
+    asyncio.run(main())
+
+
+def test_evict_drops_only_clean_rows_oldest_first():
+    async def main():
+        ledger = XPLedger(SlowStorage(), max_cached=3)
+        await ledger.add_xp(1, 1, 10)
+        for user_id in (2, 3, 4, 5):
+            await ledger.get(1, user_id)
+        assert list(ledger.rows) == [(1, 1), (1, 4), (1, 5)]
+    asyncio.run(main())
@@ -0,0 +1,207 @@
+"""Upgrading a database created by the original release (schema version 0) to the current schema."""
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from database import MIGRATIONS, Database, hour_bucket
+
+# The tables as the first release created them, before any migration
+BASELINE_SCHEMA = """
+CREATE TABLE server_settings (
+    guild_id INTEGER PRIMARY KEY,
+    autorole_id INTEGER,
+    log_channel_id INTEGER,
+    suggestion_channel_id INTEGER,
+    welcome_channel_id INTEGER,
+    goodbye_channel_id INTEGER,
+    automod_enabled INTEGER DEFAULT 1,
+    spam_threshold INTEGER DEFAULT 5,
+    profanity_filter INTEGER DEFAULT 1,
+    link_filter INTEGER DEFAULT 0,
+    mass_ping_threshold INTEGER DEFAULT 5
+);
+CREATE TABLE automod_config (
+    guild_id INTEGER PRIMARY KEY,
+    spam_enabled INTEGER DEFAULT 1,
+    profanity_enabled INTEGER DEFAULT 1,
+    links_enabled INTEGER DEFAULT 0,
+    mass_ping_enabled INTEGER DEFAULT 1,
+    spam_threshold INTEGER DEFAULT 5,
+    ping_threshold INTEGER DEFAULT 5,
+    profanity_list TEXT,
+    whitelisted_roles TEXT,
+    whitelisted_channels TEXT
+);
+CREATE TABLE custom_commands (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    command_name TEXT NOT NULL,
+    command_response TEXT NOT NULL,
+    UNIQUE(guild_id, command_name)
+);
+CREATE TABLE warnings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    moderator_id INTEGER NOT NULL,
+    reason TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE TABLE muted_users (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    mute_role_id INTEGER,
+    unmute_time TEXT,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE reaction_roles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    emoji TEXT NOT NULL,
+    role_id INTEGER NOT NULL
+);
+CREATE TABLE user_levels (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    xp INTEGER DEFAULT 0,
+    level INTEGER DEFAULT 1,
+    total_messages INTEGER DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE afk_users (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    afk_message TEXT,
+    afk_since TEXT NOT NULL,
+    PRIMARY KEY (guild_id, user_id)
+);
+CREATE TABLE scheduled_announcements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    interval_minutes INTEGER,
+    next_run TEXT NOT NULL,
+    enabled INTEGER DEFAULT 1
+);
+CREATE TABLE message_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    content TEXT,
+    action TEXT NOT NULL,
+    timestamp TEXT NOT NULL
+);
+"""
+
+BASELINE_ROWS = """
+INSERT INTO server_settings (guild_id, log_channel_id, welcome_channel_id) VALUES (1, 100, 101);
+INSERT INTO automod_config (guild_id, links_enabled, profanity_list) VALUES (1, 1, 'darn,heck');
+INSERT INTO custom_commands (guild_id, command_name, command_response) VALUES (1, 'rules', 'Be nice');
+INSERT INTO warnings (guild_id, user_id, moderator_id, reason, timestamp) VALUES
+    (1, 2, 3, 'spam', '2024-01-01T10:15:00'),
+    (1, 2, 3, 'caps', '2024-01-01T10:45:00'),
+    (1, 4, 3, 'links', '2024-01-02T09:00:00');
+INSERT INTO muted_users (guild_id, user_id, mute_role_id, unmute_time) VALUES (1, 2, 50, '2024-01-01T11:00:00');
+INSERT INTO reaction_roles (guild_id, message_id, channel_id, emoji, role_id) VALUES (1, 500, 100, '👍', 60);
+INSERT INTO user_levels (guild_id, user_id, xp, level, total_messages) VALUES (1, 2, 450, 3, 30);
+INSERT INTO afk_users (guild_id, user_id, afk_message, afk_since) VALUES (1, 4, 'lunch', '2024-01-01T12:00:00');
+INSERT INTO scheduled_announcements (guild_id, channel_id, message, interval_minutes, next_run)
+    VALUES (1, 100, 'Hello', 60, '2024-01-01T12:00:00');
+INSERT INTO message_logs (guild_id, user_id, channel_id, message_id, content, action, timestamp)
+    VALUES (1, 2, 100, 700, 'hi', 'delete', '2024-01-01T12:00:00');
+"""
+
+NEW_INDEXES = [
+    'idx_reaction_roles_message', 'idx_warnings_user', 'idx_user_levels_xp', 'idx_announcements_due',
+    'idx_muted_users_unmute', 'idx_message_logs_message', 'idx_message_logs_timestamp',
+    'idx_work_leases_owner', 'idx_warnings_archive_user', 'idx_warnings_guild_time',
+]
+
+NEW_TABLES = ['command_sync', 'work_leases', 'warning_counts', 'warning_buckets', 'warnings_archive']
+
+NEW_COLUMNS = {
+    'scheduled_announcements': ['cron'],
+    'server_settings': ['disabled_stages', 'xp_cooldown', 'xp_min', 'xp_max', 'xp_channel_multipliers',
+                        'xp_role_multipliers', 'no_xp_channels', 'warn_escalations', 'warn_expiry_days'],
+    'automod_config': ['profanity_word_boundary', 'profanity_leetspeak'],
+}
+
+
+@pytest.fixture
+def upgraded(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.executescript(BASELINE_SCHEMA + BASELINE_ROWS)
+    conn.close()
+    database = Database(db_path)
+    yield database
+    database.close()
+
+
+def names(conn, kind):
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def test_upgrade_sets_version_and_journal_mode(upgraded):
+    assert upgraded.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert upgraded.conn.execute("PRAGMA journal_mode").fetchone()[0] == 'wal'
+
+
+def test_upgrade_adds_indexes_tables_and_columns(upgraded):
+    assert set(NEW_INDEXES) <= names(upgraded.conn, 'index')
+    assert set(NEW_TABLES) <= names(upgraded.conn, 'table')
+    for table, new_columns in NEW_COLUMNS.items():
+        assert set(new_columns) <= columns(upgraded.conn, table), table
+
+
+def test_upgrade_keeps_existing_rows(upgraded):
+    settings = upgraded.get_server_settings(1)
+    assert settings['log_channel_id'] == 100
+    assert settings['welcome_channel_id'] == 101
+    # Existing guilds keep the original flat 10 XP per message with no cooldown
+    assert (settings['xp_cooldown'], settings['xp_min'], settings['xp_max']) == (0, 10, 10)
+
+    automod = upgraded.get_automod_config(1)
+    assert automod['links_enabled'] == 1
+    assert automod['profanity_list'] == 'darn,heck'
+    assert automod['profanity_word_boundary'] == 0
+
+    assert upgraded.get_custom_command(1, 'rules')['command_response'] == 'Be nice'
+    assert [w['reason'] for w in upgraded.get_warnings(1, 2)] == ['caps', 'spam']
+    assert upgraded.get_mute(1, 2)['mute_role_id'] == 50
+    assert upgraded.get_user_level(1, 2)['xp'] == 450
+    assert upgraded.is_afk(1, 4)['afk_message'] == 'lunch'
+    assert upgraded.conn.execute("SELECT cron FROM scheduled_announcements").fetchone()[0] is None
+    assert upgraded.conn.execute("SELECT COUNT(*) FROM message_logs").fetchone()[0] == 1
+    assert upgraded.conn.execute("SELECT COUNT(*) FROM reaction_roles").fetchone()[0] == 1
+
+
+def test_upgrade_backfills_warning_counters(upgraded):
+    counts = dict(upgraded.conn.execute("SELECT user_id, total FROM warning_counts WHERE guild_id = 1"))
+    assert counts == {2: 2, 4: 1}
+    buckets = upgraded.conn.execute(
+        "SELECT hour, count FROM warning_buckets WHERE guild_id = 1 AND user_id = 2").fetchall()
+    assert [tuple(row) for row in buckets] == [(hour_bucket(datetime(2024, 1, 1, 10)), 2)]
+
+
+def test_reopening_an_upgraded_database_is_a_no_op(upgraded, db_path):
+    upgraded.close()
+    reopened = Database(db_path)
+    try:
+        assert reopened.conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+        assert len(reopened.get_warnings(1, 2)) == 2
+        # New guilds get the new XP defaults
+        reopened.update_server_setting(2, 'log_channel_id', 5)
+        settings = reopened.get_server_settings(2)
+        assert (settings['xp_cooldown'], settings['xp_min'], settings['xp_max']) == (60, 15, 25)
+    finally:
+        reopened.close()
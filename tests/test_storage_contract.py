@@ -0,0 +1,182 @@
+"""
+The StorageBackend contract, run against every backend. PostgreSQL runs only when
+TEST_DATABASE_URL points at a scratch database; its tables are emptied before each test.
+"""
+import asyncio
+import os
+
+import pytest
+
+from database import AsyncDatabase
+from postgres_storage import PostgresStorage
+
+PG_TABLES = [
+    'server_settings', 'automod_config', 'custom_commands', 'warnings', 'warning_counts', 'warning_buckets',
+    'warnings_archive', 'muted_users', 'reaction_roles', 'user_levels', 'afk_users', 'scheduled_announcements',
+    'message_logs', 'command_sync', 'work_leases',
+]
+
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def make_storage(request, db_path):
+    """Factory for the backend under test. Backends are built inside the test's event loop."""
+    if request.param == 'sqlite':
+        return lambda: AsyncDatabase(db_path)
+    url = os.environ.get('TEST_DATABASE_URL')
+    if not url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    return lambda: PostgresStorage(url)
+
+
+def run(make_storage, test):
+    """Connect a fresh backend, run `await test(storage)` and close it."""
+    async def main():
+        storage = make_storage()
+        await storage.connect()
+        try:
+            if isinstance(storage, PostgresStorage):
+                await storage.pool.execute(f"TRUNCATE {', '.join(PG_TABLES)} RESTART IDENTITY")
+            await test(storage)
+        finally:
+            storage.close()
+    asyncio.run(main())
+
+
+def test_settings_upserts(make_storage):
+    async def test(db):
+        settings = await db.get_server_settings(1)
+        assert settings['guild_id'] == 1
+        assert settings['log_channel_id'] is None
+        assert settings['xp_cooldown'] == 60
+
+        updated = await db.update_server_setting(1, 'log_channel_id', 100)
+        assert updated['log_channel_id'] == 100
+        updated = await db.update_server_setting(1, 'log_channel_id', 200)
+        assert updated['log_channel_id'] == 200
+        assert updated['xp_cooldown'] == 60
+        assert (await db.get_server_settings(1))['log_channel_id'] == 200
+
+        # Unset IDs read back as None
+        await db.update_server_setting(1, 'welcome_channel_id', 0)
+        assert (await db.get_server_settings(1))['welcome_channel_id'] is None
+
+        with pytest.raises(ValueError):
+            await db.update_server_setting(1, 'guild_id; DROP TABLE warnings', 1)
+
+        automod = await db.update_automod_setting(1, 'profanity_leetspeak', 1)
+        assert automod['profanity_leetspeak'] == 1
+        assert automod['profanity_word_boundary'] == 0
+        assert (await db.get_automod_config(2))['profanity_leetspeak'] == 0
+        with pytest.raises(ValueError):
+            await db.update_automod_setting(1, 'log_channel_id', 1)
+    run(make_storage, test)
+
+
+def test_warning_counters_and_paging(make_storage):
+    async def test(db):
+        ids = [await db.add_warning(1, 2, 3, f"reason {n}") for n in range(5)]
+        await db.add_warning(1, 9, 3, "someone else")
+
+        counts = await db.get_warning_counts(1, 2, [1, 24])
+        assert counts == {'total': 5, 'recent': {1: 5, 24: 5}}
+        assert (await db.get_warning_counts(1, 4))['total'] == 0
+
+        first = await db.get_warnings(1, 2, limit=3)
+        assert [w['id'] for w in first] == ids[:1:-1]
+        rest = await db.get_warnings(1, 2, limit=3, before_id=first[-1]['id'])
+        assert [w['id'] for w in rest] == ids[1::-1]
+
+        assert await db.clear_warnings(1, 2) == 5
+        assert await db.get_warnings(1, 2) == []
+        assert await db.get_warning_counts(1, 2, [24]) == {'total': 0, 'recent': {24: 0}}
+        assert (await db.get_warning_counts(1, 9))['total'] == 1
+    run(make_storage, test)
+
+
+def test_transaction_commits_and_rolls_back(make_storage):
+    async def test(db):
+        async with db.transaction():
+            await db.add_warning(1, 2, 3, "kept")
+            await db.update_server_setting(1, 'xp_cooldown', 30)
+            # Reads inside the block see its own writes
+            assert (await db.get_server_settings(1))['xp_cooldown'] == 30
+
+        with pytest.raises(RuntimeError):
+            async with db.transaction():
+                await db.add_warning(1, 2, 3, "rolled back")
+                raise RuntimeError("boom")
+
+        assert [w['reason'] for w in await db.get_warnings(1, 2)] == ["kept"]
+        assert (await db.get_warning_counts(1, 2))['total'] == 1
+        assert (await db.get_server_settings(1))['xp_cooldown'] == 30
+    run(make_storage, test)
+
+
+def test_savepoint_rolls_back_only_inner_block(make_storage):
+    async def test(db):
+        async with db.transaction():
+            await db.add_warning(1, 2, 3, "outer")
+            with pytest.raises(RuntimeError):
+                async with db.transaction():
+                    await db.add_warning(1, 2, 3, "inner")
+                    raise RuntimeError("boom")
+            await db.add_warning(1, 2, 3, "after")
+
+        assert [w['reason'] for w in await db.get_warnings(1, 2)] == ["after", "outer"]
+        assert (await db.get_warning_counts(1, 2))['total'] == 2
+    run(make_storage, test)
+
+
+def test_leases(make_storage):
+    async def test(db):
+        now = 1000.0
+        assert sorted(await db.claim_leases(['a', 'b'], 'node-1', now + 10, now)) == ['a', 'b']
+        assert await db.claim_leases(['a', 'c'], 'node-2', now + 10, now) == ['c']
+        # The owner can extend its own lease
+        assert await db.claim_leases(['a'], 'node-1', now + 20, now) == ['a']
+
+        assert sorted(await db.renew_leases('node-1', now + 30, now + 5)) == ['a', 'b']
+        assert await db.release_leases('node-1', ['b']) == 1
+        assert await db.claim_leases(['b'], 'node-2', now + 40, now + 6) == ['b']
+
+        # node-1 stops heartbeating; once its lease expires anyone may take it
+        assert await db.claim_leases(['a'], 'node-2', now + 40, now + 29) == []
+        assert await db.claim_leases(['a'], 'node-2', now + 40, now + 31) == ['a']
+        assert await db.renew_leases('node-1', now + 50, now + 31) == []
+
+        assert await db.release_leases('node-2') == 3
+        await db.claim_leases(['x'], 'node-1', now + 1, now)
+        await db.claim_leases(['y'], 'node-1', now + 100, now)
+        assert await db.prune_leases(now + 50) == 1
+        assert await db.renew_leases('node-1', now + 200, now + 50) == ['y']
+    run(make_storage, test)
+
+
+def test_duplicate_custom_command(make_storage):
+    async def test(db):
+        assert await db.add_custom_command(1, "hello", "hi")
+        assert await db.add_custom_command(1, "hello", "hi again") is False
+        assert await db.add_custom_command(2, "hello", "other guild")
+
+        # A failed insert must not leave anything open that breaks the next transaction
+        await db.add_warning(1, 2, 3, "spam")
+        async with db.transaction():
+            await db.add_warning(1, 2, 3, "first")
+            assert await db.add_custom_command(1, "hello", "inside") is False
+            await db.add_warning(1, 2, 3, "second")
+
+        assert (await db.get_custom_command(1, "hello"))['command_response'] == "hi"
+        assert [w['reason'] for w in await db.get_warnings(1, 2)] == ["second", "first", "spam"]
+        assert await db.delete_custom_command(1, "hello")
+        assert await db.get_custom_command(1, "hello") is None
+    run(make_storage, test)
+
+
+def test_add_xp(make_storage):
+    async def test(db):
+        assert await db.add_xp(1, 2, 50) == {'level': 1, 'xp': 50, 'leveled_up': False}
+        assert await db.add_xp(1, 2, 60) == {'level': 2, 'xp': 110, 'leveled_up': True}
+        assert await db.add_xp(1, 2, 10) == {'level': 2, 'xp': 120, 'leveled_up': False}
+        level = await db.get_user_level(1, 2)
+        assert (level['xp'], level['level'], level['total_messages']) == (120, 2, 3)
+    run(make_storage, test)
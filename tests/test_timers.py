@@ -0,0 +1,74 @@
+"""TimerService: deadlines fire in order, and a slow callback doesn't delay the others."""
+import asyncio
+from datetime import datetime, timedelta
+
+from timers import TimerService
+
+
+def test_slow_callback_does_not_delay_later_timers():
+    async def main():
+        fired = {}
+        release = asyncio.Event()
+
+        async def callback(key, payload):
+            fired[key] = asyncio.get_running_loop().time()
+            if key == 'slow':
+                await release.wait()  # e.g. an unmute stuck behind a rate limit
+
+        timers = TimerService("test", callback)
+        timers.start()
+        start = asyncio.get_running_loop().time()
+        now = datetime.utcnow()
+        timers.schedule('slow', now + timedelta(seconds=0.05))
+        timers.schedule('fast', now + timedelta(seconds=0.1))
+        await asyncio.sleep(0.3)
+        try:
+            assert set(fired) == {'slow', 'fast'}
+            assert fired['fast'] - start < 0.25
+        finally:
+            release.set()
+            timers.stop()
+    asyncio.run(main())
+
+
+def test_cancel_and_reschedule():
+    async def main():
+        fired = []
+
+        async def callback(key, payload):
+            fired.append((key, payload))
+
+        timers = TimerService("test", callback)
+        timers.start()
+        now = datetime.utcnow()
+        timers.schedule('a', now + timedelta(seconds=0.05), 1)
+        timers.schedule('b', now + timedelta(seconds=0.05), 1)
+        timers.schedule('a', now + timedelta(seconds=0.1), 2)  # Replaces the first 'a'
+        assert timers.cancel('b')
+        await asyncio.sleep(0.2)
+        timers.stop()
+        assert fired == [('a', 2)]
+    asyncio.run(main())
+
+
+def test_stop_cancels_running_callbacks():
+    async def main():
+        started = asyncio.Event()
+        cancelled = []
+
+        async def callback(key, payload):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(key)
+                raise
+
+        timers = TimerService("test", callback)
+        timers.start()
+        timers.schedule('a', datetime.utcnow())
+        await asyncio.wait_for(started.wait(), 1)
+        timers.stop()
+        await asyncio.sleep(0)
+        assert cancelled == ['a']
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+"""Database.transaction() and the methods that join it."""
+import asyncio
+
+import pytest
+
+from database import AsyncDatabase
+
+
+def test_duplicate_custom_command_leaves_no_open_transaction(db):
+    assert db.add_custom_command(1, "hello", "hi")
+    assert not db.add_custom_command(1, "hello", "hi again")
+    assert not db.conn.in_transaction
+
+    # These open their own transaction and used to fail with "cannot start a transaction within a transaction"
+    warning_id = db.add_warning(1, 2, 3, "spam")
+    assert db.get_warnings(1, 2)[0]['id'] == warning_id
+    with db.transaction():
+        db.add_mute(1, 2, 4)
+    assert db.get_mute(1, 2) is not None
+
+
+def test_duplicate_custom_command_inside_transaction_keeps_earlier_writes(db):
+    with db.transaction():
+        db.add_warning(1, 2, 3, "first")
+        assert db.add_custom_command(1, "x", "a")
+        assert db.add_custom_command(1, "x", "b") is False
+        db.add_warning(1, 2, 3, "second")
+    assert [w['reason'] for w in db.get_warnings(1, 2)] == ["second", "first"]
+    assert db.get_custom_command(1, "x")['command_response'] == "a"
+
+
+def test_begin_rolls_back_a_stray_implicit_transaction(db, capsys):
+    db.conn.execute("INSERT INTO afk_users (guild_id, user_id, afk_message, afk_since) VALUES (1, 2, 'brb', 'now')")
+    assert db.conn.in_transaction
+    with db.transaction():
+        db.add_warning(1, 2, 3, "spam")
+    # The half-done write is dropped (and reported), the transaction's own write is kept
+    assert db.is_afk(1, 2) is None
+    assert "Rolling back an unfinished database transaction" in capsys.readouterr().out
+    assert db.get_warnings(1, 2)[0]['reason'] == "spam"
+
+
+def test_savepoint_rolls_back_only_inner_block(db):
+    with db.transaction():
+        db.add_warning(1, 2, 3, "kept")
+        with pytest.raises(KeyError):
+            with db.transaction():
+                db.add_warning(1, 2, 3, "undone")
+                raise KeyError
+    assert [w['reason'] for w in db.get_warnings(1, 2)] == ["kept"]
+    assert db.get_warning_counts(1, 2)['total'] == 1
+    assert db.transaction_depth == 0
+
+
+def test_async_duplicate_custom_command_then_transaction(db_path):
+    async def scenario():
+        storage = AsyncDatabase(db_path)
+        try:
+            assert await storage.add_custom_command(1, "hello", "hi")
+            assert not await storage.add_custom_command(1, "hello", "hi")
+            async with storage.transaction():
+                await storage.add_warning(1, 2, 3, "spam")
+                counts = await storage.get_warning_counts(1, 2)
+            assert counts['total'] == 1
+        finally:
+            storage.close()
+
+    asyncio.run(scenario())
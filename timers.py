@@ -0,0 +1,88 @@
+"""
+Heap-based timer service.
+Sleeps until the earliest deadline instead of polling, and supports cancelling and replacing timers by key.
+Each callback runs in its own task, so a slow one doesn't hold up the timers due after it.
+"""
+import asyncio
+import heapq
+import itertools
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+
+class TimerService:
+    """Fires an async callback for each key when its deadline (naive UTC datetime) passes."""
+
+    def __init__(self, name: str, callback: Callable[[Hashable, Any], Awaitable[None]]):
+        self.name = name
+        self.callback = callback
+        self.heap: List[Tuple[datetime, int, Hashable, Any]] = []
+        self.timers: Dict[Hashable, int] = {}  # key -> sequence number of its live heap entry
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()  # Callbacks still in progress
+
+    def schedule(self, key: Hashable, deadline: datetime, payload: Any = None):
+        """Schedule (or reschedule) the timer for a key."""
+        seq = next(self._seq)
+        self.timers[key] = seq
+        heapq.heappush(self.heap, (deadline, seq, key, payload))
+        if self._wakeup and self.heap[0][1] == seq:
+            self._wakeup.set()  # New earliest deadline
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancel a key's timer. The heap entry is dropped lazily."""
+        return self.timers.pop(key, None) is not None
+
+    def next_deadline(self) -> Optional[datetime]:
+        """Get the earliest live deadline."""
+        self._discard_cancelled()
+        return self.heap[0][0] if self.heap else None
+
+    def start(self):
+        """Start the timer loop (does nothing if it is already running)."""
+        if self._task and not self._task.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """Stop the timer loop and any callbacks still running."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        for task in self._running:
+            task.cancel()
+
+    def _discard_cancelled(self):
+        while self.heap and self.timers.get(self.heap[0][2]) != self.heap[0][1]:
+            heapq.heappop(self.heap)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            deadline = self.next_deadline()
+            if deadline is None:
+                await self._wakeup.wait()
+                continue
+
+            delay = (deadline - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, _, key, payload = heapq.heappop(self.heap)
+            del self.timers[key]
+            task = asyncio.create_task(self._fire(key, payload))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _fire(self, key: Hashable, payload: Any):
+        try:
+            await self.callback(key, payload)
+        except Exception as e:
+            print(f"Error in {self.name} timer for {key}: {e}")